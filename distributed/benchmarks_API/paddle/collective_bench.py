@@ -0,0 +1,345 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+"""
+collective_bench.py
+集合通信 api × dtype × 消息大小 扫描测试, 单进程组内完成预热与重复执行, 计算 algbw/busbw,
+结果保存为 json(安装 pandas 时可保存为 parquet), 并按基线索引对比回退
+python collective_bench.py --sweep sweep.yaml --output mylog/collective.json --baseline collective_base.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import yaml
+
+import paddle
+import paddle.distributed as dist
+
+
+# 各通信后端不支持的api, 扫描时跳过
+BACKEND_UNSUPPORTED = {"gloo": ("reduce_scatter", "alltoall")}
+
+
+def bus_factor(api, nranks):
+    """
+    busbw = algbw * factor, 与 nccl-tests 口径一致
+    """
+    if nranks <= 1:
+        return 1.0
+    if api == "all_reduce":
+        return 2.0 * (nranks - 1) / nranks
+    if api in ("all_gather", "reduce_scatter", "alltoall", "scatter"):
+        return float(nranks - 1) / nranks
+    return 1.0
+
+
+def sweep_sizes(sizes):
+    """
+    消息大小列表
+    """
+    if isinstance(sizes, list):
+        return sizes
+    res = []
+    b = sizes["begin"]
+    while b <= sizes["end"]:
+        res.append(b)
+        b *= sizes.get("factor", 2)
+    return res
+
+
+def size_name(b):
+    """
+    1024 -> 1KB, 与 run.py 的命名一致
+    """
+    if b < 1048576:  # 1MB
+        return str(b // 1024) + "KB"
+    return str(b // 1024 // 1024) + "MB"
+
+
+def record_key(api, dtype, nbytes, nranks, backend):
+    """
+    结果与基线的索引key
+    """
+    return "{}|{}|{}|{}|{}".format(api, dtype, nbytes, nranks, backend)
+
+
+class CollectiveCase(object):
+    """
+    单个 api/dtype/消息大小 的输入与调用, nbytes 口径同 nccl-tests:
+    all_reduce/broadcast/reduce/send_recv 为单卡buffer大小, all_gather 为输出总大小,
+    reduce_scatter/alltoall/scatter 为输入总大小
+    """
+
+    def __init__(self, api, dtype, nbytes, rank, nranks):
+        self.api = api
+        self.rank = rank
+        self.nranks = nranks
+        elem_size = paddle.to_tensor([], dtype=dtype).element_size()
+        n_ele = max(nbytes // elem_size // nranks, 1)
+        self.nbytes = n_ele * nranks * elem_size
+        if api in ("all_reduce", "broadcast", "reduce", "send_recv"):
+            n_ele *= nranks
+            self.nbytes = n_ele * elem_size
+        self.data = paddle.ones([n_ele], dtype=dtype)
+        self.data_list = []
+        if api in ("reduce_scatter", "alltoall", "scatter"):
+            self.data_list = [paddle.ones([n_ele], dtype=dtype) for _ in range(nranks)]
+        self.out_list = []
+
+    def __call__(self):
+        api = self.api
+        if api == "all_reduce":
+            dist.all_reduce(self.data)
+        elif api == "broadcast":
+            dist.broadcast(self.data, src=0)
+        elif api == "reduce":
+            dist.reduce(self.data, dst=0)
+        elif api == "all_gather":
+            self.out_list = []
+            dist.all_gather(self.out_list, self.data)
+        elif api == "reduce_scatter":
+            dist.reduce_scatter(self.data, self.data_list)
+        elif api == "alltoall":
+            self.out_list = []
+            dist.alltoall(out_tensor_list=self.out_list, in_tensor_list=self.data_list)
+        elif api == "scatter":
+            dist.scatter(self.data, self.data_list if self.rank == 0 else None, src=0)
+        elif api == "send_recv":
+            # 偶数卡发送, 奇数卡接收
+            peer = self.rank ^ 1
+            if peer >= self.nranks:
+                return
+            if self.rank % 2 == 0:
+                dist.send(self.data, dst=peer)
+            else:
+                dist.recv(self.data, src=peer)
+        else:
+            raise ValueError("unsupported api: {}".format(api))
+
+
+def _sync(backend):
+    """
+    等待设备计算完成, gloo 下通信为同步执行
+    """
+    if backend != "gloo":
+        paddle.device.cuda.synchronize()
+
+
+def _max_over_ranks(value):
+    """
+    各卡耗时取最大值
+    """
+    t = paddle.to_tensor([value], dtype="float64")
+    dist.all_reduce(t, op=dist.ReduceOp.MAX)
+    return float(t.numpy()[0])
+
+
+def _any_failed(failed):
+    """
+    失败标记在各卡间取最大值, 任一卡失败时所有卡一致跳过, 避免其余卡阻塞在后续通信中
+    """
+    return _max_over_ranks(1.0 if failed else 0.0) > 0
+
+
+def _run_case(case, backend, warmup, iters):
+    """
+    预热后重复执行, 返回本卡平均耗时
+    """
+    for _ in range(warmup):
+        case()
+    _sync(backend)
+    dist.barrier()
+    start = time.perf_counter()
+    for _ in range(iters):
+        case()
+    _sync(backend)
+    return (time.perf_counter() - start) / iters
+
+
+def bench_worker(sweep, output):
+    """
+    每个进程执行全部扫描, 0号卡写出结果
+    """
+    backend = sweep.get("backend", "gloo")
+    if backend == "gloo":
+        paddle.set_device("cpu")
+    dist.init_parallel_env()
+    rank = dist.get_rank()
+    nranks = dist.get_world_size()
+    warmup = sweep.get("warmup", 5)
+    iters = sweep.get("iters", 20)
+
+    records = []
+    for api in sweep["apis"]:
+        for dtype in sweep.get("dtypes", ["float32"]):
+            for nbytes in sweep_sizes(sweep["sizes"]):
+                record = {"api": api, "dtype": dtype, "nranks": nranks, "backend": backend}
+                if api in BACKEND_UNSUPPORTED.get(backend, ()):
+                    record.update(
+                        {"bytes": nbytes, "size": size_name(nbytes), "status": "skip: not supported by " + backend}
+                    )
+                    records.append(record)
+                    if rank == 0:
+                        print(record)
+                    continue
+                # 构造输入与执行两个阶段分别在各卡间确认是否失败, 确认点之前本卡不再发起通信
+                error = None
+                try:
+                    case = CollectiveCase(api, dtype, nbytes, rank, nranks)
+                except Exception as e:
+                    error = "error: {}".format(e)
+                if not _any_failed(error is not None):
+                    try:
+                        cost = _run_case(case, backend, warmup, iters)
+                    except Exception as e:
+                        error = "error: {}".format(e)
+                    failed = _any_failed(error is not None)
+                else:
+                    failed = True
+                if failed:
+                    status = error or "error: failed on other rank"
+                    record.update({"bytes": nbytes, "size": size_name(nbytes), "status": status})
+                else:
+                    cost = _max_over_ranks(cost)
+                    algbw = case.nbytes / 1_000_000_000 / cost
+                    record.update(
+                        {
+                            "bytes": case.nbytes,
+                            "size": size_name(case.nbytes),
+                            "time": cost,
+                            "algbw": algbw,
+                            "busbw": algbw * bus_factor(api, nranks),
+                            "status": "ok",
+                        }
+                    )
+                records.append(record)
+                if rank == 0:
+                    print(record)
+                    sys.stdout.flush()
+
+    if rank == 0:
+        ResultStore.save(records, output)
+
+
+class ResultStore(object):
+    """
+    结果保存与基线索引
+    """
+
+    @staticmethod
+    def save(records, path):
+        """
+        保存结果, .parquet 后缀需安装 pandas(pyarrow), 否则保存为json
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if path.endswith(".parquet"):
+            try:
+                import pandas as pd
+
+                pd.DataFrame(records).to_parquet(path, index=False)
+                return path
+            except ImportError:
+                path = path[: -len(".parquet")] + ".json"
+        with open(path, "w", encoding="utf8") as f:
+            json.dump(records, f, indent=1)
+        return path
+
+    @staticmethod
+    def load(path):
+        """
+        读取结果
+        """
+        if path.endswith(".parquet"):
+            import pandas as pd
+
+            return pd.read_parquet(path).to_dict("records")
+        with open(path, encoding="utf8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def index(records):
+        """
+        基线索引, 按 api|dtype|bytes|nranks|backend O(1) 查找
+        """
+        return {
+            record_key(r["api"], r["dtype"], r["bytes"], r["nranks"], r["backend"]): r
+            for r in records
+            if r.get("status") == "ok"
+        }
+
+
+def compare(records, baseline, threshold=5):
+    """
+    与基线对比, 耗时增加或 busbw 下降超过 threshold% 记为回退
+    return: (diff list, 回退list)
+    """
+    diffs = []
+    regressions = []
+    for r in records:
+        if r.get("status") != "ok":
+            continue
+        base = baseline.get(record_key(r["api"], r["dtype"], r["bytes"], r["nranks"], r["backend"]))
+        if base is None:
+            continue
+        diff = dict(r)
+        diff["time_base"] = base["time"]
+        diff["busbw_base"] = base["busbw"]
+        diff["time_diff"] = round((r["time"] - base["time"]) / base["time"] * 100, 2)
+        diff["busbw_diff"] = round((r["busbw"] - base["busbw"]) / base["busbw"] * 100, 2)
+        diffs.append(diff)
+        if diff["time_diff"] > threshold or diff["busbw_diff"] < -threshold:
+            regressions.append(diff)
+    return diffs, regressions
+
+
+def main():
+    """main"""
+    parser = argparse.ArgumentParser(description="collective benchmark sweep")
+    parser.add_argument("--sweep", default="sweep.yaml", help="扫描配置")
+    parser.add_argument("--output", default="mylog/collective.json", help="结果文件, .json/.parquet")
+    parser.add_argument("--baseline", default=None, help="基线结果文件")
+    parser.add_argument("--update_baseline", action="store_true", help="用本次结果覆盖基线")
+    parser.add_argument("--nprocs", type=int, default=None, help="进程数, 覆盖扫描配置")
+    parser.add_argument("--backend", default=None, help="gloo/nccl, 覆盖扫描配置")
+    args = parser.parse_args()
+
+    with open(args.sweep, "rb") as f:
+        sweep = yaml.load(f, Loader=yaml.FullLoader)
+    if args.nprocs:
+        sweep["nprocs"] = args.nprocs
+    if args.backend:
+        sweep["backend"] = args.backend
+
+    output = args.output
+    dist.spawn(bench_worker, args=(sweep, output), nprocs=sweep.get("nprocs", 2), backend=sweep.get("backend", "gloo"))
+    if not os.path.exists(output):
+        # 无 pandas/pyarrow 时 parquet 回退为json
+        output = os.path.splitext(output)[0] + ".json"
+    records = ResultStore.load(output)
+
+    if args.baseline is None:
+        return 0
+    if args.update_baseline or not os.path.exists(args.baseline):
+        ResultStore.save(records, args.baseline)
+        print("baseline saved: {}".format(args.baseline))
+        return 0
+    diffs, regressions = compare(records, ResultStore.index(ResultStore.load(args.baseline)), sweep.get("threshold", 5))
+    for diff in diffs:
+        print(
+            "{api} {dtype} {size}: time {time:.6f}s ({time_diff}%), busbw {busbw:.3f}GB/s ({busbw_diff}%)".format(
+                **diff
+            )
+        )
+    if regressions:
+        print("============================= regression ================================")
+        for diff in regressions:
+            print(diff)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,24 +6,48 @@
 二分工具
 """
 import os
-import ast
 import sys
+import json
+import shutil
 import argparse
 import subprocess
-import requests
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 from layertest import LayerTest
-from strategy.compare import perf_compare
 from pltools.logger import Logger
 from pltools.res_save import save_pickle
+from pltools.bisect_store import WheelStore, ProbeStore, perm_test
+
+# 性能二分中在独立进程内执行单次性能测试, 结果以json打印到stdout
+PERF_PROBE = """
+import sys
+import json
+from layertest import LayerTest
+
+res_dict, exc = LayerTest(title=sys.argv[1], layerfile=sys.argv[2], testing=sys.argv[3])._perf_case_run()
+print("PLT_BS_PERF " + json.dumps({"res": res_dict, "exc": exc}, default=str))
+"""
 
 
 class BinarySearch(object):
     """
     性能/精度通用二分定位工具
+    每轮在候选区间内选取k个commit并行测试(PLT_BS_DEVICES 每张卡一个), 安装包按commit缓存并解压到独立目录,
+    测试结果保存在 PLT_BS_STORE 中供多次二分复用
     """
 
-    def __init__(self, good_commit, bad_commit, layerfile, testing, loop_num=1, perf_decay=None, test_obj=LayerTest):
+    def __init__(
+        self,
+        good_commit,
+        bad_commit,
+        layerfile,
+        testing,
+        loop_num=1,
+        perf_decay=None,
+        test_obj=LayerTest,
+        commit_list=None,
+    ):
         """
         初始化
         good_commit: pass的commit
@@ -31,25 +55,30 @@ class BinarySearch(object):
         layerfile: 子图路径, 例如./layercase/sublayer1000/Det_cases/ppyolo_ppyolov2_r50vd_dcn_365e_coco/SIR_76.py
         testing: 测试yaml路径, 例如 yaml/dy^dy2stcinn_eval_benchmark.yml
         perf_decay: 仅用于性能, 某个engine名称+预期耗时+性能下降比例, 组成的list, 例如["dy2st_eval_cinn_perf", 0.0635672, -0.3]
+            二分时以good/bad commit多次测试的耗时为参照做显著性检验, 预期耗时与下降比例仅用于日志
+        commit_list: 由新到旧的候选commit列表(不含good_commit), 为None时从Paddle仓库git log获取
 
         """
         self.logger = Logger("PLT二分定位")
 
         self.cur_path = os.getcwd()
-        if not os.path.exists("Paddle-develop"):
-            os.system(
-                "wget -q https://xly-devops.bj.bcebos.com/PaddleTest/Paddle/Paddle-develop.tar.gz \
-                && tar -xzf Paddle-develop.tar.gz"
-            )
-        else:
-            os.system("cd Paddle-develop && git pull")
+        if commit_list is None:
+            if not os.path.exists("Paddle-develop"):
+                os.system(
+                    "wget -q https://xly-devops.bj.bcebos.com/PaddleTest/Paddle/Paddle-develop.tar.gz \
+                    && tar -xzf Paddle-develop.tar.gz"
+                )
+            else:
+                os.system("cd Paddle-develop && git pull")
+        self.commit_list = commit_list
 
         self.good_commit = good_commit
         self.bad_commit = bad_commit
-        self.whl_link_template = (
+        self.whl_link_template = os.environ.get(
+            "PLT_WHL_TEMPLATE",
             "https://paddle-qa.bj.bcebos.com/paddle-pipeline/"
             "Develop-GpuSome-LinuxCentos-Gcc82-Cuda118-Cudnn86-Trt85-Py310-CINN-Compile/{}/paddle"
-            "paddle_gpu-0.0.0-cp310-cp310-linux_x86_64.whl"
+            "paddle_gpu-0.0.0-cp310-cp310-linux_x86_64.whl",
         )
         self.whl = "paddlepaddle_gpu-0.0.0-cp310-cp310-linux_x86_64.whl"
 
@@ -59,17 +88,31 @@ class BinarySearch(object):
         self.loop_num = loop_num
         self.perf_decay = perf_decay
         self.test_obj = test_obj
-        self.py_cmd = os.environ.get("python_ver")
+        self.py_cmd = os.environ.get("python_ver", sys.executable)
         self.testing_mode = os.environ.get("TESTING_MODE")
         if self.testing_mode == "precision":
-            self.bs_debug = self._precision_debug
-        elif self.testing_mode == "precision":
-            self.bs_debug = self._performance_debug
+            self.bs_measure = self._precision_measure
+            self.bs_judge = self._precision_judge
+            self.mode_key = self.testing_mode
+        elif self.testing_mode == "performance":
+            if not self.perf_decay:
+                raise ValueError("performance binary search requires perf_decay, e.g. [engine, baseline, decay]")
+            self.bs_measure = self._performance_measure
+            self.bs_judge = self._performance_judge
+            self.mode_key = "{}:{}".format(self.testing_mode, self.perf_decay[0])
         else:
             raise ValueError("TESTING_MODE must be either precision or performance")
         self.device_place_id = 0
         self.timeout = 300
 
+        # 并行测试的卡, 每张卡同一时刻只执行一个commit
+        self.devices = os.environ.get("PLT_BS_DEVICES", "0").split(",")
+        self.workers = int(os.environ.get("PLT_BS_WORKERS", len(self.devices)))
+        self.perf_repeat = int(os.environ.get("PLT_BS_PERF_REPEAT", "5"))
+        self.alpha = float(os.environ.get("PLT_BS_ALPHA", "0.05"))
+        self.wheel_store = WheelStore(self.whl_link_template, self.whl, py_cmd=self.py_cmd)
+        self.probe_store = ProbeStore()
+
     def _get_commits(self):
         """
         get all the commits in search interval
@@ -77,6 +120,8 @@ class BinarySearch(object):
 
         self.logger.get_log().info(f"good_commit: {self.good_commit}")
         self.logger.get_log().info(f"bad_commit: {self.bad_commit}")
+        if self.commit_list is not None:
+            return list(self.commit_list)
 
         os.chdir(os.path.join(self.cur_path, "Paddle-develop"))
         cmd = "git log {}..{} --pretty=oneline".format(self.good_commit, self.bad_commit)
@@ -93,42 +138,17 @@ class BinarySearch(object):
             commit_list.append(commit)
         return commit_list
 
-    def _check_downloadable(self, url):
-        """
-        # 发送 HEAD 请求，检查响应头信息
-        """
-        try:
-            # 发送 HEAD 请求，检查响应头信息
-            self.logger.get_log().info(f"Checking if the file is downloadable: {url}")
-            response = requests.head(url, allow_redirects=True)
-            if response.status_code == 200:
-                # 获取文件大小
-                file_size = response.headers.get("Content-Length", None)
-                if file_size:
-                    self.logger.get_log().info(f"File size: {int(file_size) / (1024 * 1024):.2f} MB")
-                else:
-                    self.logger.get_log().error("File size could not be determined.")
-                return True
-            else:
-                self.logger.get_log().error(f"Failed to access the file. Status code: {response.status_code}")
-                return False
-        except Exception as e:
-            self.logger.get_log().error(f"An error occurred: {e}")
-            return False
-
     def _check_package_available(self, commit_list):
         """
-        检查全部包是否存在
+        并行检查全部包是否存在
         """
-        available_commits = []
-        available_commits_dict = {}
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            available = list(pool.map(self.wheel_store.available, commit_list))
+        available_commits_dict = dict(zip(commit_list, available))
+        available_commits = [commit for commit in commit_list if available_commits_dict[commit]]
         for commit in commit_list:
-            if not self._check_downloadable(self.whl_link_template.replace("{}", commit)):
+            if not available_commits_dict[commit]:
                 self.logger.get_log().info(f"===> 【{commit}】安装包不存在 <===")
-                available_commits_dict[commit] = False
-            else:
-                available_commits_dict[commit] = True
-                available_commits.append(commit)
         if len(available_commits) < len(commit_list):
             self.logger.get_log().warning("===> 部分commit list的安装包不可用, 使用现有可用包Commit列表, 结果仅供参考。 <===")
             self.logger.get_log().info("===> 检查相关commit list的安装包可用情况如下: <===")
@@ -138,117 +158,191 @@ class BinarySearch(object):
             self.logger.get_log().info("===> 相关commit list的安装包全部可用 <===")
         return available_commits
 
-    def _status_print(self, exit_code, status_str):
+    def _probe_env(self, commit_id, device):
         """
-        状态打印
+        commit 测试进程的环境变量: 安装目录优先于环境中已安装的paddle, 并绑定单卡
         """
-        if exit_code == 0:
-            self.logger.get_log().info(f"{status_str} successfully")
-        else:
-            self.logger.get_log().error(f"{status_str} failed")
-            sys.exit(-1)
+        env = dict(os.environ)
+        site = self.wheel_store.target(commit_id)
+        env["PYTHONPATH"] = os.pathsep.join([site, self.cur_path] + [p for p in [env.get("PYTHONPATH")] if p])
+        env["CUDA_VISIBLE_DEVICES"] = device
+        return env
 
-    def _install_paddle(self, commit_id):
+    def _key(self, commit_id):
         """
-        安装 paddle
+        测试结果key
         """
-        exit_code = os.system(f"{self.py_cmd} -m pip uninstall paddlepaddle-gpu -y")
-        self._status_print(exit_code=exit_code, status_str="uninstall paddlepaddle-gpu")
-
-        whl_link = self.whl_link_template.replace("{}", commit_id)
+        return ProbeStore.key(self.layerfile, self.testing, self.mode_key, commit_id)
 
-        # exit_code = os.system(f"{self.py_cmd} -m pip install {whl_link}")
-        exit_code = os.system(f"rm -rf {self.whl} && wget -q {whl_link} && {self.py_cmd} -m pip install {self.whl}")
-        self._status_print(exit_code=exit_code, status_str="install paddlepaddle-gpu")
-        self.logger.get_log().info("commit {} install done".format(commit_id))
-        return 0
+    def _precision_once(self, commit_id, device):
+        """
+        单次精度测试, 每个commit使用独立的pytest入口文件
+        :return: 用例通过为True, 失败为False, pytest本身执行异常(中断/内部错误/未收集到用例等)为None
+        """
+        probe_file = "{}^{}.py".format(self.title, commit_id[:12])
+        shutil.copy(os.path.join(self.cur_path, "PaddleLT.py"), os.path.join(self.cur_path, probe_file))
+        try:
+            exit_code = subprocess.call(
+                [
+                    self.py_cmd,
+                    "-m",
+                    "pytest",
+                    probe_file,
+                    f"--title={self.title}",
+                    f"--layerfile={self.layerfile}",
+                    f"--testing={self.testing}",
+                    f"--device_place_id={self.device_place_id}",
+                    f"--timeout={self.timeout}",
+                ],
+                cwd=self.cur_path,
+                env=self._probe_env(commit_id, device),
+            )
+        finally:
+            os.remove(os.path.join(self.cur_path, probe_file))
+        if exit_code not in (0, 1):
+            self.logger.get_log().warning(f"commit {commit_id} 精度测试执行异常, pytest exit code: {exit_code}")
+            return None
+        return exit_code == 0
+
+    def _store(self, key, new_samples):
+        """
+        只保存成功执行的测试结果, 执行异常的结果只用于本次判断
+        """
+        done = [v for v in new_samples if v is not None]
+        if done:
+            self.probe_store.extend(key, done)
 
-    def _precision_debug(self, commit_id):
+    def _precision_measure(self, commit_id, device, fresh=False):
         """
-        精度debug
+        精度测试, 补齐loop_num次结果
+        :param fresh: True时忽略已有结果, 重新测试loop_num次
+        :return: 本commit用于判断的结果list
         """
-        # exc = 0
-        # try:
-        #     self.test_obj(title=self.title, layerfile=self.layerfile, testing=self.testing)._case_run()
-        # except Exception:
-        #     exc += 1
+        key = self._key(commit_id)
+        samples = [] if fresh else self.probe_store.get(key)[: self.loop_num]
+        new_samples = [self._precision_once(commit_id, device) for _ in range(self.loop_num - len(samples))]
+        self._store(key, new_samples)
+        return samples + new_samples
 
-        if os.path.exists(f"{self.title}.py"):
-            os.system(f"rm {self.title}.py")
+    def _precision_judge(self, commit_id, samples):
+        """
+        精度判断, 全部通过为pass, 执行异常(None)视为fail
+        """
+        return all(samples)
 
-        exit_code_all = 0
-        for step in range(self.loop_num):
-            exit_code = os.system(
-                f"cp -r PaddleLT.py {self.title}.py && "
-                f"{self.py_cmd} -m pytest {self.title}.py --title={self.title} "
-                f"--layerfile={self.layerfile} --testing={self.testing} "
-                f"--device_place_id={self.device_place_id} --timeout={self.timeout}"
-            )
-            exit_code_all += exit_code
+    def _perf_once(self, commit_id, device):
+        """
+        单次性能测试, 执行器异常时返回None
+        """
+        out = subprocess.run(
+            [self.py_cmd, "-c", PERF_PROBE, self.title, self.layerfile, self.testing],
+            cwd=self.cur_path,
+            env=self._probe_env(commit_id, device),
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        ).stdout
+        for line in out.splitlines()[::-1]:
+            if line.startswith("PLT_BS_PERF "):
+                res = json.loads(line[len("PLT_BS_PERF ") :])
+                value = res["res"].get(self.perf_decay[0])
+                if res["exc"] == 0 and isinstance(value, (int, float)):
+                    return float(value)
+                break
+        self.logger.get_log().warning(f"commit {commit_id} 性能测试异常")
+        return None
+
+    def _performance_measure(self, commit_id, device, fresh=False):
+        """
+        性能测试, 补齐perf_repeat次耗时
+        """
+        key = self._key(commit_id)
+        samples = [] if fresh else self.probe_store.get(key)[: self.perf_repeat]
+        new_samples = [self._perf_once(commit_id, device) for _ in range(self.perf_repeat - len(samples))]
+        self._store(key, new_samples)
+        return samples + new_samples
 
-        if exit_code_all > 0:
-            self.logger.get_log().info(f"{self.testing_mode}执行失败commit: {commit_id}")
+    def _performance_judge(self, commit_id, samples):
+        """
+        性能判断: 相对good_commit显著变慢(单侧置换检验 p<alpha) 且均值更接近bad_commit时为fail
+        good_commit 为参照本身, 无异常即pass; bad_commit 需相对good_commit显著变慢
+        """
+        if any(v is None for v in samples):
+            self.logger.get_log().info(f"{self.testing_mode}执行异常commit: {commit_id}")
             return False
-        else:
-            self.logger.get_log().info(f"{self.testing_mode}执行成功commit: {commit_id}")
+        if commit_id == self.good_commit:
             return True
+        good = self._performance_measure(self.good_commit, self.devices[0])
+        if any(v is None for v in good):
+            return False
+        p_value = perm_test(samples, good)
+        mean, good_mean = np.mean(samples), np.mean(good)
+        if commit_id == self.bad_commit:
+            self.logger.get_log().info(f"bad commit 耗时均值 {mean:.6f}, good {good_mean:.6f}, p={p_value:.4f}")
+            return p_value >= self.alpha
+        bad_mean = np.mean(self._performance_measure(self.bad_commit, self.devices[0]))
+        self.logger.get_log().info(
+            f"commit {commit_id} 耗时均值 {mean:.6f}, good {good_mean:.6f}, bad {bad_mean:.6f}, p={p_value:.4f}, "
+            f"预期 {self.perf_decay[1:]}"
+        )
+        return not (p_value < self.alpha and abs(mean - bad_mean) < abs(mean - good_mean))
 
-    def _performance_debug(self, commit_id):
+    def bs_debug(self, commit_id, device=None, fresh=False):
         """
-        性能debug
+        测试并判断commit是否pass
         """
-        res_dict, exc = self.test_obj(title=self.title, layerfile=self.layerfile, testing=self.testing)._perf_case_run()
-        latest = res_dict[self.perf_decay[0]]
-        baseline = self.perf_decay[1]
-        decay_rate = self.perf_decay[2]
-
-        compare_res = perf_compare(baseline, latest)
-        fluctuate_rate = 0.15
-        if exc > 0 or compare_res < decay_rate - fluctuate_rate:
-            self.logger.get_log().info(f"{self.testing_mode}执行失败commit: {commit_id}")
-            return False
-        else:
+        samples = self.bs_measure(commit_id, device or self.devices[0], fresh=fresh)
+        res = self.bs_judge(commit_id, samples)
+        if res:
             self.logger.get_log().info(f"{self.testing_mode}执行成功commit: {commit_id}")
-            return True
+        else:
+            self.logger.get_log().info(f"{self.testing_mode}执行失败commit: {commit_id}")
+        return res
+
+    def _batch_debug(self, commits):
+        """
+        多个commit并行测试, 每张卡一个commit
+        """
+        devices = [self.devices[i % len(self.devices)] for i in range(len(commits))]
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(commits)))) as pool:
+            list(pool.map(self.bs_measure, commits, devices))
+        return {commit: self.bs_debug(commit) for commit in commits}
 
     def _commit_locate(self, commits):
         """
-        commit定位
+        commit定位, k路并行二分
+        commits 由新到旧排列, commits[0] 为fail, commits之后为 good_commit(pass);
+        每轮在 (lo, hi) 区间内均匀选取k个commit并行测试, 区间缩小为最旧的fail与其后最新的pass之间
         """
         self.logger.get_log().info("测试case名称: {}".format(self.title))
 
-        if len(commits) == 2:
-            self.logger.get_log().info(
-                "only two candidate commits left in binary_search, the final commit is {}".format(commits[0])
-            )
-            return commits[0]
-        left, right = 0, len(commits) - 1
-        if left <= right:
-            mid = left + (right - left) // 2
-            commit = commits[mid]
-
-            self._install_paddle(commit)
-
-            if self.bs_debug(commit):
-                self.logger.get_log().info("the commit {} is success".format(commit))
-                self.logger.get_log().info("mid value:{}".format(mid))
-                selected_commits = commits[: mid + 1]
-                res = self._commit_locate(selected_commits)
-            else:
-                self.logger.get_log().info("the commit {} is failed".format(commit))
-                selected_commits = commits[mid:]
-                res = self._commit_locate(selected_commits)
-        return res
+        lo, hi = 0, len(commits)  # commits[lo] fail, commits[hi] pass(hi为len时即good_commit)
+        while hi - lo > 1:
+            count = min(self.workers, hi - lo - 1)
+            probes = [lo + (hi - lo) * (i + 1) // (count + 1) for i in range(count)]
+            res = self._batch_debug([commits[i] for i in probes])
+            for i in probes:
+                status = "success" if res[commits[i]] else "failed"
+                self.logger.get_log().info("the commit {} is {}, index: {}".format(commits[i], status, i))
+            lo = max([lo] + [i for i in probes if not res[commits[i]]])
+            hi = min([hi] + [i for i in probes if res[commits[i]] and i > lo])
+            self.logger.get_log().info("candidate commits left in binary_search: {}".format(commits[lo:hi]))
+        self.logger.get_log().info("the final commit is {}".format(commits[lo]))
+        return commits[lo]
+
+    def _recheck(self, commit_id, device, loop_num):
+        """
+        复验, 不复用已有结果
+        """
+        return [self.bs_debug(commit_id, device=device, fresh=True) for _ in range(loop_num)]
 
     def _run(self):
         """
         用户运行
         """
         # 初始检查
-        self._install_paddle(self.good_commit)
-        bool_res_init_good_commit = self._precision_debug(self.good_commit)  # 应该为True
-        self._install_paddle(self.bad_commit)
-        bool_res_init_bad_commit = self._precision_debug(self.bad_commit)  # 应该为False
+        res = self._batch_debug([self.good_commit, self.bad_commit])
+        bool_res_init_good_commit = res[self.good_commit]  # 应该为True
+        bool_res_init_bad_commit = res[self.bad_commit]  # 应该为False
 
         if not bool_res_init_good_commit or bool_res_init_bad_commit:
             check_info = f"初始commit有误, good_commit为{bool_res_init_good_commit}, bad_commit为{bool_res_init_bad_commit}"
@@ -267,26 +361,24 @@ class BinarySearch(object):
 
         self.logger.get_log().info("准备进行二分定位结果复验")
         final_index = commit_list.index(final_commit)
-        check_commit = commit_list[final_index + 1]  # 前一个commit(list不包含未编出的包)
+        # 前一个commit(list不包含未编出的包), 已是最旧commit时为good_commit
+        check_commit = commit_list[final_index + 1] if final_index + 1 < len(commit_list) else self.good_commit
         final_index_origin = commit_list_origin.index(final_commit)
-        check_commit_origin = commit_list_origin[final_index_origin + 1]  # 前一个commit(list包含未编出的包)
+        # 前一个commit(list包含未编出的包)
+        if final_index_origin + 1 < len(commit_list_origin):
+            check_commit_origin = commit_list_origin[final_index_origin + 1]
+        else:
+            check_commit_origin = self.good_commit
 
-        # 开始复验
-        bool_final_res = 0
-        bool_final_res_list = []
-        bool_check_res = 0
-        bool_check_res_list = []
+        # 开始复验, 多卡时两个commit并行
         loop_num = 5
-        self._install_paddle(final_commit)
-        for i in range(loop_num):
-            bool_res_0 = self._precision_debug(final_commit)
-            bool_final_res += int(bool_res_0)
-            bool_final_res_list.append(bool_res_0)
-        self._install_paddle(check_commit)
-        for i in range(loop_num):
-            bool_res_1 = self._precision_debug(check_commit)
-            bool_check_res += int(bool_res_1)
-            bool_check_res_list.append(bool_res_1)
+        with ThreadPoolExecutor(max_workers=min(2, len(self.devices))) as pool:
+            final_future = pool.submit(self._recheck, final_commit, self.devices[0], loop_num)
+            check_future = pool.submit(self._recheck, check_commit, self.devices[1 % len(self.devices)], loop_num)
+            bool_final_res_list = final_future.result()
+            bool_check_res_list = check_future.result()
+        bool_final_res = sum(int(r) for r in bool_final_res_list)
+        bool_check_res = sum(int(r) for r in bool_check_res_list)
 
         if bool_final_res == 0 and bool_check_res == loop_num and check_commit == check_commit_origin:
             check_info = "复验流程通过, 定位到的commit就是最终结果。"
@@ -6,12 +6,17 @@
 db object
 """
 
+import os
+import sys
 import json
 import traceback
 from datetime import datetime
 import yaml
 import pymysql
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from utils.db_writer import ConnectionPool, BatchWriter
+
 # from utils.logger import logger
 
 ACCURACY = "%.6g"
@@ -22,8 +27,7 @@ class DB(object):
 
     def __init__(self, storage="storage.yaml"):
         self.storage = storage
-        host, port, user, password, database = self.load_storge()
-        self.db = pymysql.connect(host=host, port=port, user=user, password=password, database=database, charset="utf8")
+        self.db = self.connect()
         self.cursor = self.db.cursor()
         # self.now_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
@@ -42,6 +46,23 @@ class DB(object):
         database = msg_dict.get("db_name")
         return host, port, user, password, database
 
+    def connect(self):
+        """
+        新建一个数据库连接
+        """
+        host, port, user, password, database = self.load_storge()
+        return pymysql.connect(host=host, port=port, user=user, password=password, database=database, charset="utf8")
+
+    def batch_writer(self, pool_size=2, batch_size=200, spill_file="db_spill.jsonl"):
+        """
+        批量异步写库对象, 写库失败的数据落盘到spill_file, 可通过replay重放
+        :param pool_size: 连接池大小
+        :param batch_size: 单次executemany的最大行数
+        :param spill_file: 本地落盘文件
+        """
+        pool = ConnectionPool(connect_func=self.connect, size=pool_size)
+        return BatchWriter(pool=pool, batch_size=batch_size, spill_file=spill_file)
+
     def timestamp(self):
         """
         时间戳控制
@@ -54,11 +75,11 @@ class DB(object):
         sql_table = "`" + table + "`"
         ls = [(k, data[k]) for k in data if data[k] is not None]
         keys = ",".join(("`" + i[0] + "`") for i in ls)
-        values = ",".join("%r" % i[1] for i in ls)
+        values = ",".join(["%s"] * len(ls))
 
         sql = "INSERT INTO {table}({keys}) VALUES ({values})".format(table=sql_table, keys=keys, values=values)
         try:
-            self.cursor.execute(sql)
+            self.cursor.execute(sql, [i[1] for i in ls])
             id = self.db.insert_id()
             self.db.commit()
         except Exception as e:
@@ -71,13 +92,13 @@ class DB(object):
         sql_table = "`" + table + "`"
         sql = (
             "UPDATE %s SET " % sql_table
-            + ",".join("%s=%r" % (("`" + k + "`"), data[k]) for k in data)
+            + ",".join("%s=%%s" % ("`" + k + "`") for k in data)
             + " WHERE "
-            + " AND ".join("%s=%r" % (("`" + k + "`"), data_condition[k]) for k in data_condition)
+            + " AND ".join("%s=%%s" % ("`" + k + "`") for k in data_condition)
         )
 
         try:
-            self.cursor.execute(sql)
+            self.cursor.execute(sql, list(data.values()) + list(data_condition.values()))
             self.db.commit()
         except Exception as e:
             print(traceback.format_exc())
@@ -86,15 +107,10 @@ class DB(object):
     def update_by_id(self, table, data, id):
         """按照id 更新数据"""
         sql_table = "`" + table + "`"
-        sql = (
-            "UPDATE %s SET " % sql_table
-            + ",".join("%s=%r" % (("`" + k + "`"), data[k]) for k in data)
-            + " WHERE "
-            + "%s=%r" % ("`id`", id)
-        )
+        sql = "UPDATE %s SET " % sql_table + ",".join("%s=%%s" % ("`" + k + "`") for k in data) + " WHERE `id`=%s"
 
         try:
-            self.cursor.execute(sql)
+            self.cursor.execute(sql, list(data.values()) + [id])
             self.db.commit()
         except Exception as e:
             print(traceback.format_exc())
@@ -253,6 +269,23 @@ class DB(object):
             print(traceback.format_exc())
             print(e)
 
+    def insert_case_batch(self, jid, case_dict, create_time):
+        """
+        向case表中批量录入数据, 先重放之前落盘的数据, 返回前保证全部写库或落盘
+        :param case_dict: dict, case_name -> result
+        :return: (写库行数, 落盘行数)
+        """
+        with self.batch_writer() as writer:
+            replayed = writer.replay()
+            if replayed:
+                print("replay {} spilled rows".format(replayed))
+            for case_name, result in case_dict.items():
+                writer.write(
+                    table="layer_case",
+                    data={"jid": jid, "case_name": case_name, "result": result, "create_time": create_time},
+                )
+        return writer.written, writer.spilled
+
     def update_job(self, id, status, update_time):
         """数据录入完成后更新job表中的部分字段"""
         data = {"status": status, "update_time": update_time}
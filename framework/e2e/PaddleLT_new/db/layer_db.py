@@ -141,8 +141,12 @@ class LayerBenchmarkDB(object):
         self.logger.get_log().info("录入最新latest数据的job_id: {}".format(latest_id))
 
         # 插入layer_case
-        for title, perf_dict in data_dict.items():
-            db.insert_case(jid=latest_id, case_name=title, result=json.dumps(perf_dict), create_time=self.now_time)
+        written, spilled = db.insert_case_batch(
+            jid=latest_id,
+            case_dict={title: json.dumps(perf_dict) for title, perf_dict in data_dict.items()},
+            create_time=self.now_time,
+        )
+        self.logger.get_log().info("layer_case录入{}条, 落盘{}条".format(written, spilled))
 
         if bool(error_list):
             db.update_job(id=latest_id, status="done", update_time=self.now_time)
@@ -300,8 +304,12 @@ class LayerBenchmarkDB(object):
         self.logger.get_log().info("录入最新baseline数据的job_id: {}".format(basleine_id))
 
         # 插入layer_case
-        for title, perf_dict in data_dict.items():
-            db.insert_case(jid=basleine_id, case_name=title, result=json.dumps(perf_dict), create_time=self.now_time)
+        written, spilled = db.insert_case_batch(
+            jid=basleine_id,
+            case_dict={title: json.dumps(perf_dict) for title, perf_dict in data_dict.items()},
+            create_time=self.now_time,
+        )
+        self.logger.get_log().info("layer_case录入{}条, 落盘{}条".format(written, spilled))
 
         if bool(error_list):
             db.update_job(id=basleine_id, status="done", update_time=self.now_time)
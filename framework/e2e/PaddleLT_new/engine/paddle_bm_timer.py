@@ -0,0 +1,192 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+性能计时后端
+"""
+import os
+import time
+import numpy as np
+import paddle
+from pltools.logger import Logger
+
+
+class BMTimer(object):
+    """
+    性能计时器, 供 LayerEvalBM 与 LayerTrainBM 使用:
+    1. perf_counter: time.perf_counter_ns 计时, 仅在gpu上同步实际目标设备, cpu上不做同步
+    2. event: 在目标设备当前stream上记录cuda event, 直接得到设备耗时
+    3. auto: gpu且paddle支持event计时时使用event, 否则使用perf_counter
+    warmup为auto时, 按窗口统计延迟中位数, 相邻窗口变化小于warmup_tol时停止预热
+    """
+
+    def __init__(
+        self,
+        device,
+        device_place_id=0,
+        backend="auto",
+        warmup="auto",
+        warmup_min=10,
+        warmup_max=1000,
+        warmup_window=10,
+        warmup_tol=0.05,
+        host_split=False,
+    ):
+        """
+        :param device: PLT_SET_DEVICE, cpu/gpu
+        :param device_place_id: 目标设备id
+        :param backend: auto/perf_counter/event
+        :param warmup: auto 或 固定预热次数
+        :param warmup_min: auto预热的最少调用次数
+        :param warmup_max: auto预热的最多调用次数
+        :param warmup_window: auto预热的窗口大小
+        :param warmup_tol: auto预热的收敛阈值, 相邻窗口延迟中位数的相对变化
+        :param host_split: 是否额外记录host端耗时(不含设备同步)
+        """
+        self.device = device
+        self.device_place_id = int(device_place_id)
+        self.use_gpu = device == "gpu" and paddle.is_compiled_with_cuda()
+        self.warmup_num = warmup
+        self.warmup_min = warmup_min
+        self.warmup_max = warmup_max
+        self.warmup_window = warmup_window
+        self.warmup_tol = warmup_tol
+        self.host_split = host_split
+        self.logger = Logger("BMTimer")
+
+        if backend == "auto":
+            backend = "event" if self.use_gpu and self._event_supported() else "perf_counter"
+        elif backend == "event" and not (self.use_gpu and self._event_supported()):
+            self.logger.get_log().warning("当前设备或paddle版本不支持event计时, 改用perf_counter计时")
+            backend = "perf_counter"
+        self.backend = backend
+
+        # 最近一次 run 的运行信息
+        self.warmup_count = 0
+        self.host_time_list = []
+
+    def _event_supported(self):
+        """
+        paddle是否支持cuda event计时
+        """
+        try:
+            event = paddle.device.cuda.Event(enable_timing=True)
+        except Exception:
+            return False
+        return hasattr(event, "elapsed_time")
+
+    def synchronize(self):
+        """
+        同步实际目标设备, cpu上为空操作
+        """
+        if self.use_gpu:
+            paddle.device.cuda.synchronize(self.device_place_id)
+
+    def warmup(self, func):
+        """
+        预热
+        :param func: 被测函数
+        :return: 预热调用次数
+        """
+        if self.warmup_num != "auto":
+            for _ in range(int(self.warmup_num)):
+                func()
+            self.synchronize()
+            return int(self.warmup_num)
+
+        count = 0
+        last_median = None
+        while count < self.warmup_max:
+            latency = []
+            for _ in range(self.warmup_window):
+                start = time.perf_counter_ns()
+                func()
+                self.synchronize()
+                latency.append(time.perf_counter_ns() - start)
+            count += self.warmup_window
+            median = float(np.median(latency))
+            if (
+                count >= self.warmup_min
+                and last_median is not None
+                and abs(median - last_median) <= self.warmup_tol * last_median
+            ):
+                break
+            last_median = median
+        return count
+
+    def _run_perf_counter(self, func, repeat, number):
+        """
+        perf_counter_ns 计时
+        """
+        total_time_list = []
+        host_time_list = []
+        for _ in range(repeat):
+            start = time.perf_counter_ns()
+            for _ in range(number):
+                func()
+            host_end = time.perf_counter_ns()
+            self.synchronize()
+            end = time.perf_counter_ns()
+            total_time_list.append((end - start) / 1e9)
+            host_time_list.append((host_end - start) / 1e9)
+        return total_time_list, host_time_list
+
+    def _run_event(self, func, repeat, number):
+        """
+        cuda event 计时, 记录在目标设备的当前stream上
+        """
+        total_time_list = []
+        host_time_list = []
+        start_event = paddle.device.cuda.Event(enable_timing=True)
+        end_event = paddle.device.cuda.Event(enable_timing=True)
+        for _ in range(repeat):
+            host_start = time.perf_counter_ns()
+            start_event.record()
+            for _ in range(number):
+                func()
+            end_event.record()
+            host_end = time.perf_counter_ns()
+            end_event.synchronize()
+            # elapsed_time 单位为毫秒
+            total_time_list.append(start_event.elapsed_time(end_event) / 1e3)
+            host_time_list.append((host_end - host_start) / 1e9)
+        return total_time_list, host_time_list
+
+    def run(self, func, repeat, number=1):
+        """
+        预热后计时
+        :param func: 被测函数
+        :param repeat: 重复轮次
+        :param number: 每轮调用次数
+        :return: 每轮耗时list(秒)
+        """
+        self.warmup_count = self.warmup(func)
+        if self.backend == "event":
+            total_time_list, host_time_list = self._run_event(func, repeat, number)
+        else:
+            total_time_list, host_time_list = self._run_perf_counter(func, repeat, number)
+
+        self.host_time_list = host_time_list if self.host_split else []
+        if self.host_split:
+            self.logger.get_log().info(
+                "计时后端: {}, 预热次数: {}, host耗时中位数: {:.6f}s, 总耗时中位数: {:.6f}s".format(
+                    self.backend, self.warmup_count, np.median(host_time_list), np.median(total_time_list)
+                )
+            )
+        return total_time_list
+
+
+def bm_timer(device, device_place_id=0, backend=None):
+    """
+    按环境变量构建计时器:
+    PLT_BM_TIMER: auto/perf_counter/event, backend不为None时以backend为准
+    PLT_BM_WARMUP: auto 或 固定预热次数
+    PLT_BM_HOST_SPLIT: True 时额外记录host端耗时
+    """
+    return BMTimer(
+        device=device,
+        device_place_id=device_place_id,
+        backend=backend or os.environ.get("PLT_BM_TIMER", "auto"),
+        warmup=os.environ.get("PLT_BM_WARMUP", "auto"),
+        host_split=os.environ.get("PLT_BM_HOST_SPLIT", "False") == "True",
+    )
@@ -10,6 +10,7 @@ from engine.paddle_train import LayerTrain
 from engine.paddle_eval import LayerEval
 from engine.paddle_export import LayerExport
 from engine.paddle_infer import LayerInfer
+from engine.paddle_infer_bm import LayerInferBM
 from engine.paddle_eval_bm import LayerEvalBM
 from engine.paddle_train_bm import LayerTrainBM
 
@@ -49,4 +50,9 @@ paddle_engine_map = {
     "dy2st_train_perf": LayerTrainBM,  # 动转静评估性能
     "dy2st_train_cinn_perf": LayerTrainBM,  # CINN评估性能
     "dy2st_train_cinn_perf_pre": LayerTrainBM,  # pre测试
+    "paddle_infer_gpu_perf": LayerInferBM,  # gpu预测性能
+    "paddle_infer_cpu_perf": LayerInferBM,  # cpu预测性能
+    "paddle_infer_mkldnn_perf": LayerInferBM,  # cpu mkldnn预测性能
+    "paddle_infer_ort_perf": LayerInferBM,  # ort预测性能
+    "paddle_infer_new_exc_pir_perf": LayerInferBM,  # 新执行器+PIR预测性能
 }
@@ -6,11 +6,10 @@
 eval 方法
 """
 import os
-import timeit
-import time
 import numpy as np
 import paddle
 from engine.paddle_xtools import reset
+from engine.paddle_bm_timer import bm_timer
 from generator.builder_layer import BuildLayer
 from generator.builder_data import BuildData
 from pltools.res_save import save_pickle
@@ -33,12 +32,16 @@ class LayerEvalBM(object):
 
         self.device = os.environ.get("PLT_SET_DEVICE")
         # paddle.set_device(str(self.device))
-        paddle.set_device(f"{self.device}:{device_place_id}")
+        if self.device == "cpu":
+            paddle.set_device("cpu")
+        else:
+            paddle.set_device(f"{self.device}:{device_place_id}")
         # paddle.set_device("{}:{}".format(str(self.device), str(device_id)))
 
         self.perf_repeat = int(os.environ.get("PLT_BM_REPEAT", "100"))
         self.perf_statis = os.environ.get("PLT_BM_STATIS", "trimmean")
         self.timeit_num = int(os.environ.get("TIMEIT_NUM", "1"))
+        self.timer = bm_timer(device=self.device, device_place_id=device_place_id)
         self.statis_times = 100
         self.statis_round = 6
 
@@ -85,18 +88,8 @@ class LayerEvalBM(object):
             logit = net(*input_data)
             return logit
 
-        total_time_list = []
-        # 预热
-        timeit.timeit(lambda: _perf(self.data), number=10)
-        # timeit.timeit(lambda: _perf(self.data), number=int(self.perf_repeat * self.timeit_num * 0.2))
-        for i in range(self.perf_repeat):
-            start_time = time.time()
-            for _ in range(self.timeit_num):
-                _perf(self.data)
-            paddle.core._cuda_synchronize(paddle.CUDAPlace(0))
-            end_time = time.time()
-            total_time = end_time - start_time
-            total_time_list.append(total_time)
+        # 预热与计时, 计时后端见 engine/paddle_bm_timer.py
+        total_time_list = self.timer.run(lambda: _perf(self.data), repeat=self.perf_repeat, number=self.timeit_num)
 
         if os.environ.get("PLT_BM_PLOT") == "True":
             save_pickle(data=total_time_list, filename="dy_eval_perf_" + self.layerfile)
@@ -122,18 +115,8 @@ class LayerEvalBM(object):
             logit = st_net(*input_data)
             return logit
 
-        total_time_list = []
-        # 预热
-        timeit.timeit(lambda: _perf(self.data), number=10)
-        # timeit.timeit(lambda: _perf(self.data), number=int(self.perf_repeat * self.timeit_num * 0.2))
-        for i in range(self.perf_repeat):
-            start_time = time.time()
-            for _ in range(self.timeit_num):
-                _perf(self.data)
-            paddle.core._cuda_synchronize(paddle.CUDAPlace(0))
-            end_time = time.time()
-            total_time = end_time - start_time
-            total_time_list.append(total_time)
+        # 预热与计时, 计时后端见 engine/paddle_bm_timer.py
+        total_time_list = self.timer.run(lambda: _perf(self.data), repeat=self.perf_repeat, number=self.timeit_num)
 
         if os.environ.get("PLT_BM_PLOT") == "True":
             save_pickle(data=total_time_list, filename="dy_eval_perf_" + self.layerfile)
@@ -162,18 +145,8 @@ class LayerEvalBM(object):
             logit = cinn_net(*input_data)
             return logit
 
-        total_time_list = []
-        # 预热
-        timeit.timeit(lambda: _perf(self.data), number=10)
-        # timeit.timeit(lambda: _perf(self.data), number=int(self.perf_repeat * self.timeit_num * 0.2))
-        for i in range(perf_repeat):
-            start_time = time.time()
-            for _ in range(self.timeit_num):
-                _perf(self.data)
-            paddle.core._cuda_synchronize(paddle.CUDAPlace(0))
-            end_time = time.time()
-            total_time = end_time - start_time
-            total_time_list.append(total_time)
+        # 预热与计时, 计时后端见 engine/paddle_bm_timer.py
+        total_time_list = self.timer.run(lambda: _perf(self.data), repeat=perf_repeat, number=self.timeit_num)
 
         if os.environ.get("PLT_BM_PLOT") == "True":
             save_pickle(data=total_time_list, filename="dy_eval_perf_" + self.layerfile)
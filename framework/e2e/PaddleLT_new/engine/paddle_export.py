@@ -27,7 +27,10 @@ class LayerExport(object):
         self.seed = 33
         reset(self.seed)
         self.device = os.environ.get("PLT_SET_DEVICE")
-        paddle.set_device(f"{self.device}:{device_place_id}")
+        if self.device == "cpu":
+            paddle.set_device("cpu")
+        else:
+            paddle.set_device(f"{self.device}:{device_place_id}")
 
         self.testing = testing
         self.upstream_net = upstream_net
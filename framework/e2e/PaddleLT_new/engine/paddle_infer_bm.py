@@ -0,0 +1,163 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+infer 性能执行器
+"""
+
+import os
+import numpy as np
+import paddle
+import paddle.inference as paddle_infer
+from engine.paddle_xtools import reset
+from engine.paddle_export import LayerExport
+from engine.paddle_bm_timer import bm_timer
+from generator.builder_data import BuildData
+from pltools.res_save import save_pickle
+from pltools.statistics import trimmean, mean, best, best_top_k, perf_by_step
+from pltools.logger import Logger
+
+
+class LayerInferBM(object):
+    """
+    构建Layer预测的性能通用类
+    """
+
+    def __init__(self, testing, layerfile, device_place_id, upstream_net, orderdict_usage="None"):
+        """
+        初始化
+        """
+        self.seed = 33
+        reset(self.seed)
+        self.device = os.environ.get("PLT_SET_DEVICE")
+        self.device_id = device_place_id
+        if self.device == "cpu":
+            paddle.set_device("cpu")
+        else:
+            paddle.set_device(f"{self.device}:{device_place_id}")
+
+        self.perf_repeat = int(os.environ.get("PLT_BM_REPEAT", "100"))
+        self.perf_statis = os.environ.get("PLT_BM_STATIS", "trimmean")
+        self.timeit_num = int(os.environ.get("TIMEIT_NUM", "1"))
+        self.statis_times = 100
+        self.statis_round = 6
+
+        self.testing = testing
+        self.upstream_net = upstream_net
+        self.jit_save_type = self.testing.get("jit_save_type", "jit_save")
+        self.model_dtype = self.testing.get("model_dtype", "float32")
+
+        self.layerfile = layerfile
+        self.data = BuildData(layerfile=layerfile).get_single_numpy()
+        self.path = os.path.join(os.getcwd(), "jit_save_export", layerfile.replace(".", "/"), self.jit_save_type)
+        self.logger = Logger("LayerInferBM")
+
+    def _export(self):
+        """
+        未导出模型时按 jit_save_type 导出, 性能yml无需再配置 jit_save 执行器
+        """
+        if os.path.exists(self.path + ".pdiparams"):
+            return True
+        self.logger.get_log().info("未找到导出模型, 按 {} 导出: {}".format(self.jit_save_type, self.path))
+        exporter = LayerExport(
+            testing={"model_dtype": self.model_dtype},
+            layerfile=self.layerfile,
+            device_place_id=self.device_id,
+            upstream_net=self.upstream_net,
+        )
+        getattr(exporter, self.jit_save_type)()
+        return os.path.exists(self.path + ".pdiparams")
+
+    def _config(self, model_suffix=".pdmodel"):
+        """
+        预测config
+        """
+        return paddle_infer.Config(self.path + model_suffix, self.path + ".pdiparams")
+
+    def _perf(self, config, timer_device):
+        """
+        创建predictor并一次性拷入输入, 预热后只对 predictor.run() 计时
+        :param config: 预测config
+        :param timer_device: 计时设备, cpu上计时不做设备同步
+        """
+        predictor = paddle_infer.create_predictor(config)
+        input_names = predictor.get_input_names()
+        for i, name in enumerate(input_names):
+            input_handle = predictor.get_input_handle(name)
+            input_handle.copy_from_cpu(self.data[i])
+
+        # predictor.run() 返回前已完成设备同步, 使用perf_counter计时, cuda event不在predictor的stream上
+        timer = bm_timer(device=timer_device, device_place_id=self.device_id, backend="perf_counter")
+        total_time_list = timer.run(predictor.run, repeat=self.perf_repeat, number=self.timeit_num)
+
+        if os.environ.get("PLT_BM_PLOT") == "True":
+            save_pickle(data=total_time_list, filename="paddle_infer_perf_" + self.layerfile)
+            # 画图
+            perf_by_step(
+                data_list=total_time_list,
+                step_scale=[0.1, 0.5, 1],
+                filename="paddle_infer_perf_" + self.layerfile + "_by_step",
+            )
+
+        time_res = eval(self.perf_statis)(data_list=total_time_list)
+        time_res = round(time_res * self.statis_times, self.statis_round)
+        return time_res
+
+    def paddle_infer_gpu_perf(self):
+        """infer gpu perf"""
+        reset(self.seed)
+        if not self._export():
+            Logger("paddle_infer_gpu_perf").get_log().info("该子图export未产出pdiparams, 所以跳过infer性能测试")
+            return "skip"
+        config = self._config()
+        config.enable_use_gpu(1000, int(self.device_id))
+        return self._perf(config, timer_device=self.device)
+
+    def paddle_infer_cpu_perf(self):
+        """infer cpu perf"""
+        reset(self.seed)
+        if not self._export():
+            Logger("paddle_infer_cpu_perf").get_log().info("该子图export未产出pdiparams, 所以跳过infer性能测试")
+            return "skip"
+        config = self._config()
+        config.disable_gpu()
+        config.disable_mkldnn()
+        return self._perf(config, timer_device="cpu")
+
+    def paddle_infer_mkldnn_perf(self):
+        """infer mkldnn perf"""
+        reset(self.seed)
+        if not self._export():
+            Logger("paddle_infer_mkldnn_perf").get_log().info("该子图export未产出pdiparams, 所以跳过infer性能测试")
+            return "skip"
+        config = self._config()
+        config.disable_gpu()
+        config.enable_mkldnn()
+        config.set_cpu_math_library_num_threads(1)
+        config.set_mkldnn_cache_capacity(1)
+        return self._perf(config, timer_device="cpu")
+
+    def paddle_infer_ort_perf(self):
+        """infer onnxruntime perf"""
+        reset(self.seed)
+        if not self._export():
+            Logger("paddle_infer_ort_perf").get_log().info("该子图export未产出pdiparams, 所以跳过infer性能测试")
+            return "skip"
+        config = self._config()
+        config.disable_gpu()
+        config.enable_onnxruntime()
+        config.enable_ort_optimization()
+        return self._perf(config, timer_device="cpu")
+
+    def paddle_infer_new_exc_pir_perf(self):
+        """infer new executor + pir perf"""
+        reset(self.seed)
+        if not self._export():
+            Logger("paddle_infer_new_exc_pir_perf").get_log().info("该子图export未产出pdiparams, 所以跳过infer性能测试")
+            return "skip"
+        config = self._config(model_suffix=".json")
+        config.enable_use_gpu(256, int(self.device_id))
+        config.switch_ir_optim(False)
+        config.enable_new_executor()
+        config.enable_new_ir()
+        return self._perf(config, timer_device=self.device)
@@ -6,11 +6,10 @@
 train 方法
 """
 import os
-import timeit
-import time
 import numpy as np
 import paddle
 from engine.paddle_xtools import reset
+from engine.paddle_bm_timer import bm_timer
 from generator.builder_layer import BuildLayer
 from generator.builder_data import BuildData
 from generator.builder_optimizer import BuildOptimizer
@@ -35,12 +34,16 @@ class LayerTrainBM(object):
 
         self.device = os.environ.get("PLT_SET_DEVICE")
         # paddle.set_device(str(self.device))
-        paddle.set_device(f"{self.device}:{device_place_id}")
+        if self.device == "cpu":
+            paddle.set_device("cpu")
+        else:
+            paddle.set_device(f"{self.device}:{device_place_id}")
         # paddle.set_device("{}:{}".format(str(self.device), str(device_id)))
 
         self.perf_repeat = int(os.environ.get("PLT_BM_REPEAT", "100"))
         self.perf_statis = os.environ.get("PLT_BM_STATIS", "trimmean")
         self.timeit_num = int(os.environ.get("TIMEIT_NUM", "1"))
+        self.timer = bm_timer(device=self.device, device_place_id=device_place_id)
         self.statis_times = 100
         self.statis_round = 6
 
@@ -119,18 +122,8 @@ class LayerTrainBM(object):
             # logit = net(*input_data)
             return dy_loss
 
-        total_time_list = []
-        # 预热
-        timeit.timeit(lambda: _perf(self.data), number=10)
-        # timeit.timeit(lambda: _perf(self.data), number=int(self.perf_repeat * self.timeit_num * 0.2))
-        for i in range(self.perf_repeat):
-            start_time = time.time()
-            for _ in range(self.timeit_num):
-                _perf(self.data)
-            paddle.core._cuda_synchronize(paddle.CUDAPlace(0))
-            end_time = time.time()
-            total_time = end_time - start_time
-            total_time_list.append(total_time)
+        # 预热与计时, 计时后端见 engine/paddle_bm_timer.py
+        total_time_list = self.timer.run(lambda: _perf(self.data), repeat=self.perf_repeat, number=self.timeit_num)
 
         if os.environ.get("PLT_BM_PLOT") == "True":
             save_pickle(data=total_time_list, filename="dy_train_perf_" + self.layerfile)
@@ -171,18 +164,8 @@ class LayerTrainBM(object):
             # logit = st_net(*input_data)
             return dy_loss
 
-        total_time_list = []
-        # 预热
-        timeit.timeit(lambda: _perf(self.data), number=10)
-        # timeit.timeit(lambda: _perf(self.data), number=int(self.perf_repeat * self.timeit_num * 0.2))
-        for i in range(self.perf_repeat):
-            start_time = time.time()
-            for _ in range(self.timeit_num):
-                _perf(self.data)
-            paddle.core._cuda_synchronize(paddle.CUDAPlace(0))
-            end_time = time.time()
-            total_time = end_time - start_time
-            total_time_list.append(total_time)
+        # 预热与计时, 计时后端见 engine/paddle_bm_timer.py
+        total_time_list = self.timer.run(lambda: _perf(self.data), repeat=self.perf_repeat, number=self.timeit_num)
 
         if os.environ.get("PLT_BM_PLOT") == "True":
             save_pickle(data=total_time_list, filename="dy_train_perf_" + self.layerfile)
@@ -223,18 +206,8 @@ class LayerTrainBM(object):
                     opt.clear_grad()
             return logit
 
-        total_time_list = []
-        # 预热
-        timeit.timeit(lambda: _perf(self.data), number=10)
-        # timeit.timeit(lambda: _perf(self.data), number=int(self.perf_repeat * self.timeit_num * 0.2))
-        for i in range(perf_repeat):
-            start_time = time.time()
-            for _ in range(self.timeit_num):
-                _perf(self.data)
-            paddle.core._cuda_synchronize(paddle.CUDAPlace(0))
-            end_time = time.time()
-            total_time = end_time - start_time
-            total_time_list.append(total_time)
+        # 预热与计时, 计时后端见 engine/paddle_bm_timer.py
+        total_time_list = self.timer.run(lambda: _perf(self.data), repeat=perf_repeat, number=self.timeit_num)
 
         if os.environ.get("PLT_BM_PLOT") == "True":
             save_pickle(data=total_time_list, filename="dy_train_perf_" + self.layerfile)
@@ -27,6 +27,10 @@ if "torch" in os.environ.get("FRAMEWORK"):
     import torch_case
 
 import pltools.np_tool as tool
+from pltools.input_bank import INPUT_BANK
+
+# {(输入key, framework, device): 转换后的tensor list}
+_DEVICE_INPUTS = {}
 
 
 class BuildData(object):
@@ -37,48 +41,53 @@ class BuildData(object):
         self.layerfile = layerfile
         self.layer_module = eval(self.layerfile)
 
+    def _numpy_inputs(self):
+        """create_numpy_inputs() 的结果, 经由输入数据仓库获取"""
+        return INPUT_BANK.load(getattr(self.layer_module, "create_numpy_inputs"))
+
+    def _to_tensor(self, value, framework, device):
+        """numpy转为tensor, int类型不计算梯度"""
+        if isinstance(value, (tuple, list)):  # 为了适配list输入的模型子图
+            return [self._to_tensor(j, framework, device) for j in value]
+        elif isinstance(value, np.ndarray):
+            stop_gradient = value.dtype == np.int64 or value.dtype == np.int32
+            if framework == "paddle":
+                return paddle.to_tensor(value, place=device, stop_gradient=stop_gradient)
+            elif framework == "torch":
+                # return torch.tensor(value, requires_grad=not stop_gradient, device=torch.device('cuda:0'))
+                return torch.tensor(value, requires_grad=not stop_gradient)
+        elif isinstance(value, float):
+            return paddle.to_tensor(value, stop_gradient=False)
+        elif isinstance(value, int):
+            return paddle.to_tensor(value, stop_gradient=True)
+        return value
+
+    def _fresh_tensor(self, value, framework):
+        """复制设备上缓存的tensor, 各engine的梯度与inplace修改互不影响"""
+        if isinstance(value, list):
+            return [self._fresh_tensor(j, framework) for j in value]
+        elif framework == "paddle" and isinstance(value, paddle.Tensor):
+            tensor = value.detach().clone()
+            tensor.stop_gradient = value.stop_gradient
+            return tensor
+        elif framework == "torch" and isinstance(value, torch.Tensor):
+            return value.detach().clone().requires_grad_(value.requires_grad)
+        return value
+
     def get_single_data(self, framework="paddle"):
         """get data"""
         if hasattr(self.layer_module, "create_numpy_inputs"):
-            # dataname = self.layerfile + ".create_numpy_inputs()"
-            data = []
-            # for i in eval(dataname):
-            for i in getattr(self.layer_module, "create_numpy_inputs")():
-                if isinstance(i, (tuple, list)):  # 为了适配list输入的模型子图
-                    tmp = []
-                    for j in i:
-                        if framework == "paddle":
-                            if j.dtype == np.int64 or j.dtype == np.int32:
-                                tmp.append(paddle.to_tensor(j, stop_gradient=True))
-                            else:
-                                tmp.append(paddle.to_tensor(j, stop_gradient=False))
-                        elif framework == "torch":
-                            if j.dtype == np.int64 or j.dtype == np.int32:
-                                # tmp.append(torch.tensor(j, requires_grad=False, device=torch.device('cuda:0')))
-                                tmp.append(torch.tensor(j, requires_grad=False))
-                            else:
-                                # tmp.append(torch.tensor(j, requires_grad=True, device=torch.device('cuda:0')))
-                                tmp.append(torch.tensor(j, requires_grad=True))
-                    data.append(tmp)
-                elif isinstance(i, np.ndarray):
-                    if framework == "paddle":
-                        if i.dtype == np.int64 or i.dtype == np.int32:
-                            data.append(paddle.to_tensor(i, stop_gradient=True))
-                        else:
-                            data.append(paddle.to_tensor(i, stop_gradient=False))
-                    elif framework == "torch":
-                        if i.dtype == np.int64 or i.dtype == np.int32:
-                            # data.append(torch.tensor(i, requires_grad=False, device=torch.device('cuda:0')))
-                            data.append(torch.tensor(i, requires_grad=False))
-                        else:
-                            # data.append(torch.tensor(i, requires_grad=True, device=torch.device('cuda:0')))
-                            data.append(torch.tensor(i, requires_grad=True))
-                elif isinstance(i, float):
-                    data.append(paddle.to_tensor(i, stop_gradient=False))
-                elif isinstance(i, int):
-                    data.append(paddle.to_tensor(i, stop_gradient=True))
-                else:
-                    data.append(i)
+            key, inputs = self._numpy_inputs()
+            device = paddle.get_device() if framework == "paddle" else "cpu"
+            if key is None:
+                return [self._to_tensor(i, framework, device) for i in inputs]
+            # 同一设备只做一次numpy到tensor的转换, 只保留当前case
+            data = _DEVICE_INPUTS.get((key, framework, device))
+            if data is None:
+                data = [self._to_tensor(i, framework, device) for i in inputs]
+                _DEVICE_INPUTS.clear()
+                _DEVICE_INPUTS[(key, framework, device)] = data
+            data = [self._fresh_tensor(i, framework) for i in data]
         else:
             data = self.get_single_tensor()
         return data
@@ -94,11 +103,9 @@ class BuildData(object):
         return data
 
     def get_single_numpy(self):
-        """get data"""
-        # dataname = self.layerfile + ".create_numpy_inputs()"
+        """get data, ndarray为只读视图"""
         data = []
-        # for i in eval(dataname):
-        for i in getattr(self.layer_module, "create_numpy_inputs")():
+        for i in self._numpy_inputs()[1]:
             data.append(i)
 
         return data
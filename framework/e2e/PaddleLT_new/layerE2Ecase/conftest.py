@@ -0,0 +1,242 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+layerE2Ecase 延迟收集
+生成的子图文件中内联了大量子图类, pytest默认收集时需要先导入整个文件. 这里按AST建立 用例类->test方法 的索引
+(按文件mtime与大小缓存在pytest cache中), 收集阶段不导入文件, 执行到第一个用例时才导入, 用例id与默认收集一致
+文件导入失败时每个用例在setup阶段报ERROR; 含有无法静态判断的用例时该文件退回pytest默认收集
+关闭: export PLT_E2E_LAZY_COLLECT=False
+"""
+import os
+import ast
+import unittest
+
+import pytest
+
+PLT_E2E_LAZY_COLLECT = os.environ.get("PLT_E2E_LAZY_COLLECT", "True")
+
+INDEX_VERSION = 1
+
+
+class _Unsupported(Exception):
+    """
+    需要pytest默认收集的文件
+    """
+
+
+def _base_name(base):
+    """
+    基类名, unittest.TestCase 返回 TestCase
+    """
+    if isinstance(base, ast.Name):
+        return base.id
+    if isinstance(base, ast.Attribute) and ast.unparse(base) == "unittest.TestCase":
+        return "TestCase"
+    return None
+
+
+def _methods(node):
+    """
+    类中直接定义的方法名
+    """
+    return [m.name for m in node.body if isinstance(m, (ast.FunctionDef, ast.AsyncFunctionDef))]
+
+
+def build_index(src):
+    """
+    按AST建立用例索引
+    :return: [[类名, 是否为普通类(非unittest), test方法list], ...], 顺序与模块中类的定义顺序一致
+    """
+    tree = ast.parse(src)
+    order = []
+    classes = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith("test"):
+            raise _Unsupported("module level test function")
+        if isinstance(node, ast.ClassDef):
+            if node.name not in classes:
+                order.append(node.name)
+            # 同名类重复定义时以最后一个为准
+            classes[node.name] = node
+
+    def _is_testcase(name, seen=()):
+        """
+        True/False, 基类不在文件内且无法判断时返回None
+        """
+        if name == "TestCase":
+            return True
+        node = classes.get(name)
+        if node is None or name in seen:
+            return None
+        res = False
+        for base in node.bases:
+            base_name = _base_name(base)
+            if base_name is None:
+                continue
+            base_res = _is_testcase(base_name, seen + (name,))
+            if base_res is None:
+                return None
+            res = res or base_res
+        return res
+
+    def _test_methods(name):
+        node = classes.get(name)
+        if node is None:
+            return []
+        methods = []
+        for base in node.bases:
+            methods.extend(_test_methods(_base_name(base)))
+        methods.extend(m for m in _methods(node) if m.startswith("test"))
+        return list(dict.fromkeys(methods))
+
+    index = []
+    for name in order:
+        is_testcase = _is_testcase(name)
+        if is_testcase is None:
+            if name.startswith("Test"):
+                raise _Unsupported("base class of {} not in file".format(name))
+            continue
+        if not is_testcase and not name.startswith("Test"):
+            continue
+        methods = _test_methods(name)
+        if is_testcase:
+            # unittest按方法名排序执行
+            index.append([name, False, sorted(methods)])
+            continue
+        own = set(_methods(classes[name]))
+        if "__init__" in own:
+            # pytest不收集带 __init__ 的普通类
+            continue
+        if any(m.startswith(("setup", "teardown")) for m in own):
+            raise _Unsupported("pytest style setup in {}".format(name))
+        if methods:
+            index.append([name, True, methods])
+    return index
+
+
+def _cached_index(config, path):
+    """
+    用例索引, 按文件mtime与大小缓存
+    """
+    stat = os.stat(path)
+    stamp = [INDEX_VERSION, stat.st_mtime_ns, stat.st_size]
+    cache = getattr(config, "cache", None)
+    key = "plt/e2e_index/{}".format(os.path.relpath(str(path), str(config.rootpath)))
+    if cache is not None:
+        cached = cache.get(key, None)
+        if cached is not None and cached["stamp"] == stamp:
+            return cached["index"]
+    with open(path, "r", encoding="utf-8") as f:
+        src = f.read()
+    try:
+        index = build_index(src)
+    except (_Unsupported, SyntaxError):
+        # 语法错误交给默认收集报告
+        index = None
+    if cache is not None:
+        cache.set(key, {"stamp": stamp, "index": index})
+    return index
+
+
+class _Result(unittest.TestResult):
+    """
+    记录unittest执行结果中的第一个异常或跳过原因
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.exc_info = None
+        self.skip_reason = None
+
+    def addError(self, test, err):
+        """
+        异常
+        """
+        self.exc_info = self.exc_info or err
+
+    def addFailure(self, test, err):
+        """
+        断言失败
+        """
+        self.exc_info = self.exc_info or err
+
+    def addSkip(self, test, reason):
+        """
+        跳过
+        """
+        self.skip_reason = reason
+
+
+class LazyModule(pytest.Module):
+    """
+    按索引收集, 不导入文件; 无法建立索引时按pytest默认方式收集
+    """
+
+    def collect(self):
+        """
+        收集用例类
+        """
+        index = _cached_index(self.config, self.path)
+        if index is None:
+            return super().collect()
+        return [LazyClass.from_parent(self, name=name, plain=plain, methods=methods) for name, plain, methods in index]
+
+
+class LazyClass(pytest.Collector):
+    """
+    用例类
+    """
+
+    def __init__(self, *, plain, methods, **kwargs):
+        super().__init__(**kwargs)
+        self.plain = plain
+        self.methods = methods
+
+    def collect(self):
+        """
+        收集test方法
+        """
+        for method in self.methods:
+            yield LazyCase.from_parent(self, name=method)
+
+
+class LazyCase(pytest.Item):
+    """
+    单个test方法, setup时导入文件
+    """
+
+    def setup(self):
+        """
+        导入文件并获取用例类, 导入失败时报ERROR
+        """
+        self.cls = getattr(self.parent.parent.obj, self.parent.name)
+
+    def runtest(self):
+        """
+        unittest用例以unittest方式执行, 普通类与pytest一致直接实例化后调用
+        """
+        if self.parent.plain:
+            getattr(self.cls(), self.name)()
+            return
+        result = _Result()
+        unittest.TestSuite([self.cls(self.name)]).run(result)
+        if result.exc_info is not None:
+            raise result.exc_info[1].with_traceback(result.exc_info[2])
+        if result.skip_reason is not None:
+            pytest.skip(result.skip_reason)
+
+    def reportinfo(self):
+        """
+        报告位置
+        """
+        return self.path, None, "{}.{}".format(self.parent.name, self.name)
+
+
+def pytest_pycollect_makemodule(module_path, parent):
+    """
+    layerE2Ecase 子图文件使用延迟收集
+    """
+    if PLT_E2E_LAZY_COLLECT != "True":
+        return None
+    return LazyModule.from_parent(parent, path=module_path)
@@ -14,6 +14,7 @@ from strategy.compare import base_compare, infer_compare, torch_compare
 from pltools.yaml_loader import YamlLoader
 from pltools.logger import Logger
 from pltools.res_save import save_tensor, load_tensor, save_pickle
+from pltools.gt_store import GTStore
 
 
 class LayerTest(object):
@@ -26,6 +27,7 @@ class LayerTest(object):
         self.title = title
 
         self.device_place_id = int(device_place_id)
+        self.layerfile_path = layerfile
         self.layerfile = layerfile.replace(".py", "").replace("/", ".").lstrip(".")
 
         # 解析testing.yml
@@ -122,10 +124,14 @@ class LayerTest(object):
                     res_dict[testing] = res
                     net = None
                 if os.environ.get("PLT_SAVE_GT") == "True":  # 开启gt保存
-                    gt_path = os.path.join("plt_gt", os.environ.get("PLT_SET_DEVICE"), testing)
-                    if not os.path.exists(gt_path):
-                        os.makedirs(gt_path)
-                    save_tensor(res, os.path.join(gt_path, self.title))
+                    if os.environ.get("PLT_GT_STORE", "False") == "True":  # 内容寻址的npy真值仓库
+                        gt_store = GTStore(root=os.path.join("plt_gt", os.environ.get("PLT_SET_DEVICE")))
+                        gt_store.save(res_dict[testing], testing=testing, layerfile=self.layerfile_path)
+                    else:
+                        gt_path = os.path.join("plt_gt", os.environ.get("PLT_SET_DEVICE"), testing)
+                        if not os.path.exists(gt_path):
+                            os.makedirs(gt_path)
+                        save_tensor(res, os.path.join(gt_path, self.title))
             except Exception:
                 bug_trace = traceback.format_exc()
                 exc_func += 1
@@ -152,8 +158,12 @@ class LayerTest(object):
                 gt_dir = "plt_gt_baseline"
                 gt_device = baseline_info.get("device")
                 baseline = baseline_info.get("testing")
-                gt_path = os.path.join(gt_dir, gt_device, baseline, self.title)
-                expect = load_tensor(gt_path)
+                if os.environ.get("PLT_GT_STORE", "False") == "True":
+                    gt_store = GTStore(root=os.path.join(gt_dir, gt_device))
+                    expect = gt_store.load(testing=baseline, layerfile=self.layerfile_path)
+                else:
+                    gt_path = os.path.join(gt_dir, gt_device, baseline, self.title)
+                    expect = load_tensor(gt_path)
             else:  # 使用res_dict中的测试结果作为基线
                 baseline = comparing.get("baseline")
                 expect = res_dict[baseline]
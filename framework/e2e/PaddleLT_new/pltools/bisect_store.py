@@ -0,0 +1,215 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+二分定位公共组件:
+1. WheelStore 按commit缓存安装包, 并用 pip install --target 解压到独立目录, 多个commit可并行测试
+2. ProbeStore 按 子图+testing+模式+环境变量+commit 保存测试结果, 多次二分之间复用
+3. perm_test 单侧置换检验, 用于性能二分判断是否显著变慢
+"""
+import os
+import json
+import socket
+import shutil
+import hashlib
+import functools
+import itertools
+import subprocess
+import threading
+
+import numpy as np
+import requests
+
+
+class WheelStore(object):
+    """
+    按commit缓存的安装包仓库
+    目录结构: {cache_dir}/{commit}/{whl}  与  {cache_dir}/{commit}/site (pip --target 安装目录)
+    """
+
+    def __init__(self, url_template, whl, cache_dir=None, py_cmd="python"):
+        """
+        :param url_template: 安装包地址模板, 其中 {} 替换为commit, 可以为http链接或本地路径
+        :param whl: 安装包文件名
+        :param cache_dir: 缓存目录, 默认 PLT_WHEEL_CACHE 或 ~/.cache/plt_wheels
+        :param py_cmd: 执行pip的python
+        """
+        self.url_template = url_template
+        self.whl = whl
+        self.cache_dir = cache_dir or os.environ.get(
+            "PLT_WHEEL_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "plt_wheels")
+        )
+        self.py_cmd = py_cmd
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _commit_lock(self, commit):
+        """
+        同一commit的下载与安装串行
+        """
+        with self._lock:
+            return self._locks.setdefault(commit, threading.Lock())
+
+    def url(self, commit):
+        """
+        安装包地址
+        """
+        return self.url_template.replace("{}", commit)
+
+    def _is_remote(self, commit):
+        return self.url(commit).startswith(("http://", "https://"))
+
+    def available(self, commit):
+        """
+        安装包是否可获取
+        """
+        if os.path.exists(os.path.join(self.cache_dir, commit, self.whl)):
+            return True
+        if not self._is_remote(commit):
+            return os.path.exists(self.url(commit))
+        try:
+            return requests.head(self.url(commit), allow_redirects=True, timeout=30).status_code == 200
+        except requests.RequestException:
+            return False
+
+    def wheel(self, commit):
+        """
+        获取安装包路径, 远程包下载到缓存后返回
+        """
+        if not self._is_remote(commit):
+            return self.url(commit)
+        whl_path = os.path.join(self.cache_dir, commit, self.whl)
+        if os.path.exists(whl_path):
+            return whl_path
+        os.makedirs(os.path.dirname(whl_path), exist_ok=True)
+        tmp_path = whl_path + ".{}.tmp".format(os.getpid())
+        with requests.get(self.url(commit), stream=True, timeout=300) as response:
+            response.raise_for_status()
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
+        os.replace(tmp_path, whl_path)
+        return whl_path
+
+    def target(self, commit):
+        """
+        获取commit对应的独立安装目录, 使用时将其加入 PYTHONPATH
+        """
+        site = os.path.join(self.cache_dir, commit, "site")
+        with self._commit_lock(commit):
+            if os.path.exists(os.path.join(site, ".done")):
+                return site
+            whl_path = self.wheel(commit)
+            tmp_site = site + ".{}.tmp".format(os.getpid())
+            shutil.rmtree(tmp_site, ignore_errors=True)
+            exit_code = subprocess.call(
+                [self.py_cmd, "-m", "pip", "install", "-q", "--no-deps", "--target", tmp_site, whl_path]
+            )
+            if exit_code != 0:
+                shutil.rmtree(tmp_site, ignore_errors=True)
+                raise RuntimeError("commit {} 安装包 {} 解压失败".format(commit, whl_path))
+            with open(os.path.join(tmp_site, ".done"), "w") as f:
+                f.write(whl_path)
+            shutil.rmtree(site, ignore_errors=True)
+            os.replace(tmp_site, site)
+        return site
+
+
+# 只影响二分流程(卡/并行数/结果与安装包缓存位置等), 不影响单次测试结果的环境变量
+ENV_SIGNATURE_IGNORE = ("PLT_BS_", "PLT_WHEEL_CACHE")
+
+
+@functools.lru_cache(maxsize=None)
+def machine_signature():
+    """
+    机器标识: 主机名与GPU型号/驱动版本, 无GPU或没有nvidia-smi时只有主机名
+    """
+    try:
+        gpus = subprocess.run(
+            ["nvidia-smi", "--query-gpu=name,driver_version", "--format=csv,noheader"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            timeout=60,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        gpus = ""
+    return [socket.gethostname(), sorted(set(gpus.splitlines()))]
+
+
+def env_signature(prefixes=("FLAGS_", "PLT_", "TESTING_MODE")):
+    """
+    影响测试结果的环境变量与机器签名, 不同机器或不同型号GPU上的结果不复用
+    """
+    items = sorted(
+        (k, v) for k, v in os.environ.items() if k.startswith(prefixes) and not k.startswith(ENV_SIGNATURE_IGNORE)
+    )
+    return hashlib.md5(json.dumps([items, machine_signature()]).encode()).hexdigest()[:12]
+
+
+class ProbeStore(object):
+    """
+    二分测试结果仓库, json文件保存, key为 子图|testing|模式|环境变量与机器签名|commit
+    只保存成功执行的测试结果, 执行异常(安装/超时/执行器异常等)不保存, 下次二分重新测试
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("PLT_BS_STORE", "binary_search_store.json")
+        self._lock = threading.Lock()
+        self._data = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self._data = json.load(f)
+
+    @staticmethod
+    def key(layerfile, testing, mode, commit):
+        """
+        结果key
+        """
+        return "|".join([layerfile, testing, mode, env_signature(), commit])
+
+    def get(self, key):
+        """
+        已有结果list
+        """
+        with self._lock:
+            return list(self._data.get(key, []))
+
+    def extend(self, key, samples):
+        """
+        追加结果并落盘
+        """
+        with self._lock:
+            self._data.setdefault(key, []).extend(samples)
+            tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+            with open(tmp_path, "w") as f:
+                json.dump(self._data, f)
+            os.replace(tmp_path, self.path)
+
+
+def perm_test(sample, reference, n_resamples=10000, seed=33):
+    """
+    单侧置换检验 H1: mean(sample) > mean(reference)
+    组合数不超过 n_resamples 时精确枚举, 否则随机抽样
+    :return: p值
+    """
+    sample = np.asarray(sample, dtype="float64")
+    reference = np.asarray(reference, dtype="float64")
+    pooled = np.concatenate([sample, reference])
+    n, total = len(sample), len(pooled)
+    observed = sample.mean() - reference.mean()
+    pooled_sum = pooled.sum()
+
+    def _diff(idx):
+        s = pooled[list(idx)].sum()
+        return s / n - (pooled_sum - s) / (total - n)
+
+    n_comb = 1
+    for i in range(n):
+        n_comb = n_comb * (total - i) // (i + 1)
+    if n_comb <= n_resamples:
+        diffs = np.array([_diff(idx) for idx in itertools.combinations(range(total), n)])
+        return float(np.mean(diffs >= observed - 1e-12))
+    rng = np.random.RandomState(seed)
+    hits = sum(_diff(rng.permutation(total)[:n]) >= observed - 1e-12 for _ in range(n_resamples))
+    return float(hits + 1) / (n_resamples + 1)
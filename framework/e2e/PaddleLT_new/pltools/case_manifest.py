@@ -0,0 +1,99 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+case manifest 增量测试清单: 记录子图hash/paddle commit/测试结果, 跳过上次通过且未变化的子图
+"""
+import os
+import json
+import hashlib
+
+
+class CaseManifest(object):
+    """
+    增量测试清单, 结构为 {testing yml: {子图路径: {"hash", "paddle_commit", "result"}}}
+    子图hash由 子图文件内容 + testing yml内容 + 执行器名称 计算
+    """
+
+    def __init__(self, testing, engine_list, manifest_file="plt_case_manifest.json"):
+        """
+        :param testing: testing yml路径
+        :param engine_list: 执行器名称list
+        :param manifest_file: 清单文件
+        """
+        self.testing = testing
+        self.manifest_file = manifest_file
+        self.manifest = self._load()
+
+        md5 = hashlib.md5()
+        with open(testing, "rb") as f:
+            md5.update(f.read())
+        md5.update(",".join(sorted(engine_list)).encode("utf-8"))
+        self._testing_md5 = md5.hexdigest()
+
+    def _load(self):
+        """
+        读取清单
+        """
+        if not os.path.exists(self.manifest_file):
+            return {}
+        try:
+            with open(self.manifest_file, "r") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def save(self):
+        """
+        保存清单
+        """
+        with open(self.manifest_file, "w") as f:
+            json.dump(self.manifest, f, indent=1)
+
+    def case_hash(self, py_file):
+        """
+        子图hash
+        """
+        md5 = hashlib.md5(self._testing_md5.encode("utf-8"))
+        with open(py_file, "rb") as f:
+            md5.update(f.read())
+        return md5.hexdigest()
+
+    def select(self, py_list, paddle_commit):
+        """
+        筛选需要测试的子图
+        :param py_list: 子图路径list
+        :param paddle_commit: 当前paddle commit
+        :return: (需要测试的子图list, 跳过的子图list)
+        """
+        records = self.manifest.get(self.testing, {})
+        todo = []
+        skipped = []
+        for py_file in py_list:
+            record = records.get(py_file)
+            if (
+                record is not None
+                and record.get("result") == "pass"
+                and record.get("paddle_commit") == paddle_commit
+                and record.get("hash") == self.case_hash(py_file)
+            ):
+                skipped.append(py_file)
+            else:
+                todo.append(py_file)
+        return todo, skipped
+
+    def update(self, py_list, error_list, paddle_commit):
+        """
+        记录本次测试结果
+        :param py_list: 本次测试的子图list
+        :param error_list: 失败(含core dump)的子图list
+        :param paddle_commit: 当前paddle commit
+        """
+        error_set = set(error_list)
+        records = self.manifest.setdefault(self.testing, {})
+        for py_file in py_list:
+            records[py_file] = {
+                "hash": self.case_hash(py_file),
+                "paddle_commit": paddle_commit,
+                "result": "fail" if py_file in error_set else "pass",
+            }
@@ -0,0 +1,161 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+case scheduler 子图调度: 历史耗时/内存记录 + LPT装箱 + 跨设备work stealing
+"""
+import os
+import json
+import heapq
+import threading
+import multiprocessing
+
+import numpy as np
+
+
+class CaseHistory(object):
+    """
+    子图历史运行记录, 保存每个子图的耗时(秒)与峰值内存(MB)
+    """
+
+    def __init__(self, history_file="plt_case_history.json"):
+        """
+        :param history_file: 历史记录文件
+        """
+        self.history_file = history_file
+        self.history = self._load()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """
+        读取历史记录
+        """
+        if not os.path.exists(self.history_file):
+            return {}
+        try:
+            with open(self.history_file, "r") as f:
+                history = json.load(f)
+        except Exception:
+            return {}
+        return {k: v for k, v in history.items() if isinstance(v, dict)}
+
+    def save(self):
+        """
+        保存历史记录
+        """
+        try:
+            with open(self.history_file, "w") as f:
+                json.dump(self.history, f)
+        except Exception as e:
+            print(e)
+
+    def record(self, py_file, cost, peak_mem=None):
+        """
+        记录单个子图运行结果, 线程安全
+        :param py_file: 子图路径
+        :param cost: 耗时(秒)
+        :param peak_mem: 峰值内存(MB), 未知时沿用历史值
+        """
+        with self._lock:
+            item = self.history.setdefault(py_file, {})
+            item["cost"] = cost
+            if peak_mem is not None:
+                item["peak_mem"] = peak_mem
+
+    def update(self, records):
+        """
+        合并其他进程的运行记录
+        """
+        with self._lock:
+            for py_file, item in records.items():
+                self.history.setdefault(py_file, {}).update(item)
+
+    def cost(self, py_file):
+        """
+        子图预估耗时, 无记录时取已知耗时的中位数
+        """
+        if py_file in self.history and "cost" in self.history[py_file]:
+            return self.history[py_file]["cost"]
+        costs = [item["cost"] for item in self.history.values() if "cost" in item]
+        if not costs:
+            return 1.0
+        return float(np.median(costs))
+
+    def auto_worker_num(self, default=13):
+        """
+        根据当前可用内存与子图峰值内存(P90)估计并发数, 无内存记录时返回default
+        """
+        mems = [item["peak_mem"] for item in self.history.values() if item.get("peak_mem")]
+        if not mems or not hasattr(os, "sysconf"):
+            return default
+        try:
+            avail_mb = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+        except (ValueError, OSError):
+            return default
+        peak = float(np.percentile(mems, 90))
+        return max(1, min(os.cpu_count() or 1, int(avail_mb * 0.8 / peak)))
+
+
+def lpt_split(lst, n, cost_func):
+    """
+    LPT(longest processing time first)装箱: 按预估耗时降序, 依次放入当前总耗时最小的分片
+    Args:
+        lst (list): 待划分的子图列表
+        n (int): 划分的份数
+        cost_func (func): 输入子图, 返回预估耗时
+    Returns:
+        res (list): 划分后的列表, 每个分片内按预估耗时降序
+    """
+    if not isinstance(lst, list) or not isinstance(n, int) or len(lst) == 0 or n <= 0:
+        return []
+    res = [[] for _ in range(n)]
+    heap = [(0.0, i) for i in range(n)]
+    for item in sorted(lst, key=cost_func, reverse=True):
+        load, index = heapq.heappop(heap)
+        res[index].append(item)
+        heapq.heappush(heap, (load + cost_func(item), index))
+    return res
+
+
+class ShardQueues(object):
+    """
+    跨进程/线程共享的分片队列, fork前创建:
+    1. 每个分片的owner从队头领取(耗时长的子图优先)
+    2. 自身分片耗尽后, 从剩余最多的分片队尾窃取(耗时短的子图)
+    """
+
+    def __init__(self, shards, ctx=multiprocessing):
+        """
+        :param shards: lpt_split 的结果
+        :param ctx: multiprocessing context
+        """
+        self.shards = shards
+        bounds = []
+        for shard in shards:
+            bounds.extend([0, len(shard)])
+        self.bounds = ctx.Array("i", bounds, lock=False)
+        self.lock = ctx.Lock()
+
+    def next(self, index):
+        """
+        第index个分片领取下一个子图, 全部耗尽时返回None
+        """
+        with self.lock:
+            head, tail = self.bounds[2 * index], self.bounds[2 * index + 1]
+            if head < tail:
+                self.bounds[2 * index] = head + 1
+                return self.shards[index][head]
+
+            remains = [self.bounds[2 * i + 1] - self.bounds[2 * i] for i in range(len(self.shards))]
+            victim = int(np.argmax(remains))
+            if remains[victim] <= 0:
+                return None
+            tail = self.bounds[2 * victim + 1] - 1
+            self.bounds[2 * victim + 1] = tail
+            return self.shards[victim][tail]
+
+    def iter(self, index):
+        """
+        第index个分片的子图迭代器(含窃取)
+        """
+        return iter(lambda: self.next(index), None)
@@ -27,45 +27,39 @@ class CaseSelect(object):
         self.dirpath = dirpath
         self.ignore_list = ignore_list
 
-    def get_yaml_list(self, base_path, yaml_list=[]):
+    def get_yaml_list(self, base_path, yaml_list=None):
         """递归寻找文件夹内所有的yml文件路径"""
-        file_list = os.listdir(base_path)
-
-        for file in file_list:
-            yaml_path = os.path.join(base_path, file)
-
-            if os.path.isdir(yaml_path):
-                self.get_yaml_list(yaml_path, yaml_list)
-            else:
-                if not file.endswith(".yml"):
-                    continue
-                else:
+        if yaml_list is None:
+            yaml_list = []
+        with os.scandir(base_path) as entries:
+            for entry in entries:
+                yaml_path = os.path.join(base_path, entry.name)
+                if entry.is_dir():
+                    self.get_yaml_list(yaml_path, yaml_list)
+                elif entry.name.endswith(".yml"):
                     yaml_list.append(yaml_path)
         return yaml_list
 
-    def get_py_list(self, base_path, py_list=[]):
-        """递归寻找文件夹内所有的子图py文件路径"""
-        file_list = os.listdir(base_path)
-
-        for file in file_list:
-            py_path = os.path.join(base_path, file)
-
-            if os.path.isdir(py_path):
-                self.get_py_list(py_path, py_list)
-            else:
-                if self.ignore_list:
-                    if (
-                        not file.endswith(".py")
-                        or file.endswith("__init__.py")
-                        or file.endswith("utils.py")
-                        or py_path in self.ignore_list
+    def get_py_list(self, base_path, py_list=None):
+        """递归寻找文件夹内所有的子图py文件路径, 单次scandir遍历, 无需额外stat"""
+        if py_list is None:
+            py_list = []
+        ignore_set = set(self.ignore_list) if self.ignore_list else set()
+        stack = [base_path]
+        while stack:
+            dirpath = stack.pop()
+            with os.scandir(dirpath) as entries:
+                sub_dirs = []
+                for entry in entries:
+                    py_path = os.path.join(dirpath, entry.name)
+                    if entry.is_dir():
+                        sub_dirs.append(py_path)
+                    elif (
+                        entry.name.endswith(".py")
+                        and not entry.name.endswith("__init__.py")
+                        and not entry.name.endswith("utils.py")
+                        and py_path not in ignore_set
                     ):
-                        continue
-                    else:
-                        py_list.append(py_path)
-                else:
-                    if not file.endswith(".py") or file.endswith("__init__.py") or file.endswith("utils.py"):
-                        continue
-                    else:
                         py_list.append(py_path)
+            stack.extend(reversed(sub_dirs))
         return py_list
@@ -0,0 +1,236 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+fork executor 进程内子图执行器: 常驻forkserver只加载一次 paddle 与 LayerTest, 每个子图由其 fork 独立子进程执行
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import resource
+import traceback
+import multiprocessing
+import multiprocessing.connection
+
+# 当前forkserver的 (启动进程pid, CUDA_VISIBLE_DEVICES)
+_SERVER_KEY = None
+
+
+def case_description(layerfile):
+    """
+    allure报告中的用例描述, 记录pts/commit/wheel以及FLAGS_/PLT_环境变量
+    """
+    flags_str = ""
+    flags_str += f"pts_id={os.environ.get('pts_id', 'None')};"
+    flags_str += "\n"
+    flags_str += (
+        f"case_url=https://github.com/PaddlePaddle/PaddleTest/blob/develop/framework/e2e/PaddleLT_new/{layerfile}"
+    )
+    flags_str += "\n"
+    flags_str += f"paddle_commit={os.environ.get('paddle_commit', 'None')};"
+    flags_str += "\n"
+    flags_str += (
+        f"wheel_url={os.environ.get('wheel_url', 'None').replace('latest', os.environ.get('paddle_commit', 'None'))};"
+    )
+    flags_str += "\n"
+    for key, value in os.environ.items():
+        if key.startswith("FLAGS_"):
+            flags_str = flags_str + key + "=" + value + ";"
+            flags_str += "\n"
+    flags_str += f"TESTING={os.environ.get('TESTING', 'None')};"
+    flags_str += f"CUDA_VISIBLE_DEVICES={os.environ.get('CUDA_VISIBLE_DEVICES', 'None')};"
+    flags_str += f"FRAMEWORK={os.environ.get('FRAMEWORK', 'None')};"
+    flags_str += f"USE_PADDLE_MODEL={os.environ.get('USE_PADDLE_MODEL', 'None')};"
+    flags_str += f"docker_image={os.environ.get('docker_image', 'None')};"
+    flags_str += "\n"
+    for key, value in os.environ.items():
+        if key.startswith("PLT_"):
+            flags_str = flags_str + key + "=" + value + ";"
+    return flags_str
+
+
+def _case_child(py_file, testing, device_place_id, conn):
+    """
+    子进程: 执行单个子图精度测试, 通过管道回传结果
+    峰值内存为相对fork时的增量, 不计入从forkserver继承的写时复制页面
+    """
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    import layertest
+
+    title = py_file.replace(".py", "").replace("/", "^").replace(".", "^")
+    result = {"status": "passed", "message": "", "trace": "", "start": int(time.time() * 1000)}
+    try:
+        single_test = layertest.LayerTest(
+            title=title, layerfile=py_file, testing=testing, device_place_id=device_place_id
+        )
+        single_test._case_run()
+    except AssertionError as e:
+        result.update(status="failed", message=repr(e), trace=traceback.format_exc())
+    except BaseException as e:
+        result.update(status="broken", message=repr(e), trace=traceback.format_exc())
+    result["stop"] = int(time.time() * 1000)
+    result["peak_mem"] = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss, 0) / 1024
+    conn.send(result)
+    conn.close()
+
+
+def _forkserver_context(preload):
+    """
+    forkserver上下文. forkserver是全新的解释器, 启动时继承当前环境变量(CUDA_VISIBLE_DEVICES等)并预加载模块,
+    子图进程均由其fork, 调用方进程中已import的paddle及已初始化的设备状态不会带入子图进程.
+    forkserver每个进程只启动一次且没有重启的公开接口, 已启动的forkserver与当前环境不一致时
+    (当前进程由已启动forkserver的进程fork而来, 或 CUDA_VISIBLE_DEVICES 已变化), 退回spawn: 每个子图在新解释器中执行, 不预加载
+    """
+    global _SERVER_KEY
+    key = (os.getpid(), os.environ.get("CUDA_VISIBLE_DEVICES"))
+    if _SERVER_KEY is not None and _SERVER_KEY != key:
+        return multiprocessing.get_context("spawn")
+    _SERVER_KEY = key
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload(preload)
+    return ctx
+
+
+class ForkExecutor(object):
+    """
+    fork执行器, 替代 每个子图一次 python -m pytest 的执行方式:
+    1. forkserver预先import paddle/engine/LayerTest, 子进程fork后直接执行, 省去解释器启动/框架加载/pytest收集
+    2. 子进程结果通过独立管道回传, 由父进程写出allure result json
+    3. 子进程崩溃(core dump)或超时均记到对应子图, 与pytest方式一致, 崩溃子图不写入allure报告
+    注意: forkserver在首次run时启动并继承当时的环境变量, CUDA_VISIBLE_DEVICES 需在此之前设置;
+    父进程(如已import paddle的run.py)的状态不会进入子进程
+    """
+
+    def __init__(self, testing, report_dir, timeout=None, max_workers=1, device_place_id=0, logger=None):
+        """
+        :param testing: 执行器配置yml
+        :param report_dir: allure结果目录
+        :param timeout: 单子图超时时间(秒), None表示不限时
+        :param max_workers: 同时执行的子进程数
+        :param device_place_id: device place id
+        :param logger: Logger.get_log()
+        """
+        self.testing = testing
+        self.report_dir = report_dir
+        self.timeout = timeout
+        self.max_workers = max(int(max_workers), 1)
+        self.device_place_id = device_place_id
+        self.logger = logger
+
+    def preload_modules(self):
+        """
+        forkserver预加载的模块, fork后子进程共享
+        """
+        if os.environ.get("FRAMEWORK") == "torch":
+            return ["layertest", "engine.torch_engine_map"]
+        return ["layertest", "engine.paddle_engine_map"]
+
+    def _log(self, level, msg):
+        """
+        日志
+        """
+        if self.logger is None:
+            print(msg)
+        else:
+            getattr(self.logger, level)(msg)
+
+    def _allure_save(self, py_file, result):
+        """
+        写出与 PaddleLT.py 中 allure.dynamic 一致的 allure result json
+        """
+        title = py_file.replace(".py", "").replace("/", "^").replace(".", "^")
+        if not os.path.exists(self.report_dir):
+            os.makedirs(self.report_dir)
+        case_uuid = str(uuid.uuid4())
+        allure_result = {
+            "uuid": case_uuid,
+            "historyId": hashlib.md5(title.encode("utf-8")).hexdigest(),
+            "name": title,
+            "fullName": "PaddleLT#test_module_layer",
+            "status": result["status"],
+            "statusDetails": {"message": result["message"], "trace": result["trace"]},
+            "description": case_description(py_file),
+            "start": result["start"],
+            "stop": result["stop"],
+            "labels": [{"name": "feature", "value": "case"}, {"name": "framework", "value": "pytest"}],
+        }
+        with open(os.path.join(self.report_dir, "{}-result.json".format(case_uuid)), "w") as f:
+            json.dump(allure_result, f, ensure_ascii=False)
+
+    def run(self, py_list, on_result=None):
+        """
+        执行所有子图
+        :param py_list: 子图路径list, 也可以是按需产出子图的迭代器(如 ShardQueues.iter)
+        :param on_result: 可选回调, 每个子图结束后调用 on_result(py_file, exit_code, cost, peak_mem)
+        :return: error_dict, key为子图路径, value为退出码(失败为1, 超时为-1, 崩溃为负的信号值)
+        """
+        ctx = _forkserver_context(self.preload_modules())
+        if ctx.get_start_method() == "spawn":
+            self._log("warning", "已启动的forkserver环境与当前不一致, 子图改为spawn新解释器执行")
+        cases = iter(py_list)
+        exhausted = False
+        running = {}
+        error_dict = {}
+        while not exhausted or running:
+            while not exhausted and len(running) < self.max_workers:
+                py_file = next(cases, None)
+                if py_file is None:
+                    exhausted = True
+                    break
+                self._log("info", f"开始测试子图 {py_file}, fork子进程执行~~")
+                parent_conn, child_conn = ctx.Pipe(duplex=False)
+                p = ctx.Process(
+                    target=_case_child, args=(py_file, self.testing, self.device_place_id, child_conn), daemon=True
+                )
+                p.start()
+                child_conn.close()
+                start = time.time()
+                deadline = None if self.timeout is None else start + self.timeout
+                running[parent_conn] = (py_file, p, start, deadline)
+
+            if not running:
+                break
+            wait_timeout = None
+            deadlines = [d for _, _, _, d in running.values() if d is not None]
+            if deadlines:
+                wait_timeout = max(min(deadlines) - time.time(), 0)
+            ready = multiprocessing.connection.wait(list(running.keys()), timeout=wait_timeout)
+
+            for conn in ready:
+                done_file, p, start, _ = running.pop(conn)
+                try:
+                    result = conn.recv()
+                except EOFError:
+                    result = None
+                conn.close()
+                p.join()
+                exit_code = 0
+                if result is None:
+                    # 子进程未回传结果即退出, 视为core dump
+                    exit_code = p.exitcode if p.exitcode else 1
+                    self._log("warning", f"{done_file} 子进程异常退出, exit code: {p.exitcode}")
+                else:
+                    self._allure_save(done_file, result)
+                    if result["status"] != "passed":
+                        exit_code = 1
+                    self._log("info", f"完成测试子图 {done_file}, 结果: {result['status']}")
+                if exit_code != 0:
+                    error_dict[done_file] = exit_code
+                if on_result is not None:
+                    peak_mem = None if result is None else result["peak_mem"]
+                    on_result(done_file, exit_code, time.time() - start, peak_mem)
+
+            now = time.time()
+            for conn, (done_file, p, start, deadline) in list(running.items()):
+                if deadline is not None and now >= deadline and conn not in ready:
+                    self._log("warning", f"{done_file} Command timed out after {self.timeout} seconds")
+                    p.terminate()
+                    p.join()
+                    conn.close()
+                    del running[conn]
+                    error_dict[done_file] = -1
+                    if on_result is not None:
+                        on_result(done_file, -1, now - start, None)
+        return error_dict
@@ -0,0 +1,385 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+gt store 内容寻址的精度真值(ground truth)仓库:
+以 子图文件md5 + testing 为key, tensor存为 .npy 并以 mmap 方式加载, 支持并行下载/上传
+"""
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from pltools.res_save import download_sth
+
+
+def file_md5(file_path):
+    """
+    文件md5
+    """
+    md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def _flatten(data, arrays):
+    """
+    将嵌套结构拆分为 结构描述(可json化) 与 ndarray列表
+    """
+    if data is None or isinstance(data, (bool, int, float, str)):
+        return {"type": "value", "value": data}
+    if isinstance(data, np.ndarray) or callable(getattr(data, "numpy", None)):
+        arrays.append(np.ascontiguousarray(data if isinstance(data, np.ndarray) else data.numpy()))
+        return {"type": "array", "index": len(arrays) - 1}
+    if isinstance(data, np.generic):
+        arrays.append(np.asarray(data))
+        return {"type": "array", "index": len(arrays) - 1}
+    if isinstance(data, dict):
+        return {"type": "dict", "items": [[k, _flatten(v, arrays)] for k, v in data.items()]}
+    if isinstance(data, (list, tuple)):
+        return {"type": type(data).__name__, "items": [_flatten(v, arrays) for v in data]}
+    raise TypeError("gt store unsupported data type: {}".format(type(data)))
+
+
+def _unflatten(struct, arrays):
+    """
+    _flatten 的逆过程
+    """
+    if struct["type"] == "value":
+        return struct["value"]
+    if struct["type"] == "array":
+        return arrays[struct["index"]]
+    if struct["type"] == "dict":
+        return {k: _unflatten(v, arrays) for k, v in struct["items"]}
+    items = [_unflatten(v, arrays) for v in struct["items"]]
+    return tuple(items) if struct["type"] == "tuple" else items
+
+
+class GTStore(object):
+    """
+    本地真值仓库, 目录结构:
+    root/index.json                       所有条目的文件md5索引
+    root/{testing}/{case_md5}/meta.json   嵌套结构描述与各文件md5
+    root/{testing}/{case_md5}/arr_{i}.npy 各tensor数据
+    其中 {case_md5} 为指向 .{case_md5}.{版本} 目录的软链接, 更新条目时原子替换软链接
+    远端(bos/http/本地目录)保持相同结构(无软链接)
+    """
+
+    INDEX = "index.json"
+    META = "meta.json"
+
+    def __init__(self, root, max_workers=8):
+        """
+        :param root: 本地仓库根目录, 一般为 plt_gt/{device} 或 plt_gt_baseline/{device}
+        :param max_workers: 并行下载/上传的线程数
+        """
+        self.root = root
+        self.max_workers = max_workers
+
+    def key(self, testing, layerfile):
+        """
+        条目key: testing/子图文件md5, 子图文件改动后自动失效
+        """
+        return "{}/{}".format(testing, file_md5(layerfile))
+
+    def _entry_dir(self, key):
+        """
+        条目目录
+        """
+        return os.path.join(self.root, *key.split("/"))
+
+    def _read_meta(self, key):
+        """
+        读取条目meta, 不存在时返回None
+        """
+        meta_file = os.path.join(self._entry_dir(key), self.META)
+        if not os.path.exists(meta_file):
+            return None
+        with open(meta_file, "r") as f:
+            return json.load(f)
+
+    def has(self, testing, layerfile):
+        """
+        是否已有该条目
+        """
+        return self._read_meta(self.key(testing, layerfile)) is not None
+
+    def save(self, data, testing, layerfile):
+        """
+        保存真值, 先写临时目录再整体rename, 多进程并发写入安全
+        :param data: tensor或由dict/list/tuple嵌套的tensor
+        :param testing: 执行器名称
+        :param layerfile: 子图文件路径
+        """
+        key = self.key(testing, layerfile)
+        entry_dir = self._entry_dir(key)
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp", dir=os.path.dirname(entry_dir))
+
+        arrays = []
+        struct = _flatten(data, arrays)
+        files = {}
+        for i, array in enumerate(arrays):
+            name = "arr_{}.npy".format(i)
+            np.save(os.path.join(tmp_dir, name), array)
+            files[name] = file_md5(os.path.join(tmp_dir, name))
+        meta = {"layerfile": layerfile, "testing": testing, "struct": struct, "files": files}
+        with open(os.path.join(tmp_dir, self.META), "w") as f:
+            json.dump(meta, f)
+        self._swap_in(tmp_dir, entry_dir)
+        return key
+
+    @staticmethod
+    def _swap_in(tmp_dir, entry_dir):
+        """
+        将写好的临时目录发布为条目: 改名为版本目录后原子替换条目软链接, 读者始终能看到完整的旧条目或新条目.
+        保留被替换的上一版本(可能仍有读者在读), 更早的版本删除
+        """
+        parent, name = os.path.split(entry_dir)
+        version = ".{}.{}".format(name, uuid.uuid4().hex)
+        os.rename(tmp_dir, os.path.join(parent, version))
+        link_tmp = os.path.join(parent, version + ".lnk")
+        os.symlink(version, link_tmp)
+
+        previous = None
+        if os.path.islink(entry_dir):
+            previous = os.readlink(entry_dir)
+        elif os.path.isdir(entry_dir):
+            # 旧格式的实体目录, 移走后再替换(仅迁移时存在一次短暂窗口)
+            previous = version + ".legacy"
+            os.rename(entry_dir, os.path.join(parent, previous))
+        os.replace(link_tmp, entry_dir)
+
+        for other in os.listdir(parent):
+            if other.startswith(".{}.".format(name)) and other not in (version, previous):
+                shutil.rmtree(os.path.join(parent, other), ignore_errors=True)
+
+    def load(self, testing, layerfile, mmap=True):
+        """
+        加载真值, 默认以只读mmap方式加载各tensor, 对比时零拷贝读取
+        """
+        key = self.key(testing, layerfile)
+        meta = self._read_meta(key)
+        if meta is None:
+            raise FileNotFoundError("gt of {} not found in {}".format(key, self.root))
+        entry_dir = self._entry_dir(key)
+        arrays = [
+            np.load(os.path.join(entry_dir, "arr_{}.npy".format(i)), mmap_mode="r" if mmap else None)
+            for i in range(len(meta["files"]))
+        ]
+        return _unflatten(meta["struct"], arrays)
+
+    def build_index(self):
+        """
+        扫描所有条目生成索引 {key: {文件名: md5}}, 并写入 root/index.json
+        """
+        index = {}
+        if os.path.exists(self.root):
+            for testing in os.listdir(self.root):
+                testing_dir = os.path.join(self.root, testing)
+                if testing.startswith(".") or not os.path.isdir(testing_dir):
+                    continue
+                for case_md5 in os.listdir(testing_dir):
+                    if case_md5.startswith("."):  # 版本目录与临时目录
+                        continue
+                    key = "{}/{}".format(testing, case_md5)
+                    meta = self._read_meta(key)
+                    if meta is not None:
+                        index[key] = meta["files"]
+            with open(os.path.join(self.root, self.INDEX), "w") as f:
+                json.dump(index, f)
+        return index
+
+    def _is_fresh(self, key, files):
+        """
+        本地条目是否完整且与给定md5一致
+        """
+        meta = self._read_meta(key)
+        if meta is None or meta["files"] != files:
+            return False
+        entry_dir = self._entry_dir(key)
+        return all(os.path.exists(os.path.join(entry_dir, name)) for name in files)
+
+    @staticmethod
+    def _local_remote(remote):
+        """
+        远端为本地目录(file://前缀或已存在的目录)时返回目录路径, 否则返回None
+        """
+        if remote.startswith("file://"):
+            return remote[len("file://") :]
+        if os.path.isdir(remote):
+            return remote
+        return None
+
+    @staticmethod
+    def _http_remote(remote):
+        """
+        远端的http下载地址. bos路径 {bucket}/{path} 对应 https://{bucket}.{PLT_BOS_HOST}/{path}
+        """
+        if remote.startswith(("http://", "https://")):
+            return remote.rstrip("/")
+        bucket, _, path = remote.strip("/").partition("/")
+        host = os.environ.get("PLT_BOS_HOST", "bj.bcebos.com")
+        return "https://{}.{}/{}".format(bucket, host, path).rstrip("/")
+
+    def _remote_get(self, remote, rel_path, output_path):
+        """
+        从远端获取单个文件, bos路径通过http下载地址读取
+        """
+        local = self._local_remote(remote)
+        if local is not None:
+            shutil.copyfile(os.path.join(local, rel_path), output_path)
+        else:
+            download_sth(gt_url="{}/{}".format(self._http_remote(remote), rel_path), output_path=output_path)
+
+    def _remote_put(self, remote, rel_path, file_path, uploader=None):
+        """
+        上传单个文件到远端
+        """
+        local = self._local_remote(remote)
+        if local is not None:
+            os.makedirs(os.path.dirname(os.path.join(local, rel_path)), exist_ok=True)
+            shutil.copyfile(file_path, os.path.join(local, rel_path))
+        else:
+            uploader.upload_to_bos(bos_path=os.path.join(remote, os.path.dirname(rel_path)), file_path=file_path)
+
+    def remote_index(self, remote):
+        """
+        获取远端索引, 远端尚无索引(本地目录中不存在或http 404)时返回空dict,
+        其他读取失败(网络/权限/内容损坏)抛出异常, 不能当作空索引处理
+        """
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(prefix=".index", dir=self.root)
+        os.close(fd)
+        try:
+            self._remote_get(remote, self.INDEX, tmp_file)
+            with open(tmp_file, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                return {}
+            raise
+        finally:
+            os.remove(tmp_file)
+
+    def _fetch_entry(self, remote, key, files):
+        """
+        下载单个条目, 先下载到临时目录再整体rename
+        """
+        entry_dir = self._entry_dir(key)
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp", dir=os.path.dirname(entry_dir))
+        try:
+            for name in list(files.keys()) + [self.META]:
+                self._remote_get(remote, "{}/{}".format(key, name), os.path.join(tmp_dir, name))
+                if name in files and file_md5(os.path.join(tmp_dir, name)) != files[name]:
+                    raise Exception("md5 mismatch: {}/{}".format(key, name))
+            self._swap_in(tmp_dir, entry_dir)
+            return True
+        except Exception as e:
+            print("gt fetch {} failed: {}".format(key, e))
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+
+    def fetch(self, remote, testings, py_list):
+        """
+        并行下载所需真值, 本地已存在且未变化的条目跳过
+        :param remote: 远端根路径, http(s) url 或本地目录
+        :param testings: 执行器名称list
+        :param py_list: 子图文件list
+        :return: dict, fetched/skipped/missing/failed 计数
+        """
+        res = {"fetched": 0, "skipped": 0, "missing": 0, "failed": 0}
+        try:
+            index = self.remote_index(remote)
+        except Exception as e:
+            print("gt remote index of {} unreadable: {}".format(remote, e))
+            res["failed"] = len(testings) * len(py_list)
+            return res
+        todo = []
+        for testing in testings:
+            for py_file in py_list:
+                key = self.key(testing, py_file)
+                if key not in index:
+                    res["missing"] += 1
+                elif self._is_fresh(key, index[key]):
+                    res["skipped"] += 1
+                else:
+                    todo.append(key)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for ok in executor.map(lambda k: self._fetch_entry(remote, k, index[k]), todo):
+                res["fetched" if ok else "failed"] += 1
+        return res
+
+    def upload(self, remote, uploader=None):
+        """
+        并行上传本地条目, 远端索引中已存在且未变化的条目跳过, 最后上传合并后的索引
+        远端索引读取失败时放弃本次上传, 避免用本次的条目覆盖远端已有索引
+        :param remote: 远端根路径, bos路径或本地目录
+        :param uploader: UploadBos实例, 远端为本地目录时可为None
+        :return: dict, uploaded/skipped/failed 计数, index为索引上传状态(uploaded/aborted)
+        """
+        local_index = self.build_index()
+        try:
+            remote_index = self.remote_index(remote)
+        except Exception as e:
+            print("gt remote index of {} unreadable, upload aborted: {}".format(remote, e))
+            return {"uploaded": 0, "skipped": 0, "failed": len(local_index), "index": "aborted"}
+        todo = [key for key, files in local_index.items() if remote_index.get(key) != files]
+        res = {"uploaded": 0, "skipped": len(local_index) - len(todo), "failed": 0}
+
+        def _upload_entry(key):
+            """上传单个条目"""
+            try:
+                for name in list(local_index[key].keys()) + [self.META]:
+                    rel_path = "{}/{}".format(key, name)
+                    self._remote_put(remote, rel_path, os.path.join(self._entry_dir(key), name), uploader)
+                return True
+            except Exception as e:
+                print("gt upload {} failed: {}".format(key, e))
+                return False
+
+        uploaded = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for key, ok in zip(todo, executor.map(_upload_entry, todo)):
+                if ok:
+                    res["uploaded"] += 1
+                    uploaded[key] = local_index[key]
+                else:
+                    res["failed"] += 1
+
+        # 上传条目期间远端索引可能已被其他任务更新, 写入前重新读取并合并
+        try:
+            remote_index = self.remote_index(remote)
+        except Exception as e:
+            print("gt remote index of {} unreadable, index upload aborted: {}".format(remote, e))
+            res["index"] = "aborted"
+            return res
+        remote_index.update(uploaded)
+
+        merged_index = os.path.join(self.root, ".remote_" + self.INDEX)
+        with open(merged_index, "w") as f:
+            json.dump(remote_index, f)
+        local = self._local_remote(remote)
+        if local is not None:
+            shutil.copyfile(merged_index, os.path.join(local, self.INDEX))
+        else:
+            # bos以文件名为object key, 先重命名为index.json再上传
+            index_file = os.path.join(tempfile.mkdtemp(prefix=".tmp", dir=self.root), self.INDEX)
+            shutil.copyfile(merged_index, index_file)
+            uploader.upload_to_bos(bos_path=remote, file_path=index_file)
+            shutil.rmtree(os.path.dirname(index_file), ignore_errors=True)
+        os.remove(merged_index)
+        res["index"] = "uploaded"
+        return res
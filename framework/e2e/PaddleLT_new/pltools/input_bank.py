@@ -0,0 +1,301 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+子图输入数据仓库
+create_numpy_inputs() 的结果按 函数源码+其调用的工具函数源码+引用的常量+调用时numpy随机数状态 计算key,
+首次调用时保存为 .npy, 之后各engine(以及源码相同的torch case)直接以只读 np.memmap 视图加载,
+并把随机数状态恢复到生成之后的状态, 与重新生成的数据及后续随机数序列逐位一致
+目录结构: {bank_dir}/{key}/meta.json, {bank_dir}/{key}/{i}.npy
+仓库按最近使用时间清理: 超过 PLT_INPUT_BANK_MAX_DAYS 天未使用的数据删除, 总大小超过 PLT_INPUT_BANK_DIR_MAX_MB 时
+从最久未使用的开始删除
+"""
+import os
+import json
+import time
+import types
+import shutil
+import inspect
+import hashlib
+import sysconfig
+import threading
+
+import numpy as np
+
+_JSON_TYPES = (bool, int, float, str, type(None))
+
+
+class _Unbankable(Exception):
+    """
+    输入中含有无法保存的对象
+    """
+
+
+def _rng_digest(state):
+    """
+    numpy全局随机数状态摘要
+    """
+    h = hashlib.md5()
+    h.update(state[0].encode())
+    h.update(np.ascontiguousarray(state[1]).tobytes())
+    h.update(repr(tuple(state[2:])).encode())
+    return h.hexdigest()
+
+
+# 标准库与第三方库中的函数不计入key, 版本变化由 np.__version__ 体现
+_LIB_PATHS = tuple(
+    os.path.join(os.path.abspath(p), "")
+    for p in {sysconfig.get_paths()[name] for name in ["stdlib", "platstdlib", "purelib", "platlib"]}
+)
+
+
+def _code_names(code):
+    """
+    代码中引用的全局名字, 包含嵌套函数/lambda/推导式中的
+    """
+    names = list(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names.extend(_code_names(const))
+    return names
+
+
+def _referenced_funcs(func, names):
+    """
+    func引用的项目内函数, 包括 module.func 形式引用的
+    """
+    funcs = []
+    for name in names:
+        value = func.__globals__.get(name)
+        if isinstance(value, types.ModuleType):
+            funcs.extend(getattr(value, attr, None) for attr in names)
+        else:
+            funcs.append(value)
+    return [
+        f for f in funcs if inspect.isfunction(f) and not os.path.abspath(f.__code__.co_filename).startswith(_LIB_PATHS)
+    ]
+
+
+def _func_signature(func):
+    """
+    函数源码, 其(递归)调用的项目内工具函数源码, 以及引用的模块级常量
+    """
+    parts = []
+    seen = set()
+    pending = [func]
+    while pending:
+        f = pending.pop(0)
+        if f.__code__ in seen:
+            continue
+        seen.add(f.__code__)
+        try:
+            source = inspect.getsource(f)
+        except (OSError, TypeError):
+            return None
+        names = _code_names(f.__code__)
+        consts = []
+        for name in names:
+            value = f.__globals__.get(name)
+            if isinstance(value, _JSON_TYPES + (tuple, list, dict)):
+                consts.append((name, repr(value)))
+        parts.append(source + repr(consts))
+        pending.extend(_referenced_funcs(f, names))
+    return "\n".join(parts)
+
+
+class InputBank(object):
+    """
+    输入数据仓库
+    """
+
+    def __init__(self, bank_dir=None):
+        """
+        :param bank_dir: 保存目录, 默认 PLT_INPUT_BANK_DIR 或 ./input_bank
+        """
+        self.enable = os.environ.get("PLT_INPUT_BANK", "True") == "True"
+        self.bank_dir = bank_dir or os.environ.get("PLT_INPUT_BANK_DIR", os.path.join(os.getcwd(), "input_bank"))
+        # 超过该大小(MB)的输入不落盘, 每次重新生成
+        self.max_bytes = float(os.environ.get("PLT_INPUT_BANK_MAX_MB", "2048")) * 1024 * 1024
+        # 仓库总大小(MB)与未使用天数上限, 写入新数据时清理
+        self.max_dir_bytes = float(os.environ.get("PLT_INPUT_BANK_DIR_MAX_MB", "20480")) * 1024 * 1024
+        self.max_age = float(os.environ.get("PLT_INPUT_BANK_MAX_DAYS", "7")) * 24 * 3600
+        self._loaded = {}
+        self._lock = threading.Lock()
+        # 本进程上次清理后写入的字节数, None表示本进程尚未清理
+        self._written = None
+
+    def case_key(self, func):
+        """
+        当前随机数状态下func结果的key, 无法获取源码时返回None
+        """
+        signature = _func_signature(func)
+        if signature is None:
+            return None
+        h = hashlib.md5()
+        h.update(signature.encode())
+        h.update(np.__version__.encode())
+        h.update(_rng_digest(np.random.get_state()).encode())
+        return h.hexdigest()
+
+    def load(self, func):
+        """
+        获取func()的结果, ndarray为只读视图
+
+        :param func: 子图case的 create_numpy_inputs
+        :return: (key, 输入数据), 未使用仓库时key为None, 数据为func()的原始结果
+        """
+        key = self.case_key(func) if self.enable else None
+        if key is None:
+            return None, func()
+        with self._lock:
+            cached = self._loaded.get(key)
+        if cached is None and os.path.exists(os.path.join(self.bank_dir, key, "meta.json")):
+            try:
+                cached = self._read(key)
+            except (OSError, ValueError):
+                # 读取时被其他进程清理
+                cached = None
+        if cached is not None:
+            data, rng_state = cached
+            np.random.set_state(rng_state)
+            return key, data
+
+        data = func()
+        rng_state = np.random.get_state()
+        try:
+            self._write(key, data, rng_state)
+            return key, self._read(key)[0]
+        except (_Unbankable, OSError, ValueError):
+            # 无法保存, 或超出仓库大小上限被立即清理
+            return None, data
+
+    def _encode(self, value, arrays):
+        """
+        输入数据结构编码为json, ndarray与numpy标量追加到arrays
+        """
+        if isinstance(value, np.ndarray) or isinstance(value, np.generic):
+            arrays.append(np.asarray(value))
+            return {"type": "ndarray", "index": len(arrays) - 1, "scalar": isinstance(value, np.generic)}
+        if isinstance(value, (tuple, list)):
+            items = [self._encode(v, arrays) for v in value]
+            return {"type": type(value).__name__, "items": items}
+        if type(value) in _JSON_TYPES:
+            return {"type": "json", "value": value}
+        raise _Unbankable(type(value))
+
+    def _decode(self, spec, arrays):
+        """
+        还原输入数据结构
+        """
+        if spec["type"] == "ndarray":
+            arr = arrays[spec["index"]]
+            return arr[()] if spec["scalar"] else arr
+        if spec["type"] in ("tuple", "list"):
+            items = [self._decode(v, arrays) for v in spec["items"]]
+            return tuple(items) if spec["type"] == "tuple" else items
+        return spec["value"]
+
+    def _write(self, key, data, rng_state):
+        """
+        先写入临时目录再改名, 多进程同时生成时只保留一份
+        """
+        arrays = []
+        spec = self._encode(data, arrays)
+        if any(arr.dtype.hasobject for arr in arrays) or sum(arr.nbytes for arr in arrays) > self.max_bytes:
+            raise _Unbankable("object dtype or too large")
+        meta = {
+            "spec": spec,
+            "rng_state": [rng_state[0], None, int(rng_state[2]), int(rng_state[3]), float(rng_state[4])],
+        }
+        path = os.path.join(self.bank_dir, key)
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for i, arr in enumerate(arrays):
+            np.save(os.path.join(tmp_path, "{}.npy".format(i)), arr)
+        np.save(os.path.join(tmp_path, "rng_keys.npy"), rng_state[1])
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # 其他进程已经写入
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        written = sum(arr.nbytes for arr in arrays)
+        if self._written is None or self._written + written > self.max_dir_bytes * 0.1:
+            self.prune()
+        else:
+            self._written += written
+
+    def prune(self):
+        """
+        清理仓库: 删除超过 max_age 未使用的数据(以及残留的临时目录), 总大小超过 max_dir_bytes 时从最久未使用的开始删除
+        以meta.json的修改时间作为最近使用时间, 先改名再删除, 其他进程不会读到不完整的数据
+        """
+        self._written = 0
+        now = time.time()
+        entries = []
+        try:
+            names = os.listdir(self.bank_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.bank_dir, name)
+            meta = os.path.join(path, "meta.json")
+            try:
+                if name.endswith(".tmp"):
+                    if now - os.stat(path).st_mtime > self.max_age:
+                        shutil.rmtree(path, ignore_errors=True)
+                    continue
+                used = os.stat(meta).st_mtime
+                size = sum(os.stat(os.path.join(path, f)).st_size for f in os.listdir(path))
+            except OSError:
+                continue
+            entries.append((used, size, name))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for used, size, name in entries:
+            if now - used <= self.max_age and total <= self.max_dir_bytes:
+                break
+            path = os.path.join(self.bank_dir, name)
+            tmp_path = "{}.{}.tmp".format(path, os.getpid())
+            try:
+                os.rename(path, tmp_path)
+            except OSError:
+                continue
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            total -= size
+            with self._lock:
+                self._loaded.pop(name, None)
+
+    def _read(self, key):
+        """
+        加载仓库中的数据
+        :return: (输入数据, 生成之后的随机数状态)
+        """
+        path = os.path.join(self.bank_dir, key)
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        # 记录最近使用时间, 清理时保留常用数据
+        os.utime(os.path.join(path, "meta.json"))
+        arrays = {}
+
+        def _collect(spec):
+            if spec["type"] == "ndarray":
+                arrays[spec["index"]] = np.load(os.path.join(path, "{}.npy".format(spec["index"])), mmap_mode="r")
+            elif spec["type"] in ("tuple", "list"):
+                for v in spec["items"]:
+                    _collect(v)
+
+        _collect(meta["spec"])
+        data = self._decode(meta["spec"], arrays)
+        rng_state = tuple(meta["rng_state"])
+        rng_state = (rng_state[0], np.load(os.path.join(path, "rng_keys.npy"))) + rng_state[2:]
+        with self._lock:
+            if len(self._loaded) >= 64:
+                self._loaded.clear()
+            self._loaded[key] = (data, rng_state)
+        return data, rng_state
+
+
+INPUT_BANK = InputBank()
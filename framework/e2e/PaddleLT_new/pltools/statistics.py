@@ -6,10 +6,16 @@
 常用统计学计算策略
 """
 
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 from strategy.compare import base_compare
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from utils import perf_stats
+from utils.perf_stats import StreamingStatistics, percentile, mad_filter, bootstrap_ci
+
 
 # 多种统计学计算策略
 def trimmean(data_list, ratio=0.2):
@@ -17,10 +23,7 @@ def trimmean(data_list, ratio=0.2):
     掐头去尾求平均
     :param data_list: 输入的data list, 多次试验的结果集合
     """
-    head = int(len(data_list) * ratio)
-    tail = int(len(data_list) - len(data_list) * ratio)
-    res = sum(sorted(data_list)[head:tail]) / (tail - head)
-    return res
+    return perf_stats.trimmean(data_list, ratio=ratio)
 
 
 def mean(data_list):
@@ -29,8 +32,7 @@ def mean(data_list):
     :param data_list:
     :return:
     """
-    res = sum(data_list) / len(data_list)
-    return res
+    return perf_stats.mean(data_list)
 
 
 def best(data_list):
@@ -39,9 +41,7 @@ def best(data_list):
     :param data_list: 输入的data list, 多次试验的结果集合
     :return: 最少的时间
     """
-    # print('data_list is: ', data_list)
-    res = min(data_list)
-    return res
+    return perf_stats.best(data_list)
 
 
 def best_top_k(data_list, ratio=0.2):
@@ -49,9 +49,7 @@ def best_top_k(data_list, ratio=0.2):
     求最优top k的平均值，默认ratio=0.2
     :param data_list: 输入的data list, 多次试验的结果集合
     """
-    head = int(len(data_list) * ratio)
-    res = sum(sorted(data_list)[:head]) / head
-    return res
+    return perf_stats.best_top_k(data_list, ratio=ratio)
 
 
 # list等分
@@ -106,14 +104,8 @@ def Q1_Q4_range(data_list):
     """
     取四分位数
     """
-    # 按升序排列
-    sorted_data = sorted(data_list)
-
-    # 计算第一四分位数 Q1
-    Q1 = np.percentile(sorted_data, 25)
-
-    # 计算第三四分位数 Q3
-    Q3 = np.percentile(sorted_data, 75)
+    # 计算第一四分位数 Q1, 第三四分位数 Q3
+    Q1, Q3 = np.percentile(perf_stats.as_array(data_list), [25, 75])
 
     # 计算四分位数范围 IQR
     IQR = Q3 - Q1
@@ -0,0 +1,140 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+扁平张量归档, 用于在多个engine / 多个框架之间共享 state_dict
+文件格式:
+    MAGIC(8 byte) + 头部长度(uint64, 小端) + json头部 + 填充至ALIGN对齐 + 数据区
+    json头部: {"tensors": [{"name", "dtype", "shape", "offset", "nbytes"}, ...]}, offset 相对数据区起点, 均按ALIGN对齐
+加载基于 np.memmap, 按key惰性生成视图, 不读取整个文件也不做额外拷贝
+"""
+import os
+import json
+import struct
+import threading
+
+import numpy as np
+
+MAGIC = b"PLTARC01"
+ALIGN = 64
+ARCHIVE_SUFFIX = ".plta"
+
+_OPENED = {}
+_OPENED_LOCK = threading.Lock()
+
+
+def _align(n):
+    """
+    向上对齐到ALIGN
+    """
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def save_archive(arrays, filename):
+    """
+    保存 {name: np.ndarray} 为归档文件, 先写临时文件再替换, 并发写入时读者只会看到完整文件
+
+    :param arrays: {name: np.ndarray}
+    :param filename: 归档路径
+    """
+    arrays = {name: np.asarray(value, order="C") for name, value in arrays.items()}
+    tensors = []
+    offset = 0
+    for name, value in arrays.items():
+        tensors.append(
+            {
+                "name": name,
+                "dtype": value.dtype.str,
+                "shape": list(value.shape),
+                "offset": offset,
+                "nbytes": value.nbytes,
+            }
+        )
+        offset = _align(offset + value.nbytes)
+    header = json.dumps({"tensors": tensors}).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    tmp_name = "{}.{}.tmp".format(filename, os.getpid())
+    with open(tmp_name, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for info, value in zip(tensors, arrays.values()):
+            f.seek(data_start + info["offset"])
+            f.write(value.reshape(-1).view(np.uint8).data)
+        f.truncate(data_start + offset)
+    os.replace(tmp_name, filename)
+
+
+class TensorArchive(object):
+    """
+    归档只读访问, archive[name] 返回 np.memmap 视图, 数据在访问时才由系统按页读入
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: 归档路径
+        """
+        self.filename = filename
+        with open(filename, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("{} is not a tensor archive".format(filename))
+            (header_len,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_len).decode("utf-8"))
+        self.data_start = _align(len(MAGIC) + 8 + header_len)
+        self.index = {info["name"]: info for info in header["tensors"]}
+        # copy-on-write 映射: 视图可写(torch.from_numpy 要求), 但修改不会写回文件
+        if os.path.getsize(filename) > self.data_start:
+            self._buffer = np.memmap(filename, dtype=np.uint8, mode="c", offset=self.data_start)
+        else:
+            self._buffer = np.zeros(0, dtype=np.uint8)
+
+    def keys(self):
+        """
+        全部tensor名, 保持保存时的顺序
+        """
+        return list(self.index.keys())
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __getitem__(self, name):
+        """
+        单个tensor的零拷贝视图
+        """
+        info = self.index[name]
+        dtype = np.dtype(info["dtype"])
+        buf = self._buffer[info["offset"] : info["offset"] + info["nbytes"]]
+        return buf.view(dtype).reshape(info["shape"])
+
+    def items(self):
+        """
+        (name, 视图) 迭代
+        """
+        for name in self.index:
+            yield name, self[name]
+
+
+def load_archive(filename):
+    """
+    打开归档, 同一进程内按 路径+修改时间 复用映射, 一个testing中的多个engine共用一份
+
+    :param filename: 归档路径
+    :return: TensorArchive
+    """
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+    with _OPENED_LOCK:
+        archive = _OPENED.get(key)
+        if archive is None:
+            for old_key in [k for k in _OPENED if k[0] == key[0]]:
+                del _OPENED[old_key]
+            archive = TensorArchive(filename)
+            _OPENED[key] = archive
+    return archive
@@ -0,0 +1,161 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+test bisect_store 与 BinarySearch, 使用本地构造的安装包与虚构的commit列表
+"""
+import os
+import sys
+import zipfile
+import subprocess
+
+os.environ.setdefault("FRAMEWORK", "paddle")
+
+import pltools.bisect_store as bisect_store_module
+from pltools.bisect_store import WheelStore, ProbeStore, env_signature
+from binary_search import BinarySearch
+
+WHL = "fakepd-0.0.0-py3-none-any.whl"
+
+
+def _fake_wheel(wheel_dir, commit, bad):
+    """
+    构造commit对应的本地安装包, 包内 fakepd.BAD 表示该commit是否引入问题
+    """
+    path = os.path.join(wheel_dir, commit, WHL)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    files = {
+        "fakepd/__init__.py": "COMMIT = {!r}\nBAD = {}\n".format(commit, bad),
+        "fakepd-0.0.0.dist-info/METADATA": "Metadata-Version: 2.1\nName: fakepd\nVersion: 0.0.0\n",
+        "fakepd-0.0.0.dist-info/WHEEL": "Wheel-Version: 1.0\nRoot-Is-Purelib: true\nTag: py3-none-any\n",
+    }
+    files["fakepd-0.0.0.dist-info/RECORD"] = "".join("{},,\n".format(name) for name in list(files) + ["RECORD"])
+    with zipfile.ZipFile(path, "w") as f:
+        for name, content in files.items():
+            f.writestr(name, content)
+    return path
+
+
+def _import_commit(site):
+    """
+    以site为PYTHONPATH的子进程中导入fakepd, 返回其commit
+    """
+    env = dict(os.environ, PYTHONPATH=site)
+    cmd = [sys.executable, "-c", "import fakepd; print(fakepd.COMMIT)"]
+    return subprocess.run(cmd, env=env, stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout.strip()
+
+
+def test_wheel_store_local(tmp_path):
+    """
+    本地安装包解压到commit独立目录, 已解压的commit直接复用
+    """
+    wheel_dir = str(tmp_path / "wheels")
+    _fake_wheel(wheel_dir, "c1", False)
+    _fake_wheel(wheel_dir, "c2", True)
+    store = WheelStore(
+        os.path.join(wheel_dir, "{}", WHL), WHL, cache_dir=str(tmp_path / "cache"), py_cmd=sys.executable
+    )
+
+    assert store.available("c1") and not store.available("c3")
+    site1, site2 = store.target("c1"), store.target("c2")
+    assert site1 != site2
+    assert _import_commit(site1) == "c1" and _import_commit(site2) == "c2"
+    done_mtime = os.path.getmtime(os.path.join(site1, ".done"))
+    assert store.target("c1") == site1
+    assert os.path.getmtime(os.path.join(site1, ".done")) == done_mtime
+
+
+def test_env_signature(monkeypatch):
+    """
+    二分流程相关的环境变量不影响签名, FLAGS与机器不同时签名不同
+    """
+    monkeypatch.setattr(bisect_store_module, "machine_signature", lambda: ["host_a", ["GPU A, 1"]])
+    signature = env_signature()
+    for name in ["PLT_BS_DEVICES", "PLT_BS_WORKERS", "PLT_BS_STORE", "PLT_WHEEL_CACHE"]:
+        monkeypatch.setenv(name, "changed")
+    assert env_signature() == signature
+
+    monkeypatch.setenv("FLAGS_plt_test", "1")
+    flags_signature = env_signature()
+    assert flags_signature != signature
+    monkeypatch.setattr(bisect_store_module, "machine_signature", lambda: ["host_b", ["GPU A, 1"]])
+    assert env_signature() != flags_signature
+
+
+class _FakeBisect(object):
+    """
+    精度二分环境: 本地安装包 + 虚构commit列表, 单次测试为导入该commit的fakepd检查是否引入问题
+    """
+
+    def __init__(self, tmp_path, monkeypatch, commits, first_bad, missing=()):
+        """
+        :param commits: 由新到旧的commit列表, 之后为 good_commit "c0"
+        :param first_bad: 最早引入问题的commit
+        :param missing: 没有安装包的commit
+        """
+        wheel_dir = str(tmp_path / "wheels")
+        bad = commits[: commits.index(first_bad) + 1]
+        for commit in commits + ["c0"]:
+            if commit not in missing:
+                _fake_wheel(wheel_dir, commit, commit in bad)
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv("TESTING_MODE", "precision")
+        monkeypatch.setenv("PLT_WHL_TEMPLATE", os.path.join(wheel_dir, "{}", WHL))
+        monkeypatch.setenv("PLT_WHEEL_CACHE", str(tmp_path / "cache"))
+        monkeypatch.setenv("PLT_BS_STORE", str(tmp_path / "store.json"))
+        monkeypatch.setenv("PLT_BS_DEVICES", "0,1")
+        self.commits = commits
+        self.calls = []
+
+    def create(self):
+        """
+        新的二分实例, 单次测试记录调用的commit
+        """
+        bs = BinarySearch(
+            good_commit="c0",
+            bad_commit=self.commits[0],
+            layerfile="diy/layer/demo_case/SIR_252.py",
+            testing="yaml/dy_eval.yml",
+            commit_list=self.commits,
+        )
+
+        def precision_once(commit_id, device):
+            self.calls.append(commit_id)
+            cmd = [sys.executable, "-c", "import sys, fakepd; sys.exit(int(fakepd.BAD))"]
+            return subprocess.call(cmd, env=bs._probe_env(commit_id, device)) == 0
+
+        bs._precision_once = precision_once
+        return bs
+
+
+def test_bisect_fake_commits(tmp_path, monkeypatch):
+    """
+    k路并行二分定位到引入问题的commit, 第二次二分复用已有结果, 只有复验重新测试
+    """
+    commits = ["c{}".format(i) for i in range(9, 0, -1)]
+    fake = _FakeBisect(tmp_path, monkeypatch, commits, first_bad="c6", missing=["c4"])
+
+    final_commit, commit_list, commit_list_origin, check_info = fake.create()._run()
+    assert final_commit == "c6"
+    assert "c4" not in commit_list and commit_list_origin == commits
+    assert check_info == "复验流程通过, 定位到的commit就是最终结果。"
+
+    fake.calls = []
+    assert fake.create()._run()[0] == "c6"
+    assert sorted(fake.calls) == ["c5"] * 5 + ["c6"] * 5
+
+
+def test_failed_probe_not_stored(tmp_path, monkeypatch):
+    """
+    执行异常的结果不保存, 下次二分重新测试
+    """
+    fake = _FakeBisect(tmp_path, monkeypatch, ["c2", "c1"], first_bad="c2")
+    bs = fake.create()
+    results = [None, True]
+    bs._precision_once = lambda commit_id, device: results.pop(0)
+
+    samples = bs._precision_measure("c1", "0")
+    assert samples == [None] and not bs._precision_judge("c1", samples)
+    assert not ProbeStore().get(bs._key("c1"))
+    assert bs._precision_measure("c1", "0") == [True]
+    assert ProbeStore().get(bs._key("c1")) == [True]
@@ -0,0 +1,102 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+test layerE2Ecase/conftest.py 的用例索引, 与pytest默认收集结果对比
+"""
+import os
+import subprocess
+import sys
+import importlib.util
+
+import pytest
+
+CONFTEST = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "layerE2Ecase", "conftest.py")
+
+CASE_SRC = """import unittest
+
+
+class TestBase:
+    def test_train(self):
+        pass
+
+
+class PrimitiveOp_a(unittest.TestCase):
+    def test_b(self):
+        pass
+
+
+class TestPrimitiveOp_a(PrimitiveOp_a):
+    def test_a(self):
+        pass
+
+
+class TestPrimitiveOp_b(TestBase):
+    def test_eval(self):
+        pass
+
+
+class TestInit:
+    def __init__(self):
+        pass
+
+    def test_a(self):
+        pass
+"""
+
+
+def _conftest():
+    """
+    导入 layerE2Ecase/conftest.py
+    """
+    spec = importlib.util.spec_from_file_location("plt_e2e_conftest", CONFTEST)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_build_index():
+    """
+    unittest类按方法名排序, 普通类保留定义顺序, 带 __init__ 的普通类不收集
+    """
+    index = _conftest().build_index(CASE_SRC)
+    assert index == [
+        ["TestBase", True, ["test_train"]],
+        ["PrimitiveOp_a", False, ["test_b"]],
+        ["TestPrimitiveOp_a", False, ["test_a", "test_b"]],
+        ["TestPrimitiveOp_b", True, ["test_train", "test_eval"]],
+    ]
+
+
+@pytest.mark.parametrize(
+    "src",
+    [
+        "def test_a():\n    pass\n",
+        "from base import Base\n\n\nclass TestA(Base):\n    def test_a(self):\n        pass\n",
+        "class TestA:\n    def setup_method(self):\n        pass\n\n    def test_a(self):\n        pass\n",
+    ],
+)
+def test_build_index_unsupported(src):
+    """
+    无法静态判断的文件退回默认收集
+    """
+    module = _conftest()
+    with pytest.raises(module._Unsupported):
+        module.build_index(src)
+
+
+def test_same_as_default(tmp_path):
+    """
+    延迟收集与默认收集的用例id及结果一致
+    """
+    case_dir = tmp_path / "layerE2Ecase"
+    case_dir.mkdir()
+    (case_dir / "conftest.py").write_text(open(CONFTEST, encoding="utf-8").read())
+    (case_dir / "test_case.py").write_text(CASE_SRC)
+    res = {}
+    for flag in ["False", "True"]:
+        env = dict(os.environ, PLT_E2E_LAZY_COLLECT=flag)
+        cmd = [sys.executable, "-m", "pytest", "-q", "-rA", "-p", "no:cacheprovider", str(case_dir)]
+        out = subprocess.run(cmd, env=env, cwd=str(tmp_path), stdout=subprocess.PIPE, universal_newlines=True).stdout
+        res[flag] = sorted(line for line in out.splitlines() if line.startswith(("PASSED", "FAILED", "ERROR")))
+    assert len(res["True"]) == 6 and res["True"] == res["False"]
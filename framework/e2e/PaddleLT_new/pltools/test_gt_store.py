@@ -0,0 +1,159 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+test gt_store, 远端使用本地目录
+"""
+import os
+import json
+
+import numpy as np
+import pytest
+import requests
+
+import pltools.gt_store as gt_store_module
+from pltools.gt_store import GTStore
+
+
+def _layerfile(tmp_path, name):
+    """
+    生成子图文件, 文件内容决定条目key
+    """
+    path = tmp_path / "cases" / "{}.py".format(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("# {}\n".format(name))
+    return str(path)
+
+
+def _remote_index(remote):
+    """
+    读取远端索引
+    """
+    with open(os.path.join(remote, GTStore.INDEX), "r") as f:
+        return json.load(f)
+
+
+def test_save_load(tmp_path):
+    """
+    保存与mmap加载, 嵌套结构保持不变
+    """
+    store = GTStore(root=str(tmp_path / "gt"))
+    layerfile = _layerfile(tmp_path, "case_a")
+    data = {"logit": np.arange(6, dtype="float32").reshape(2, 3), "grad": [np.ones(2), None], "step": 3}
+    store.save(data, testing="dy_eval", layerfile=layerfile)
+
+    assert store.has("dy_eval", layerfile)
+    assert not store.has("dy_train", layerfile)
+    res = store.load("dy_eval", layerfile)
+    assert isinstance(res["logit"], np.memmap)
+    assert np.array_equal(res["logit"], data["logit"])
+    assert np.array_equal(res["grad"][0], data["grad"][0])
+    assert res["grad"][1] is None and res["step"] == 3
+
+
+def test_save_replace_atomic(tmp_path):
+    """
+    重复保存时原子替换软链接, 只保留当前与上一版本
+    """
+    store = GTStore(root=str(tmp_path / "gt"))
+    layerfile = _layerfile(tmp_path, "case_a")
+    for i in range(3):
+        key = store.save(np.full([2], i, dtype="int64"), testing="dy_eval", layerfile=layerfile)
+    entry_dir = os.path.join(store.root, *key.split("/"))
+    assert os.path.islink(entry_dir)
+    assert np.array_equal(store.load("dy_eval", layerfile), [2, 2])
+    versions = [name for name in os.listdir(os.path.dirname(entry_dir)) if name.startswith(".")]
+    assert len(versions) == 2
+    assert list(store.build_index().keys()) == [key]
+
+
+def test_upload_fetch(tmp_path):
+    """
+    上传到远端后由另一个仓库下载, 未变化的条目跳过
+    """
+    remote = str(tmp_path / "remote")
+    os.makedirs(remote)
+    layerfiles = [_layerfile(tmp_path, "case_a"), _layerfile(tmp_path, "case_b")]
+    store = GTStore(root=str(tmp_path / "gt"))
+    for i, layerfile in enumerate(layerfiles):
+        store.save([np.full([3], i, dtype="float32")], testing="dy_eval", layerfile=layerfile)
+
+    res = store.upload(remote)
+    assert res == {"uploaded": 2, "skipped": 0, "failed": 0, "index": "uploaded"}
+    assert store.upload(remote)["skipped"] == 2
+
+    baseline = GTStore(root=str(tmp_path / "gt_baseline"))
+    res = baseline.fetch(remote, testings=["dy_eval", "dy_train"], py_list=layerfiles)
+    assert res == {"fetched": 2, "skipped": 0, "missing": 2, "failed": 0}
+    assert np.array_equal(baseline.load("dy_eval", layerfiles[1])[0], [1, 1, 1])
+    assert baseline.fetch(remote, testings=["dy_eval"], py_list=layerfiles)["skipped"] == 2
+
+
+def test_upload_keeps_remote_index(tmp_path):
+    """
+    后一次上传与远端已有索引合并, 不覆盖之前上传的条目
+    """
+    remote = str(tmp_path / "remote")
+    os.makedirs(remote)
+    case_a = _layerfile(tmp_path, "case_a")
+    case_b = _layerfile(tmp_path, "case_b")
+
+    first = GTStore(root=str(tmp_path / "gt_first"))
+    key_a = first.save(np.zeros([2]), testing="dy_eval", layerfile=case_a)
+    first.upload(remote)
+    second = GTStore(root=str(tmp_path / "gt_second"))
+    key_b = second.save(np.ones([2]), testing="dy_eval", layerfile=case_b)
+    second.upload(remote)
+
+    assert set(_remote_index(remote).keys()) == {key_a, key_b}
+    baseline = GTStore(root=str(tmp_path / "gt_baseline"))
+    assert baseline.fetch(remote, testings=["dy_eval"], py_list=[case_a, case_b])["fetched"] == 2
+
+
+def test_upload_aborted_on_unreadable_index(tmp_path):
+    """
+    远端索引无法读取时放弃上传, 远端索引保持不变
+    """
+    remote = str(tmp_path / "remote")
+    os.makedirs(remote)
+    with open(os.path.join(remote, GTStore.INDEX), "w") as f:
+        f.write("{broken")
+    store = GTStore(root=str(tmp_path / "gt"))
+    store.save(np.zeros([2]), testing="dy_eval", layerfile=_layerfile(tmp_path, "case_a"))
+
+    res = store.upload(remote)
+    assert res["index"] == "aborted" and res["uploaded"] == 0
+    with open(os.path.join(remote, GTStore.INDEX), "r") as f:
+        assert f.read() == "{broken"
+
+
+def test_remote_index_http(tmp_path, monkeypatch):
+    """
+    bos路径转换为http下载地址, 404视为空索引, 其他错误抛出
+    """
+    assert (
+        GTStore._http_remote("paddle-qa/PaddleLT/PaddleLTGroundTruth/latest/gpu")
+        == "https://paddle-qa.bj.bcebos.com/PaddleLT/PaddleLTGroundTruth/latest/gpu"
+    )
+    assert GTStore._http_remote("https://host/gt/") == "https://host/gt"
+
+    requested = []
+
+    def _download(status):
+        def download_sth(gt_url, output_path):
+            requested.append(gt_url)
+            response = requests.Response()
+            response.status_code = status
+            raise requests.HTTPError(response=response)
+
+        return download_sth
+
+    store = GTStore(root=str(tmp_path / "gt"))
+    monkeypatch.setattr(gt_store_module, "download_sth", _download(404))
+    assert store.remote_index("paddle-qa/PaddleLT/gt/gpu") == {}
+    assert requested[-1] == "https://paddle-qa.bj.bcebos.com/PaddleLT/gt/gpu/index.json"
+
+    monkeypatch.setattr(gt_store_module, "download_sth", _download(503))
+    with pytest.raises(requests.HTTPError):
+        store.remote_index("paddle-qa/PaddleLT/gt/gpu")
+    assert store.upload("paddle-qa/PaddleLT/gt/gpu")["index"] == "aborted"
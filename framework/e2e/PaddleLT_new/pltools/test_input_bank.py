@@ -0,0 +1,94 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+test input_bank, 子图文件写入临时目录后导入
+"""
+import os
+import sys
+import time
+import importlib.util
+
+import numpy as np
+
+from pltools.input_bank import InputBank
+
+CASE_SRC = """import numpy as np
+
+SHAPE = [2, 3]
+
+
+def _scale():
+    return {scale}
+
+
+def create_numpy_inputs():
+    inputs = (np.random.random(size=SHAPE).astype("float32") * _scale(),)
+    return inputs
+"""
+
+
+def _case_func(tmp_path, name, scale=1):
+    """
+    导入临时子图文件中的 create_numpy_inputs
+    """
+    py_file = tmp_path / "{}.py".format(name)
+    py_file.write_text(CASE_SRC.format(scale=scale))
+    spec = importlib.util.spec_from_file_location(name, str(py_file))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module.create_numpy_inputs
+
+
+def test_load_bitwise(tmp_path):
+    """
+    仓库加载的数据与后续随机数序列与直接生成一致
+    """
+    bank = InputBank(bank_dir=str(tmp_path / "bank"))
+    func = _case_func(tmp_path, "case_a")
+    np.random.seed(33)
+    expect = func()
+    expect_next = np.random.random()
+    for _ in range(2):
+        np.random.seed(33)
+        key, data = bank.load(func)
+        assert key is not None and isinstance(data[0], np.memmap)
+        assert np.array_equal(data[0], expect[0]) and np.random.random() == expect_next
+
+
+def test_key_includes_helpers(tmp_path):
+    """
+    create_numpy_inputs 源码不变, 调用的工具函数变化时key不同
+    """
+    bank = InputBank(bank_dir=str(tmp_path / "bank"))
+    np.random.seed(33)
+    key_a = bank.case_key(_case_func(tmp_path, "case_b", scale=1))
+    key_b = bank.case_key(_case_func(tmp_path, "case_c", scale=2))
+    key_c = bank.case_key(_case_func(tmp_path, "case_d", scale=1))
+    assert key_a != key_b and key_a == key_c
+
+
+def test_prune(tmp_path):
+    """
+    超过未使用天数的数据删除, 总大小超限时从最久未使用的开始删除
+    """
+    bank_dir = str(tmp_path / "bank")
+    bank = InputBank(bank_dir=bank_dir)
+    keys = []
+    for i in range(3):
+        np.random.seed(i)
+        keys.append(bank.load(_case_func(tmp_path, "case_prune"))[0])
+    now = time.time()
+    for i, key in enumerate(keys):
+        used = now - (3 - i) * 24 * 3600
+        os.utime(os.path.join(bank_dir, key, "meta.json"), (used, used))
+
+    bank.max_age = 2.5 * 24 * 3600
+    bank.prune()
+    assert sorted(os.listdir(bank_dir)) == sorted(keys[1:])
+
+    entry_dir = os.path.join(bank_dir, keys[2])
+    bank.max_dir_bytes = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+    bank.prune()
+    assert os.listdir(bank_dir) == [keys[2]]
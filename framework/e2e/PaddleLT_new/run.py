@@ -6,7 +6,10 @@
 测试执行器
 """
 import os
+import time
+import queue
 import shutil
+import tempfile
 import subprocess
 from subprocess import TimeoutExpired
 import multiprocessing
@@ -18,13 +21,17 @@ import layertest
 from db.layer_db import LayerBenchmarkDB
 from strategy.compare import perf_compare_dict, perf_compare_kernel_dict
 from pltools.case_select import CaseSelect
+from pltools.case_manifest import CaseManifest
 from pltools.logger import Logger
 from pltools.yaml_loader import YamlLoader
 from pltools.json_loader import JSONLoader
 from pltools.res_save import xlsx_save, download_sth, create_tar_gz, extract_tar_gz, load_pickle, save_txt
 from pltools.nv_tool import get_nv_memory
 from pltools.upload_bos import UploadBos
-from pltools.statistics import split_list, sublayer_perf_gsb_gen, kernel_perf_gsb_gen, sublayer_perf_ratio_gen
+from pltools.fork_executor import ForkExecutor
+from pltools.case_scheduler import CaseHistory, ShardQueues, lpt_split
+from pltools.gt_store import GTStore
+from pltools.statistics import sublayer_perf_gsb_gen, kernel_perf_gsb_gen, sublayer_perf_ratio_gen
 from pltools.alarm import Alarm
 
 
@@ -50,15 +57,16 @@ class Run(object):
         for layer_dir in self.layer_dir:
             py_list = py_list + CaseSelect(layer_dir, self.ignore_list).get_py_list(base_path=layer_dir)
 
-        # 测试集去重
-        self.py_list = []
-        for item in py_list:
-            if not item in self.py_list:
-                self.py_list.append(item)
+        # 测试集去重(保持顺序)
+        self.py_list = list(dict.fromkeys(py_list))
 
         self.testing = os.environ.get("TESTING")
         self.py_cmd = os.environ.get("python_ver")
         self.report_dir = os.path.join(os.getcwd(), "report")
+        # 子图执行方式: pytest为每个子图启动一次pytest子进程, fork为常驻父进程fork子进程执行
+        self.executor = os.environ.get("PLT_EXECUTOR", "pytest")
+        # 子图历史耗时/峰值内存, 用于LPT调度
+        self.case_history = CaseHistory(history_file=os.environ.get("PLT_CASE_HISTORY", "plt_case_history.json"))
 
         self.logger = Logger("PaddleLTRun")
         self.AGILE_PIPELINE_BUILD_ID = os.environ.get("AGILE_PIPELINE_BUILD_ID", 0)
@@ -99,28 +107,63 @@ class Run(object):
 
             self.logger.get_log().info(f"Torch框架版本: {torch.__version__}")
 
+        # 增量测试: 跳过上次通过且 子图/testing yml/执行器/paddle commit 均未变化的子图
+        self.case_manifest = None
+        if os.environ.get("PLT_INCREMENTAL", "False") == "True" and os.environ.get("TESTING_MODE") in [
+            "precision",
+            "precision_multi_gpu",
+        ]:
+            self.case_manifest = CaseManifest(
+                testing=self.testing,
+                engine_list=YamlLoader(yml=self.testing).get_junior_name("testings"),
+                manifest_file=os.environ.get("PLT_CASE_MANIFEST", "plt_case_manifest.json"),
+            )
+            self.py_list, skipped_list = self.case_manifest.select(
+                py_list=self.py_list, paddle_commit=os.environ.get("paddle_commit", "None")
+            )
+            self.logger.get_log().info(f"增量测试模式, 需要测试的子图数: {len(self.py_list)}, 跳过未变化的子图数: {len(skipped_list)}")
+
         # 下载ground truth用于跨硬件测试
         plt_gt_download_url = os.environ.get("PLT_GT_DOWNLOAD_URL")
         if not plt_gt_download_url == "None" and os.environ.get("TESTING_MODE") == "precision":
             self.logger.get_log().info(f"下载plt_gt的url为: {plt_gt_download_url}")
             plt_gt_device = plt_gt_download_url.split("/")[-1]
-            # if not os.path.exists(os.path.join("plt_gt_baseline", plt_gt_device)):
-            #     os.makedirs(os.path.join("plt_gt_baseline", plt_gt_device))
-            for testing in YamlLoader(yml=self.testing).get_junior_name("testings"):
-                if not os.path.exists(os.path.join("plt_gt_baseline", plt_gt_device, testing)):
-                    os.makedirs(os.path.join("plt_gt_baseline", plt_gt_device, testing))
-                for py_file in self.py_list:
-                    case_name = py_file.replace(".py", "").replace("/", "^").replace(".", "^")
-                    self.logger.get_log().info(f"开始下载plt_gt: {case_name}")
-                    gt_url = f"{plt_gt_download_url}/{testing}/{case_name}.tensor"
-                    download_sth(
-                        gt_url=gt_url,
-                        output_path=os.path.join("plt_gt_baseline", plt_gt_device, testing, f"{case_name}.tensor"),
-                    )
+            if os.environ.get("PLT_GT_STORE", "False") == "True":  # 内容寻址的npy真值仓库, 并行下载
+                gt_store = GTStore(
+                    root=os.path.join("plt_gt_baseline", plt_gt_device),
+                    max_workers=int(os.environ.get("PLT_GT_WORKERS", 8)),
+                )
+                res = gt_store.fetch(
+                    remote=plt_gt_download_url,
+                    testings=YamlLoader(yml=self.testing).get_junior_name("testings"),
+                    py_list=self.py_list,
+                )
+                self.logger.get_log().info(f"plt_gt下载结果: {res}")
+            else:
+                # if not os.path.exists(os.path.join("plt_gt_baseline", plt_gt_device)):
+                #     os.makedirs(os.path.join("plt_gt_baseline", plt_gt_device))
+                for testing in YamlLoader(yml=self.testing).get_junior_name("testings"):
+                    if not os.path.exists(os.path.join("plt_gt_baseline", plt_gt_device, testing)):
+                        os.makedirs(os.path.join("plt_gt_baseline", plt_gt_device, testing))
+                    for py_file in self.py_list:
+                        case_name = py_file.replace(".py", "").replace("/", "^").replace(".", "^")
+                        self.logger.get_log().info(f"开始下载plt_gt: {case_name}")
+                        gt_url = f"{plt_gt_download_url}/{testing}/{case_name}.tensor"
+                        download_sth(
+                            gt_url=gt_url,
+                            output_path=os.path.join("plt_gt_baseline", plt_gt_device, testing, f"{case_name}.tensor"),
+                        )
 
     def _exit_code_txt(self, error_count, error_list):
         """"""
         core_dumps_list = self._core_dumps_case_count(report_path=self.report_dir)
+        if self.case_manifest is not None:
+            self.case_manifest.update(
+                py_list=self.py_list,
+                error_list=list(error_list) + core_dumps_list,
+                paddle_commit=os.environ.get("paddle_commit", "None"),
+            )
+            self.case_manifest.save()
         if error_count != 0 or core_dumps_list:
             self.logger.get_log().warning("测试失败, 下面进行bug分类统计: ")
             self.logger.get_log().warning(f"报错为core dumps的子图有: {core_dumps_list}")
@@ -183,6 +226,11 @@ class Run(object):
             self.logger.get_log().info(f"上传plt_gt的路径为: {os.environ.get('PLT_GT_UPLOAD_URL')}")
             for device in os.listdir("plt_gt"):
                 device_path = os.path.join("plt_gt", device)
+                if os.environ.get("PLT_GT_STORE", "False") == "True":
+                    gt_store = GTStore(root=device_path, max_workers=int(os.environ.get("PLT_GT_WORKERS", 8)))
+                    res = gt_store.upload(remote=os.path.join(upload_url, device), uploader=_upload)
+                    self.logger.get_log().info(f"plt_gt上传结果: {res}")
+                    continue
                 for testing in os.listdir(device_path):
                     testing_path = os.path.join(device_path, testing)
                     for tensor in os.listdir(testing_path):
@@ -231,22 +279,85 @@ class Run(object):
                 # f"pickle下载链接: https://paddle-qa.bj.bcebos.com/{bos_path}/pickle.tar",
             )
 
+    def _worker_num(self):
+        """并发数, MULTI_WORKER=auto 时按可用内存与子图历史峰值内存估计"""
+        if os.environ.get("MULTI_WORKER", "13") == "auto":
+            worker_num = self.case_history.auto_worker_num(default=13)
+            self.logger.get_log().info(f"MULTI_WORKER=auto, 估计并发数为: {worker_num}")
+            return worker_num
+        return int(os.environ.get("MULTI_WORKER", 13))
+
+    def _case_record(self, py_file, exit_code, cost, peak_mem=None):
+        """记录子图耗时与峰值内存"""
+        self.case_history.record(py_file=py_file, cost=cost, peak_mem=peak_mem)
+
+    def _pytest_subprocess(self, cmd, timeout=None):
+        """
+        执行pytest命令, 返回 (退出码, 峰值内存MB, stdout, stderr)
+        峰值内存取自 wait4 的 ru_maxrss, 包含shell及其启动的pytest进程; 超时时退出码为-1, 峰值内存为None
+        timeout为None时输出直接打印, 不捕获
+        """
+        with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+            if timeout is None:
+                proc = subprocess.Popen(cmd, shell=True)
+            else:
+                proc = subprocess.Popen(cmd, shell=True, stdout=out, stderr=err)
+            deadline = None if timeout is None else time.time() + timeout
+            while True:
+                pid, status, usage = os.wait4(proc.pid, 0 if deadline is None else os.WNOHANG)
+                if pid:
+                    proc.returncode = os.waitstatus_to_exitcode(status)
+                    exit_code, peak_mem = proc.returncode, usage.ru_maxrss / 1024
+                    break
+                if time.time() >= deadline:
+                    proc.terminate()  # 发送 SIGTERM 信号到进程
+                    proc.wait()
+                    exit_code, peak_mem = -1, None
+                    break
+                time.sleep(0.1)
+            out.seek(0)
+            err.seek(0)
+            return exit_code, peak_mem, out.read(), err.read()
+
+    def _fork_executor(self, max_workers=1, device_place_id=0):
+        """fork执行器, layerE2Ecase为独立pytest文件, 不支持fork执行"""
+        if self.executor != "fork" or self.layer_type == "layerE2Ecase":
+            return None
+        timeout = os.environ.get("PLT_PYTEST_TIMEOUT", "None")
+        return ForkExecutor(
+            testing=self.testing,
+            report_dir=self.report_dir,
+            timeout=None if timeout == "None" else float(timeout),
+            max_workers=max_workers,
+            device_place_id=device_place_id,
+            logger=self.logger.get_log(),
+        )
+
     def _single_pytest_run(self, py_file, testing, device_place_id=0):
         """run one test"""
+        fork_executor = self._fork_executor(device_place_id=device_place_id)
+        if fork_executor is not None:
+            error_dict = fork_executor.run(py_list=[py_file], on_result=self._case_record)
+            if py_file in error_dict:
+                return py_file, error_dict[py_file]
+            return None, None
+
         title = py_file.replace(".py", "").replace("/", "^").replace(".", "^")
         self.logger.get_log().info(f"开始测试子图 {title}, 准备执行pytest命令~~")
+        start = time.time()
 
         if os.environ.get("PLT_PYTEST_TIMEOUT") == "None":
             if self.layer_type == "layerE2Ecase":
-                exit_code = os.system(f"{self.py_cmd} -m pytest {py_file} --alluredir={self.report_dir}")
+                cmd = f"{self.py_cmd} -m pytest {py_file} --alluredir={self.report_dir}"
             else:
-                exit_code = os.system(
+                cmd = (
                     "cp -r PaddleLT.py {}.py && "
                     "{} -m pytest {}.py --title={} --layerfile={} --testing={} "
                     "--device_place_id={} --alluredir={}".format(
                         title, self.py_cmd, title, title, py_file, testing, device_place_id, self.report_dir
                     )
                 )
+            exit_code, peak_mem, _, _ = self._pytest_subprocess(cmd)
         else:
             timeout = os.environ.get("PLT_PYTEST_TIMEOUT")
             if self.layer_type == "layerE2Ecase":
@@ -259,11 +370,10 @@ class Run(object):
                 ).format(title, self.py_cmd, title, title, py_file, testing, device_place_id, self.report_dir, timeout)
 
             # 使用subprocess执行命令并设置超时
-            proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            try:
-                stdout, stderr = proc.communicate(timeout=float(timeout))
-                exit_code = proc.returncode
-                self.logger.get_log().warning(f"{py_file} Command failed with return code {exit_code}")
+            exit_code, peak_mem, stdout, stderr = self._pytest_subprocess(cmd, timeout=float(timeout))
+            if exit_code == -1:
+                self.logger.get_log().warning(f"{py_file} Command timed out after {timeout} seconds")
+            else:
                 # 如果进程正常结束，stdout 和 stderr 将包含输出
                 if stdout:
                     self.logger.get_log().info(stdout.decode())  # 注意：输出是字节串，需要解码为字符串
@@ -271,12 +381,9 @@ class Run(object):
                     self.logger.get_log().warning(stderr.decode())  # 注意：错误输出也是字节串，需要解码为字符串
                 if exit_code != 0:
                     self.logger.get_log().warning(f"{py_file} Command failed with return code {exit_code}")
-            except subprocess.TimeoutExpired:
-                self.logger.get_log().warning(f"{py_file} Command timed out after {timeout} seconds")
-                proc.terminate()  # 发送 SIGTERM 信号到进程
-                exit_code = -1
 
         self.logger.get_log().info(f"完成测试子图 {title}, 完成执行pytest命令~~")
+        self._case_record(py_file=py_file, exit_code=exit_code, cost=time.time() - start, peak_mem=peak_mem)
         if exit_code != 0:
             return py_file, exit_code
         return None, None
@@ -286,16 +393,25 @@ class Run(object):
         error_list = []
         error_count = 0
 
-        with ThreadPoolExecutor(max_workers=int(os.environ.get("MULTI_WORKER", 13))) as executor:
-            # 提交任务给线程池
-            futures = [executor.submit(self._single_pytest_run, py_file, self.testing) for py_file in py_list]
+        # 按历史耗时降序提交(LPT), 线程池空闲线程依次领取
+        py_list = sorted(py_list, key=self.case_history.cost, reverse=True)
+        worker_num = self._worker_num()
+        fork_executor = self._fork_executor(max_workers=worker_num)
+        if fork_executor is not None:
+            error_list = list(fork_executor.run(py_list=py_list, on_result=self._case_record).keys())
+            error_count = len(error_list)
+        else:
+            with ThreadPoolExecutor(max_workers=worker_num) as executor:
+                # 提交任务给线程池
+                futures = [executor.submit(self._single_pytest_run, py_file, self.testing) for py_file in py_list]
 
-            # 等待任务完成，并收集返回值
-            for future in futures:
-                _py_file, _exit_code = future.result()
-                if _exit_code is not None:
-                    error_list.append(_py_file)
-                    error_count += 1
+                # 等待任务完成，并收集返回值
+                for future in futures:
+                    _py_file, _exit_code = future.result()
+                    if _exit_code is not None:
+                        error_list.append(_py_file)
+                        error_count += 1
+        self.case_history.save()
 
         if os.environ.get("MULTI_DOUBLE_CHECK") == "False":
             if not os.environ.get("PLT_GT_UPLOAD_URL") == "None":
@@ -308,32 +424,52 @@ class Run(object):
     def _multi_gpu_multithread_test_run(self, py_list):
         """multithread run some test"""
         ######################################################
-        def _queue_run(py_list, device_place_id, result_queue):
+        def _queue_run(shard_index, device_place_id, result_queue):
             # def _queue_run(py_list, py_dict, result_queue):
             """
             multi run main
+            每个设备先领取自身LPT分片, 分片耗尽后从其他设备分片窃取
             """
             error_list = []
             error_count = 0
 
+            # 本进程由已import paddle的父进程fork而来, 不在本进程内执行子图;
+            # 子图在继承该 CUDA_VISIBLE_DEVICES 新启动的forkserver(或pytest子进程)中执行
             os.environ["CUDA_VISIBLE_DEVICES"] = str(device_place_id)
-            with ThreadPoolExecutor(max_workers=int(os.environ.get("MULTI_WORKER", 13))) as executor:
+            worker_num = self._worker_num()
+            fork_executor = self._fork_executor(max_workers=worker_num)
+            if fork_executor is not None:
+                error_list = list(
+                    fork_executor.run(py_list=shard_queues.iter(shard_index), on_result=self._case_record).keys()
+                )
+                result_queue.put((error_list, len(error_list), self.case_history.history))
+                return
+
+            def _steal_run():
+                """单线程持续领取子图"""
+                thread_error_list = []
+                for py_file in shard_queues.iter(shard_index):
+                    _py_file, _exit_code = self._single_pytest_run(py_file, self.testing, 0)
+                    if _exit_code is not None:
+                        thread_error_list.append(_py_file)
+                return thread_error_list
+
+            with ThreadPoolExecutor(max_workers=worker_num) as executor:
                 # 提交任务给线程池
                 # futures = [
                 #     executor.submit(self._single_pytest_run, py_file, self.testing, py_dict[py_file])
                 #     for py_file in py_list
                 # ]
 
-                futures = [executor.submit(self._single_pytest_run, py_file, self.testing, 0) for py_file in py_list]
+                futures = [executor.submit(_steal_run) for _ in range(worker_num)]
 
                 # 等待任务完成，并收集返回值
                 for future in futures:
-                    _py_file, _exit_code = future.result()
-                    if _exit_code is not None:
-                        error_list.append(_py_file)
-                        error_count += 1
+                    thread_error_list = future.result()
+                    error_list.extend(thread_error_list)
+                    error_count += len(thread_error_list)
 
-            result_queue.put((error_list, error_count))
+            result_queue.put((error_list, error_count, self.case_history.history))
 
         ######################################################
 
@@ -343,7 +479,9 @@ class Run(object):
 
         # py_dict = {item: i % len(device_list) for i, item in enumerate(py_list)}
 
-        multiprocess_cases = split_list(lst=self.py_list, n=len(device_list))
+        # 按历史耗时LPT装箱, 使各设备预估总耗时接近
+        multiprocess_cases = lpt_split(lst=py_list, n=len(device_list), cost_func=self.case_history.cost)
+        shard_queues = ShardQueues(multiprocess_cases)
         processes = []
         result_queue = multiprocessing.Queue()
 
@@ -351,20 +489,34 @@ class Run(object):
             self.logger.get_log().info(f"multiprocess_cases中i: {i}")
             self.logger.get_log().info(f"multiprocess_cases中device_list: {device_list}")
             self.logger.get_log().info(f"multiprocess_cases中device_list[i]: {device_list[i]}")
-            process = multiprocessing.Process(target=_queue_run, args=(cases_list, device_list[i], result_queue))
+            self.logger.get_log().info(
+                f"device {device_list[i]} 分得子图数: {len(cases_list)}, "
+                f"预估耗时: {sum(self.case_history.cost(c) for c in cases_list):.1f}s"
+            )
+            process = multiprocessing.Process(target=_queue_run, args=(i, device_list[i], result_queue))
             # process = multiprocessing.Process(target=_queue_run, args=(cases_list, py_dict, result_queue))
             process.start()
             processes.append(process)
 
-        for process in processes:
-            process.join()
-
+        # 先取结果再join, 避免子进程因队列数据未被读取而无法退出
         error_list = []
         error_count = 0
-        while not result_queue.empty():
-            single_error_list, single_error_count = result_queue.get()
+        received = 0
+        while received < len(processes):
+            try:
+                single_error_list, single_error_count, history = result_queue.get(timeout=1)
+            except queue.Empty:
+                if any(process.is_alive() for process in processes):
+                    continue
+                break
+            received += 1
             error_list.extend(single_error_list)
             error_count += single_error_count
+            self.case_history.update(history)
+
+        for process in processes:
+            process.join()
+        self.case_history.save()
 
         if os.environ.get("MULTI_DOUBLE_CHECK") == "False":
             if not os.environ.get("PLT_GT_UPLOAD_URL") == "None":
@@ -423,6 +575,7 @@ class Run(object):
 
             title = py_file.replace(".py", "").replace("/", "^").replace(".", "^")
             sublayer_dict[title] = prec_dict
+        self.case_history.save()
 
         if not os.environ.get("PLT_GT_UPLOAD_URL") == "None":
             self._gt_upload()
@@ -463,7 +616,7 @@ class Run(object):
 
             result_queue.put(sublayer_dict, error_list, error_count)
 
-        multiprocess_cases = split_list(lst=self.py_list, n=int(os.environ.get("MULTI_WORKER")))
+        multiprocess_cases = lpt_split(lst=self.py_list, n=self._worker_num(), cost_func=self.case_history.cost)
         processes = []
         result_queue = multiprocessing.Queue()
 
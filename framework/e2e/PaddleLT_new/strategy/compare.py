@@ -316,7 +316,7 @@ def perf_compare(baseline, latest):
     :param baseline: 基线值
     :return: 比例值
     """
-    if isinstance(baseline, str) or isinstance(baseline, str):
+    if isinstance(baseline, str) or isinstance(latest, str):
         res = "error"
         return res
     else:
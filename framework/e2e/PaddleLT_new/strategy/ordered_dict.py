@@ -10,6 +10,7 @@ import traceback
 import numpy as np
 
 from pltools.res_save import save_pickle, load_pickle
+from pltools.tensor_archive import ARCHIVE_SUFFIX, save_archive, load_archive
 
 if "paddle" in os.environ.get("FRAMEWORK"):
     import paddle
@@ -60,8 +61,11 @@ class OrderedDictProcess(object):
         # self.path = os.path.join(os.getcwd(), "orderdict_save", self.framework, self.modelpath, self.layername)
         # os.makedirs(os.path.join(os.getcwd(), "orderdict_save", self.framework, self.modelpath), exist_ok=True)
 
+        # paddle与torch的modelpath一致, 同一layerfile的所有engine与框架共用一份文件
         self.path = os.path.join(os.getcwd(), "orderdict_save", self.modelpath, self.layername)
         os.makedirs(os.path.join(os.getcwd(), "orderdict_save", self.modelpath), exist_ok=True)
+        # archive: 扁平张量归档(np.memmap加载); pickle: 旧格式
+        self.save_format = os.environ.get("PLT_ORDERDICT_FORMAT", "archive")
 
     def save_ordered_dict(self):
         """
@@ -77,14 +81,42 @@ class OrderedDictProcess(object):
             for key, value in self.net.state_dict().items():
                 value = value.cpu()
                 pickle_dict[key] = value.detach().numpy()
-        save_pickle(pickle_dict, self.path)
+        if self.save_format == "pickle":
+            save_pickle(pickle_dict, self.path)
+        else:
+            save_archive(pickle_dict, self.path + ARCHIVE_SUFFIX)
         # eval(f"{self.framework}.save")(self.net.state_dict(), self.path)
 
+    def _saved_format(self):
+        """
+        已保存文件的格式: 两种格式的文件都存在时取较新的一个(最近一次保存时的 PLT_ORDERDICT_FORMAT),
+        修改时间相同时取当前配置的格式
+        """
+        mtime = {}
+        for fmt, suffix in [("archive", ARCHIVE_SUFFIX), ("pickle", ".pickle")]:
+            if os.path.exists(self.path + suffix):
+                mtime[fmt] = os.stat(self.path + suffix).st_mtime_ns
+        if not mtime:
+            return self.save_format
+        return max(mtime, key=lambda fmt: (mtime[fmt], fmt == self.save_format))
+
     def load_ordered_dict(self):
         """
         加载文件中的OrderedDict
         """
         ordered_dict = {}
+        if self._saved_format() != "pickle":
+            archive = load_archive(self.path + ARCHIVE_SUFFIX)
+            if self.framework == "paddle":
+                # set_state_dict 直接接受ndarray, memmap视图一次拷贝进参数, 不再经过 paddle.to_tensor
+                for key, value in archive.items():
+                    ordered_dict[key] = value
+            elif self.framework == "torch":
+                # torch.from_numpy 与memmap共享内存, load_state_dict 时才拷贝进参数
+                for key, value in archive.items():
+                    ordered_dict[key] = torch.from_numpy(value)
+            return ordered_dict
+
         loaded_data = load_pickle(self.path + ".pickle")
         if self.framework == "paddle":
             for key, value in loaded_data.items():
@@ -0,0 +1,170 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+adaptive timer 自适应迭代计时
+"""
+import timeit
+
+import numpy as np
+
+
+class AdaptiveTimer(object):
+    """
+    自适应迭代计时:
+    1. 校准每个样本内的调用次数, 使单个样本耗时不低于 target_sample_us
+    2. 当截尾均值的置信区间相对宽度小于 rel_ci_width 时提前停止采样
+    返回的样本单位与固定循环模式一致, 即 单次调用耗时 * base_times
+    """
+
+    def __init__(
+        self,
+        base_times=1000,
+        ratio=0.2,
+        rel_ci_width=0.01,
+        min_samples=500,
+        max_samples=50000,
+        target_sample_us=20,
+        warmup_ms=200,
+        check_every=250,
+        z=1.96,
+    ):
+        """
+        :param base_times: timeit 基础运行时间, 样本换算倍数
+        :param ratio: 截尾均值掐头去尾的比例, 与 Statistics.trimmean 一致
+        :param rel_ci_width: 截尾均值置信区间宽度 / 截尾均值 的收敛阈值
+        :param min_samples: 最少样本数
+        :param max_samples: 最多样本数
+        :param target_sample_us: 单个样本的最短耗时(微秒)
+        :param warmup_ms: 预热时长(毫秒)
+        :param check_every: 每采集多少个样本检查一次收敛
+        :param z: 置信区间分位数, 1.96 对应 95%
+        """
+        self.base_times = base_times
+        self.ratio = ratio
+        self.rel_ci_width = rel_ci_width
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.target_sample_us = target_sample_us
+        self.warmup_ms = warmup_ms
+        self.check_every = check_every
+        self.z = z
+        self.timer = timeit.default_timer
+
+        # 最近一次 measure 的运行信息
+        self.number = 1
+        self.samples = 0
+        self.converged = False
+        self.ci_width = float("inf")
+
+    def warmup(self, func):
+        """
+        预热, 至少运行 warmup_ms 毫秒
+        :param func: 被测函数
+        :return: 预热调用次数
+        """
+        count = 0
+        deadline = self.timer() + self.warmup_ms / 1e3
+        while True:
+            func()
+            count += 1
+            if self.timer() >= deadline:
+                break
+        return count
+
+    def calibrate(self, func):
+        """
+        校准每个样本内的调用次数, 使单个样本耗时不低于 target_sample_us
+        :param func: 被测函数
+        :return: 每个样本内的调用次数
+        """
+        target = self.target_sample_us / 1e6
+        number = 1
+        while True:
+            start = self.timer()
+            for _ in range(number):
+                func()
+            elapsed = self.timer() - start
+            if elapsed >= target:
+                break
+            if elapsed <= 0:
+                number *= 10
+            else:
+                # 按耗时比例放大, 每次至少翻倍以保证收敛
+                number = max(number * 2, int(number * target / elapsed) + 1)
+        return number
+
+    def trimmed_ci(self, data):
+        """
+        截尾均值及其置信区间相对宽度, 方差使用 winsorized 方差估计
+        :param data: 样本 ndarray
+        :return: (截尾均值, 置信区间相对宽度)
+        """
+        n = len(data)
+        head = int(n * self.ratio)
+        tail = int(n - n * self.ratio)
+        if tail - head < 2:
+            return float("nan"), float("inf")
+        sorted_data = np.sort(data)
+        tm = sorted_data[head:tail].mean()
+        winsorized = np.clip(sorted_data, sorted_data[head], sorted_data[tail - 1])
+        se = winsorized.std(ddof=1) / ((tail - head) / n) / np.sqrt(n)
+        if tm <= 0:
+            return tm, float("inf")
+        return tm, 2 * self.z * se / tm
+
+    def measure(self, func):
+        """
+        自适应采样
+        :param func: 被测函数
+        :return: 样本 list, 单位为 单次调用耗时 * base_times
+        """
+        self.warmup(func)
+        number = self.calibrate(func)
+        scale = self.base_times / number
+        buffer = np.empty(self.max_samples, dtype=np.float64)
+        timer = self.timer
+        loop = range(number)
+
+        n = 0
+        converged = False
+        ci_width = float("inf")
+        next_check = max(self.min_samples, self.check_every)
+        while n < self.max_samples:
+            start = timer()
+            for _ in loop:
+                func()
+            buffer[n] = (timer() - start) * scale
+            n += 1
+            if n >= next_check:
+                _, ci_width = self.trimmed_ci(buffer[:n])
+                if ci_width <= self.rel_ci_width:
+                    converged = True
+                    break
+                next_check += self.check_every
+
+        self.number = number
+        self.samples = n
+        self.converged = converged
+        self.ci_width = ci_width
+        return buffer[:n].tolist()
+
+    def floor(self, func, number, samples):
+        """
+        以与 measure 相同的采样循环计时, 用于校准空函数的框架开销
+        :param func: 被测函数, 一般为空函数
+        :param number: 每个样本内的调用次数
+        :param samples: 样本数
+        :return: 样本 list, 单位与 measure 一致
+        """
+        self.warmup(func)
+        scale = self.base_times / number
+        timer = self.timer
+        loop = range(number)
+        time_list = []
+        for _ in range(samples):
+            start = timer()
+            for _ in loop:
+                func()
+            time_list.append((timer() - start) * scale)
+        return time_list
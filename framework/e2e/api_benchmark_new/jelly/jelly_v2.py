@@ -13,12 +13,24 @@ import paddle
 import numpy as np
 from paddle import to_tensor
 from utils.logger import Logger
-from reload_config import OPERATOR_RELOAD
+from reload_config import OPERATOR_RELOAD, reload_func
+from jelly.adaptive_timer import AdaptiveTimer
 
 
 PADDLE_DTYPE = {"float16": np.float16, "float32": np.float32, "float64": np.float64}
 # 计算精度，保留6位有效数字
 ACCURACY = "%.6g"
+# 计时框架开销校准的样本数
+FLOOR_SAMPLES = 2000
+# 计时框架开销按 (计时模式, 单样本调用次数, base_times) 缓存, 每个进程只校准一次
+_CALL_FLOOR = {}
+
+
+def _noop():
+    """
+    空函数, 用于校准计时框架开销
+    """
+    pass
 
 
 class Jelly_v2(object):
@@ -37,6 +49,8 @@ class Jelly_v2(object):
         # enable_backward=True,
         loops=50,
         base_times=1000,
+        timing="fixed",
+        adaptive_config=None,
     ):
         """
 
@@ -44,6 +58,8 @@ class Jelly_v2(object):
         :param place:  cpu or gpu (string)
         :param card: 0 1 2 3 (int)
         :param explain: case的说明 会打印在日志中
+        :param timing: 计时模式, fixed 固定循环 or adaptive 自适应迭代
+        :param adaptive_config: adaptive 模式下 AdaptiveTimer 的参数dict
         """
         self.seed = 33
         # self.enable_backward = enable_backward
@@ -56,6 +72,13 @@ class Jelly_v2(object):
         self.loops = loops
         # timeit 基础运行时间
         self.base_times = base_times
+        # 计时模式
+        if timing not in ["fixed", "adaptive"]:
+            raise ValueError("timing must be fixed or adaptive, but got {}".format(timing))
+        self.timing = timing
+        if adaptive_config is None:
+            adaptive_config = {}
+        self.adaptive_timer = AdaptiveTimer(base_times=base_times, **adaptive_config)
         # 设置logger
         # self.logger = logger
         self.logger = logger.get_log()
@@ -78,8 +101,11 @@ class Jelly_v2(object):
         # trans "str api" to obj
         if api not in self.reload.keys():
             self.api = eval(api)
+            self.reload_func = None
         else:
             self.api = api
+            # 重载api预编译为调用, 计时中不再解析表达式
+            self.reload_func = reload_func(api)
         self.compare_dict = None
         self.param = dict()
         self.data = dict()
@@ -187,161 +213,145 @@ class Jelly_v2(object):
                     else:
                         self.method[key][k] = v
 
+    def _timeit(self, func):
+        """
+        计时调度
+        fixed: 预热 0.2*loops*base_times 次, 之后采集 loops*base_times 个单次调用样本
+        adaptive: 校准样本内调用次数, 截尾均值置信区间收敛后提前停止
+        :param func: 无参被测函数
+        :return: 样本 list, 单位为 单次调用耗时 * base_times
+        """
+        if self.timing == "adaptive":
+            time_list = self.adaptive_timer.measure(func)
+            self.logger.info(
+                "[{}] adaptive timing: {} samples x {} calls, converged: {}, rel ci width: {}".format(
+                    self.log_file_name,
+                    self.adaptive_timer.samples,
+                    self.adaptive_timer.number,
+                    self.adaptive_timer.converged,
+                    ACCURACY % self.adaptive_timer.ci_width,
+                )
+            )
+            return time_list
+
+        timeit.timeit(func, number=int(0.2 * self.loops * self.base_times))  # 预热
+        time_list = []
+        for i in range(self.loops * self.base_times):
+            time_list.append(timeit.timeit(func, number=1) * self.base_times)
+        return time_list
+
+    def call_floor(self):
+        """
+        计时框架自身的调用开销: 以与 _timeit 相同的方式计时空函数, 取中位数
+        单位与样本一致, 用于给出扣除框架开销后的api耗时
+        adaptive 模式需在 _timeit 之后调用, 以使用校准后的单样本调用次数
+        """
+        number = self.adaptive_timer.number if self.timing == "adaptive" else 1
+        key = (self.timing, number, self.base_times)
+        if key not in _CALL_FLOOR:
+            if self.timing == "adaptive":
+                time_list = self.adaptive_timer.floor(_noop, number, FLOOR_SAMPLES)
+            else:
+                timeit.timeit(_noop, number=FLOOR_SAMPLES)  # 预热
+                time_list = [timeit.timeit(_noop, number=1) * self.base_times for _ in range(FLOOR_SAMPLES)]
+            _CALL_FLOOR[key] = float(np.median(time_list))
+        return _CALL_FLOOR[key]
+
     def paddle_forward(self):
         """
         主体测试逻辑
         """
-        forward_time_list = []
         if self._layertypes(self.api) == "func":
             input_param = dict(self.data, **self.param)
-            tmp = timeit.timeit(lambda: self.api(**input_param), number=int(0.2 * self.loops * self.base_times))  # 预热
-            for i in range(self.loops * self.base_times):
-                forward_time = timeit.timeit(lambda: self.api(**input_param), number=1)
-                forward_time_list.append(forward_time * self.base_times)
+
+            def run():
+                self.api(**input_param)
+
         elif self._layertypes(self.api) == "class":
-            # obj = self.api(**self.param)
-            # for i in range(self.loops):
-            #     forward_time = timeit.timeit(lambda: obj(*self.data.values()), number=self.base_times)
-            #     forward_time.append(forward_time)
             obj = self.api(**self.param)
-            # 预热
             if self.method == dict():
-                tmp = timeit.timeit(lambda: obj(*self.data.values()), number=int(0.2 * self.loops * self.base_times))
+                inputs = self.data.values()
+
+                def run():
+                    obj(*inputs)
+
             else:
                 obj_method = eval("obj" + "." + list(self.method.keys())[0])
                 method_params_dict = self.method[list(self.method.keys())[0]]
-                tmp = timeit.timeit(
-                    lambda: obj_method(**method_params_dict), number=int(0.2 * self.loops * self.base_times)
-                )
-            for i in range(self.loops * self.base_times):
-                if self.method == dict():
-                    forward_time = timeit.timeit(lambda: obj(*self.data.values()), number=1)
-                else:
-                    obj_method = eval("obj" + "." + list(self.method.keys())[0])
-                    method_params_dict = self.method[list(self.method.keys())[0]]
-                    forward_time = timeit.timeit(lambda: obj_method(**method_params_dict), number=1)
-                forward_time_list.append(forward_time * self.base_times)
+
+                def run():
+                    obj_method(**method_params_dict)
+
         elif self._layertypes(self.api) == "reload":
+            op = self.reload_func
             # 判断"reload" api中有一个输入还是两个输入
             if "y" in self.data.keys():
                 x = self.data["x"]
                 y = self.data["y"]
-                expression = self.reload.get(self.api).format("x", "y")
-            else:
-                x = self.data["x"]
-                expression = self.reload.get(self.api).format("x")
-
-            def func(x, y):
-                eval(expression)
 
-            def func_x(x):
-                eval(expression)
+                def run():
+                    op(x, y)
 
-            # 预热
-            if "y" in self.data.keys():
-                tmp = timeit.timeit(lambda: func(x, y), number=int(0.2 * self.loops * self.base_times))  # 预热
             else:
-                tmp = timeit.timeit(lambda: func_x(x), number=int(0.2 * self.loops * self.base_times))  # 预热
+                x = self.data["x"]
+
+                def run():
+                    op(x)
 
-            for i in range(self.loops * self.base_times):
-                if "y" in self.data.keys():
-                    forward_time = timeit.timeit(lambda: func(x, y), number=1)
-                else:
-                    forward_time = timeit.timeit(lambda: func_x(x), number=1)
-                forward_time_list.append(forward_time * self.base_times)
         else:
             raise AttributeError
 
-        del tmp
-        return forward_time_list
+        return self._timeit(run)
 
     def paddle_total(self):
         """
         计算paddle 总体时间
         """
-        total_time_list = []
         if self._layertypes(self.api) == "func":
             input_param = dict(self.data, **self.param)
             res = self.api(**input_param)
             grad_tensor = paddle.ones(res.shape, res.dtype)
 
-            def func(input_param):
+            def run():
                 res = self.api(**input_param)
                 res.backward(grad_tensor)
 
-            tmp = timeit.timeit(lambda: func(input_param), number=int(0.2 * self.loops * self.base_times))  # 预热
-            for i in range(self.loops * self.base_times):
-                total_time = timeit.timeit(lambda: func(input_param), number=1)
-                total_time_list.append(total_time * self.base_times)
         elif self._layertypes(self.api) == "class":
-            # obj = self.api(**self.param)
-            # res = obj(*self.data.values())
-            # grad_tensor = paddle.ones(res.shape, res.dtype)
             obj = self.api(**self.param)
             if self.method == dict():
-                res = obj(*self.data.values())
+                inputs = self.data.values()
+                res = obj(*inputs)
+                grad_tensor = paddle.ones(res.shape, res.dtype)
+
+                def run():
+                    res = obj(*inputs)
+                    res.backward(grad_tensor)
+
             else:
                 obj_method = eval("obj" + "." + list(self.method.keys())[0])
                 method_params_dict = self.method[list(self.method.keys())[0]]
                 res = obj_method(**method_params_dict)
-            grad_tensor = paddle.ones(res.shape, res.dtype)
-
-            def clas(input_param):
-                res = obj(*input_param)
-                res.backward(grad_tensor)
+                grad_tensor = paddle.ones(res.shape, res.dtype)
 
-            def clas_method(input_param):
-                res = obj_method(**input_param)
-                res.backward(grad_tensor)
+                def run():
+                    res = obj_method(**method_params_dict)
+                    res.backward(grad_tensor)
 
-            # 预热
-            if self.method == dict():
-                tmp = timeit.timeit(lambda: clas(self.data.values()), number=int(0.2 * self.loops * self.base_times))
-            else:
-                tmp = timeit.timeit(
-                    lambda: clas_method(method_params_dict), number=int(0.2 * self.loops * self.base_times)
-                )
-            for i in range(self.loops * self.base_times):
-                if self.method == dict():
-                    total_time = timeit.timeit(lambda: clas(self.data.values()), number=1)
-                else:
-                    total_time = timeit.timeit(lambda: clas_method(method_params_dict), number=1)
-                total_time_list.append(total_time * self.base_times)
         elif self._layertypes(self.api) == "reload":
-            if "y" in self.data.keys():
-                x = self.data["x"]
-                y = self.data["y"]
-                expression = self.reload.get(self.api).format("x", "y")
-            else:
-                x = self.data["x"]
-                expression = self.reload.get(self.api).format("x")
-            res = eval(expression)
+            op = self.reload_func
+            x = self.data["x"]
+            args = (x, self.data["y"]) if "y" in self.data.keys() else (x,)
+            res = op(*args)
             grad_tensor = paddle.ones(res.shape, res.dtype)
 
-            def func(x, y):
-                res = eval(expression)
-                res.backward(grad_tensor)
-
-            def func_x(x):
-                res = eval(expression)
+            def run():
+                res = op(*args)
                 res.backward(grad_tensor)
 
-            # 预热
-            if "y" in self.data.keys():
-                tmp = timeit.timeit(lambda: func(x, y), number=int(0.2 * self.loops * self.base_times))  # 预热
-            else:
-                tmp = timeit.timeit(lambda: func_x(x), number=int(0.2 * self.loops * self.base_times))  # 预热
-            for i in range(self.loops * self.base_times):
-                if "y" in self.data.keys():
-                    total_time = timeit.timeit(lambda: func(x, y), number=1)
-                else:
-                    total_time = timeit.timeit(lambda: func_x(x), number=1)
-                total_time_list.append(total_time * self.base_times)
         else:
             raise AttributeError
 
-        del tmp
-        return total_time_list
+        return self._timeit(run)
 
     # def run(self):
     #     """
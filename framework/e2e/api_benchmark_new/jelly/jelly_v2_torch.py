@@ -14,7 +14,7 @@ import numpy as np
 from paddle import to_tensor
 
 # from utils.logger import logger
-from reload_config import OPERATOR_RELOAD
+from reload_config import OPERATOR_RELOAD, reload_func
 
 
 TORCH_DTYPE = {"float16": torch.float16, "float32": torch.float32, "float64": torch.float64}
@@ -76,8 +76,11 @@ class Jelly_v2_torch(object):
         # trans "str api" to obj
         if api not in self.reload.keys():
             self.api = eval(api)
+            self.reload_func = None
         else:
             self.api = api
+            # 重载api预编译为调用, 计时中不再解析表达式
+            self.reload_func = reload_func(api)
         self.compare_dict = None
         self.param = dict()
         self.data = dict()
@@ -244,19 +247,18 @@ class Jelly_v2_torch(object):
                 forward_time_list.append(forward_time)
         elif self._layertypes(self.api) == "reload":
             # 判断"reload" api中有一个输入还是两个输入
+            op = self.reload_func
             if "y" in self.data.keys():
                 x = self.data["x"]
                 y = self.data["y"]
-                expression = self.reload.get(self.api).format("x", "y")
             else:
                 x = self.data["x"]
-                expression = self.reload.get(self.api).format("x")
 
             def func(x, y):
-                eval(expression)
+                op(x, y)
 
             def func_x(x):
-                eval(expression)
+                op(x)
 
             # 预热
             if "y" in self.data.keys():
@@ -336,25 +338,25 @@ class Jelly_v2_torch(object):
                 total_time_list.append(total_time)
         elif self._layertypes(self.api) == "reload":
             # 判断"reload" api中有一个输入还是两个输入
+            op = self.reload_func
             if "y" in self.data.keys():
                 x = self.data["x"]
                 y = self.data["y"]
-                expression = self.reload.get(self.api).format("x", "y")
+                res = op(x, y)
             else:
                 x = self.data["x"]
-                expression = self.reload.get(self.api).format("x")
-            res = eval(expression)
+                res = op(x)
             if self.places == "gpu":
                 grad_tensor = torch.ones(res.shape, dtype=res.dtype).to("cuda")
             else:
                 grad_tensor = torch.ones(res.shape, dtype=res.dtype)
 
             def func(x, y):
-                res = eval(expression)
+                res = op(x, y)
                 res.backward(grad_tensor)
 
             def func_x(x):
-                res = eval(expression)
+                res = op(x)
                 res.backward(grad_tensor)
 
             # 预热
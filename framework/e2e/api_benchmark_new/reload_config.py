@@ -6,6 +6,7 @@
 """
 config
 """
+import operator
 
 OPERATOR_RELOAD = {
     "__add__": "{} + {}",
@@ -37,3 +38,47 @@ OPERATOR_RELOAD = {
     # "__setitem__": "{}[0, 1]={}",
     "__invert__": "~{}",
 }
+
+# 与 OPERATOR_RELOAD 表达式等价的预编译调用, 计时闭包内不再 eval 字符串
+OPERATOR_FUNC = {
+    "__add__": operator.add,
+    "__and__": operator.and_,
+    "__div__": operator.truediv,
+    "__eq__": operator.eq,
+    "__floordiv__": operator.floordiv,
+    "__ge__": operator.ge,
+    "__gt__": operator.gt,
+    "__le__": operator.le,
+    "__lt__": operator.lt,
+    "__mod__": operator.mod,
+    "__mul__": operator.mul,
+    "__ne__": operator.ne,
+    "__neg__": operator.neg,
+    "__or__": operator.or_,
+    "__pow__": operator.pow,
+    "__sub__": operator.sub,
+    "__truediv__": operator.truediv,
+    "__xor__": operator.xor,
+    "__radd__": operator.add,
+    "__rdiv__": operator.truediv,
+    "__rmul__": operator.mul,
+    "__rpow__": operator.pow,
+    "__rsub__": operator.sub,
+    "__rtruediv__": operator.truediv,
+    "__matmul__": operator.matmul,
+    "__getitem__": operator.itemgetter((0, 1)),
+    "__invert__": operator.invert,
+}
+
+
+def reload_func(api):
+    """
+    获取重载api的调用, 未在 OPERATOR_FUNC 中的表达式只编译一次
+    :param api: OPERATOR_RELOAD 中的api名
+    :return: func(x) 或 func(x, y)
+    """
+    if api in OPERATOR_FUNC:
+        return OPERATOR_FUNC[api]
+    expression = OPERATOR_RELOAD[api]
+    args = "x, y" if expression.count("{}") > 1 else "x"
+    return eval(compile("lambda {}: {}".format(args, expression.format(*args.split(", "))), api, "eval"))
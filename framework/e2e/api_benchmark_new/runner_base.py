@@ -47,10 +47,13 @@ class ApiBenchmarkBASE(object):
         # 测试控制项
         self.loops = 50  # 循环次数
         self.base_times = 1000  # timeit 基础运行时间
+        self.timing = "fixed"  # 计时模式, fixed 固定循环 or adaptive 自适应迭代
+        self.adaptive_config = None  # adaptive 计时参数, 详见 jelly/adaptive_timer.py
         self.default_dtype = "float32"
         self.if_showtime = True
         self.double_check = True
         self.check_iters = 5
+        self.save_sketch = False  # 是否保存前向耗时分布sketch, 用于分布检验对比
         self.now_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
         # # 初始化数据库
@@ -113,6 +116,8 @@ class ApiBenchmarkBASE(object):
                     default_dtype=self.default_dtype,
                     loops=loops,
                     base_times=base_times,
+                    timing=self.timing,
+                    adaptive_config=self.adaptive_config,
                 )
             jelly.set_paddle_param(bt.get_paddle_inputs(), bt.get_paddle_param())
             jelly.set_paddle_method(bt.get_paddle_method())
@@ -137,6 +142,17 @@ class ApiBenchmarkBASE(object):
             jelly.result["backward"] = ACCURACY % backward
             jelly.result["total"] = ACCURACY % total
             jelly.result["best_total"] = ACCURACY % best_total
+            if self.save_sketch:
+                jelly.result["forward_sketch"] = self.statistics.sketch(data_list=forward_time_list)
+            # 计时框架开销下限, 以及扣除该开销后的前向耗时
+            call_floor = jelly.call_floor()
+            jelly.result["call_floor"] = ACCURACY % call_floor
+            jelly.result["forward_net"] = ACCURACY % max(forward - call_floor, 0)
+            self.logger.get_log().info(
+                "[{}] call floor: {}, forward net: {}".format(
+                    case_name, jelly.result["call_floor"], jelly.result["forward_net"]
+                )
+            )
 
             self._log_save(data=jelly.result, case_name=case_name, log=log)
 
@@ -372,16 +388,14 @@ class ApiBenchmarkBASE(object):
         数据库交互
         """
         # db = DB(storage=self.storage)
-        latest_case = {}
         data = dict()
         for i in os.listdir("./{}/".format(log)):
             with open("./{}/".format(log) + i) as case:
                 res = case.readline()
                 api = i.split(".")[0]
                 data[api] = res
+        data_list = []
         for k, v in data.items():
-            latest_case["jid"] = latest_id
-            latest_case["case_name"] = k
-            latest_case["api"] = json.loads(v).get("api")
-            latest_case["result"] = v
-            db.insert_case(jid=latest_id, data_dict=latest_case, create_time=self.now_time)
+            data_list.append({"case_name": k, "api": json.loads(v).get("api"), "result": v})
+        written, spilled = db.insert_case_batch(jid=latest_id, data_list=data_list, create_time=self.now_time)
+        self.logger.get_log().info("case表录入{}条, 落盘{}条".format(written, spilled))
@@ -8,7 +8,6 @@
 """
 
 import os
-import multiprocessing
 import socket
 import platform
 
@@ -25,6 +24,7 @@ from info.snapshot import Snapshot
 from strategy.compare import double_check, bad_check, ci_level_reveal, data_compare
 from strategy.transdata import data_list_to_dict
 from alarm.alarm import Alarm
+from scheduler.worker_pool import WorkerPool
 
 import paddle
 
@@ -39,6 +39,9 @@ parser.add_argument("--core_index", type=int, default=2, help="index of cpu core
 parser.add_argument("--yaml", type=str, help="input the yaml path")
 parser.add_argument("--python", type=str, default="python3.10", help="input the yaml path")
 parser.add_argument("--baseline_whl_link", type=str, default=None, help="only be used to insert baseline data")
+parser.add_argument("--timing", type=str, default="fixed", help="timing mode: fixed or adaptive")
+parser.add_argument("--worker_num", type=int, default=4, help="number of persistent worker processes")
+parser.add_argument("--cores_per_worker", type=int, default=1, help="number of cpu cores pinned to each worker")
 args = parser.parse_args()
 
 # p = psutil.Process()
@@ -61,13 +64,16 @@ class ApiBenchmarkCI(ApiBenchmarkBASE):
         """
         # 测试控制项
         self.core_index = args.core_index  # 第一个cpu核序号
-        self.multiprocess_num = 4  # 并行进程数
+        self.multiprocess_num = args.worker_num  # 并行进程数
+        self.cores_per_worker = args.cores_per_worker  # 每个进程独占的cpu核数
         self.loops = 50  # 循环次数
         self.base_times = 1000  # timeit 基础运行时间
+        self.timing = args.timing  # 计时模式, fixed 固定循环 or adaptive 自适应迭代
         self.default_dtype = "float32"
         self.if_showtime = True
         self.double_check = True
         self.check_iters = 5
+        self.save_sketch = True
         self.now_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
         # md5唯一标识码
@@ -132,80 +138,30 @@ class ApiBenchmarkCI(ApiBenchmarkBASE):
         # 邮件报警
         # self.email = Alarm(storage=self.storage)
 
-    # def split_list(self, lst, n):
-    #     """
-    #     将列表均分为n份
-    #     Args:
-    #         lst (list): 待划分的列表
-    #         n (int): 划分的份数
-    #     Returns:
-    #         res (list): 划分后的列表，其中每个元素为原列表的1/n部分
-    #     """
-    #     if not isinstance(lst, list) or not isinstance(n, int) or len(lst) == 0 or n <= 0:
-    #         return []
-
-    #     quotient, remainder = divmod(len(lst), n)
-    #     res = []
-    #     start = 0
-    #     for i in range(n):
-    #         if i < remainder:
-    #             end = start + quotient + 1
-    #         else:
-    #             end = start + quotient
-    #         res.append(lst[start:end])
-    #         start = end
-    #     return res
-
-    def split_list(self, lst, n):
+    def _pool_run_main(self, all_cases, loops, base_times):
         """
-        将列表按顺序划分为 n 份
-        Args:
-            lst (list): 待划分的列表
-            n (int): 划分的份数
-        Returns:
-            res (list): 划分后的列表，其中每个元素为原列表的 1/n 部分
+        常驻进程池执行: 每个worker绑定独立cpu核, 按历史耗时从共享队列领取case
         """
-        if not isinstance(lst, list) or not isinstance(n, int) or len(lst) == 0 or n <= 0:
-            return []
+        pool = WorkerPool(
+            worker_num=self.multiprocess_num,
+            core_index=self.core_index,
+            cores_per_worker=self.cores_per_worker,
+        )
 
-        quotient, remainder = divmod(len(lst), n)
-        res = [[] for _ in range(n)]
-        for i, value in enumerate(lst):
-            index = i % n
-            res[index].append(value)
-        return res
+        def run_func(case_name):
+            return self._run_main(all_cases=[case_name], loops=loops, base_times=base_times).get(case_name, {})
 
-    def _multi_run_main(self, all_cases, loops, base_times, result_queue):
-        """
-        multi run main
-        """
-        error_dict = self._run_main(all_cases=all_cases, loops=loops, base_times=base_times)
-        result_queue.put(error_dict)
+        def on_result(case_name, error, cost):
+            self.logger.get_log().info("[{}] finished in {:.2f}s, error: {}".format(case_name, cost, bool(error)))
+
+        return pool.run(cases=list(all_cases), run_func=run_func, on_result=on_result)
 
     def _run_ci(self):
         """
 
         :return:
         """
-        multiprocess_cases = self.split_list(lst=list(self.all_cases), n=self.multiprocess_num)
-        processes = []
-        result_queue = multiprocessing.Queue()
-
-        for i, cases_list in enumerate(multiprocess_cases):
-            process = multiprocessing.Process(
-                target=self._multi_run_main, args=(cases_list, self.loops, self.base_times, result_queue)
-            )
-            process.start()
-            os.sched_setaffinity(process.pid, {self.core_index + i})
-            processes.append(process)
-
-        for process in processes:
-            process.join()
-
-        error_dict = {}
-        while not result_queue.empty():
-            result_dict = result_queue.get()
-            error_dict.update(result_dict)
+        error_dict = self._pool_run_main(all_cases=self.all_cases, loops=self.loops, base_times=self.base_times)
 
         # error_dict = self._run_main(all_cases=self.all_cases, loops=self.loops, base_times=self.base_times)
 
@@ -268,7 +224,7 @@ class ApiBenchmarkCI(ApiBenchmarkBASE):
                 double_check_case.append(k)
 
         if self.double_check and bool(double_check_case):
-            double_error_dict = self._run_main(
+            double_error_dict = self._pool_run_main(
                 all_cases=double_check_case, loops=self.loops * 6, base_times=self.base_times
             )
             ci_dict = {}
@@ -285,11 +241,16 @@ class ApiBenchmarkCI(ApiBenchmarkBASE):
                 ci_dict[k]["result"] = v
 
             compare_dict = {}
+            bad_check_case = []
             for k, v in ci_dict.items():
                 baseline_case = baseline_dict[k]
                 latest_case = ci_dict[k]
-                compare_res = data_compare(baseline_case=baseline_case, latest_case=latest_case, case_name=k)
+                compare_res = data_compare(
+                    baseline_case=baseline_case, latest_case=latest_case, case_name=k, final=True
+                )
                 compare_dict[k] = compare_res[k]
+                if bad_check(res=compare_res[k]):
+                    bad_check_case.append(k)
             print("double_error_dict is: ", double_error_dict)
         else:
             double_error_dict = {}
@@ -340,25 +301,7 @@ class ApiBenchmarkCI(ApiBenchmarkBASE):
 
         :return:
         """
-        multiprocess_cases = self.split_list(lst=list(self.all_cases), n=self.multiprocess_num)
-        processes = []
-        result_queue = multiprocessing.Queue()
-
-        for i, cases_list in enumerate(multiprocess_cases):
-            process = multiprocessing.Process(
-                target=self._multi_run_main, args=(cases_list, self.loops, self.base_times, result_queue)
-            )
-            process.start()
-            os.sched_setaffinity(process.pid, {self.core_index + i})
-            processes.append(process)
-
-        for process in processes:
-            process.join()
-
-        error_dict = {}
-        while not result_queue.empty():
-            result_dict = result_queue.get()
-            error_dict.update(result_dict)
+        error_dict = self._pool_run_main(all_cases=self.all_cases, loops=self.loops, base_times=self.base_times)
 
         # error_dict = self._run_main(all_cases=self.all_cases, loops=self.loops, base_times=self.base_times)
 
@@ -0,0 +1,179 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+worker pool 常驻进程池调度: 绑核 + 共享任务队列 + 历史耗时均衡
+"""
+import os
+import json
+import time
+import queue
+import traceback
+import multiprocessing
+import multiprocessing.connection
+
+
+def core_groups(worker_num, core_index=0, cores_per_worker=1):
+    """
+    为每个worker划分独立的cpu核集合, 从 core_index 开始依次分配
+    :param worker_num: worker数量
+    :param core_index: 第一个cpu核序号
+    :param cores_per_worker: 每个worker独占的核数
+    :return: list[set], 第i个元素为第i个worker的cpu核集合, 可用核不足时为None(不绑核)
+    """
+    if hasattr(os, "sched_getaffinity"):
+        available = sorted(os.sched_getaffinity(0))
+    else:
+        available = list(range(os.cpu_count() or 1))
+    available = [c for c in available if c >= core_index]
+
+    groups = []
+    for i in range(worker_num):
+        cores = available[i * cores_per_worker : (i + 1) * cores_per_worker]
+        if len(cores) < cores_per_worker:
+            groups.append(None)
+        else:
+            groups.append(set(cores))
+    return groups
+
+
+def _worker_loop(worker_id, cores, run_func, task_queue, conn):
+    """
+    常驻worker: 绑核后从任务队列持续取case执行, 通过独立管道逐个回传结果, 遇到None结束
+    """
+    if cores is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    while True:
+        case_name = task_queue.get()
+        if case_name is None:
+            break
+        conn.send(("start", case_name, None, 0.0))
+        start = time.time()
+        try:
+            error = run_func(case_name)
+        except Exception:
+            error = {"exception": traceback.format_exc()}
+        conn.send(("done", case_name, error, time.time() - start))
+    conn.close()
+
+
+class WorkerPool(object):
+    """
+    常驻进程池: 每个worker绑定独立cpu核集合, 从共享队列中按历史耗时降序领取case
+    """
+
+    def __init__(self, worker_num=4, core_index=0, cores_per_worker=1, history_file="case_runtime.json"):
+        """
+        :param worker_num: worker数量
+        :param core_index: 第一个cpu核序号
+        :param cores_per_worker: 每个worker独占的核数
+        :param history_file: case历史耗时记录文件
+        """
+        self.worker_num = worker_num
+        self.core_index = core_index
+        self.cores_per_worker = cores_per_worker
+        self.history_file = history_file
+        self.history = self._load_history()
+
+    def _load_history(self):
+        """
+        读取case历史耗时
+        """
+        if not os.path.exists(self.history_file):
+            return {}
+        try:
+            with open(self.history_file, "r") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _save_history(self):
+        """
+        保存case历史耗时
+        """
+        try:
+            with open(self.history_file, "w") as f:
+                json.dump(self.history, f)
+        except Exception as e:
+            print(e)
+
+    def sort_cases(self, cases):
+        """
+        按历史耗时降序排列(LPT), 无记录的case视为最耗时, 优先执行
+        """
+        return sorted(cases, key=lambda c: self.history.get(c, float("inf")), reverse=True)
+
+    def run(self, cases, run_func, on_result=None):
+        """
+        执行所有case
+        :param cases: case名称list
+        :param run_func: 单case执行函数, 输入case名称, 返回error dict(空dict表示成功)
+        :param on_result: 可选回调, 每个case完成后在主进程调用 on_result(case_name, error, cost)
+        :return: error_dict, key为case名称
+        """
+        cases = list(cases)
+        ctx = multiprocessing.get_context("fork")
+        task_queue = ctx.Queue()
+        for case_name in self.sort_cases(cases):
+            task_queue.put(case_name)
+
+        groups = core_groups(self.worker_num, self.core_index, self.cores_per_worker)
+        workers = {}
+        conns = {}
+
+        def _start_worker(worker_id):
+            parent_conn, child_conn = ctx.Pipe(duplex=False)
+            p = ctx.Process(target=_worker_loop, args=(worker_id, groups[worker_id], run_func, task_queue, child_conn))
+            p.daemon = True
+            p.start()
+            child_conn.close()
+            workers[worker_id] = p
+            conns[parent_conn] = worker_id
+
+        for i in range(self.worker_num):
+            task_queue.put(None)
+            _start_worker(i)
+
+        # 每次异常退出至少消耗一个case, 重启次数以case数为上限, 避免启动即崩溃时无限重启
+        respawn_left = len(cases) + self.worker_num
+        error_dict = {}
+        running = {}
+        while conns:
+            for conn in multiprocessing.connection.wait(list(conns.keys())):
+                worker_id = conns[conn]
+                try:
+                    state, case_name, error, cost = conn.recv()
+                except EOFError:
+                    # worker退出; 异常退出(如core dump)时将正在执行的case记为失败
+                    del conns[conn]
+                    workers[worker_id].join()
+                    exitcode = workers[worker_id].exitcode
+                    case_name = running.pop(worker_id, None)
+                    if case_name is not None:
+                        error_dict[case_name] = {"exception": "worker {} exit with code {}".format(worker_id, exitcode)}
+                    # 异常退出的worker未取走结束标记, 在同一组cpu核上重启, 保持进程池大小
+                    if exitcode != 0 and respawn_left > 0:
+                        respawn_left -= 1
+                        _start_worker(worker_id)
+                    continue
+
+                if state == "start":
+                    running[worker_id] = case_name
+                else:
+                    running.pop(worker_id, None)
+                    self.history[case_name] = cost
+                    if error:
+                        error_dict[case_name] = error
+                    if on_result is not None:
+                        on_result(case_name, error, cost)
+
+        # worker多次异常退出超过重启上限时, 队列中剩余的case记为失败
+        while True:
+            try:
+                case_name = task_queue.get(timeout=0.1)
+            except queue.Empty:
+                break
+            if case_name is not None:
+                error_dict[case_name] = {"exception": "not executed, all workers exited"}
+        self._save_history()
+        return error_dict
@@ -5,6 +5,12 @@
 """
 trimmean 掐头去尾求平均
 """
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from utils import perf_stats
+
 # import matplotlib.pyplot as plt
 # import numpy as np
 # from scipy.stats import gaussian_kde
@@ -27,10 +33,7 @@ class Statistics(object):
         掐头去尾求平均
         :param data_list: 输入的data list, 多次试验的结果集合
         """
-        head = int(len(data_list) * ratio)
-        tail = int(len(data_list) - len(data_list) * ratio)
-        res = sum(sorted(data_list)[head:tail]) / (tail - head)
-        return res
+        return perf_stats.trimmean(data_list, ratio=ratio)
 
     def mean(self, data_list):
         """
@@ -38,8 +41,7 @@ class Statistics(object):
         :param data_list:
         :return:
         """
-        res = sum(data_list) / len(data_list)
-        return res
+        return perf_stats.mean(data_list)
 
     def best(self, data_list):
         """
@@ -47,18 +49,45 @@ class Statistics(object):
         :param data_list: 输入的data list, 多次试验的结果集合
         :return: 最少的时间
         """
-        # print('data_list is: ', data_list)
-        res = min(data_list)
-        return res
+        return perf_stats.best(data_list)
 
     def best_top_k(self, data_list, ratio=0.2):
         """
         求最优top k的平均值，默认ratio=0.2
         :param data_list: 输入的data list, 多次试验的结果集合
         """
-        head = int(len(data_list) * ratio)
-        res = sum(sorted(data_list)[:head]) / head
-        return res
+        return perf_stats.best_top_k(data_list, ratio=ratio)
+
+    def percentile(self, data_list, q=(50, 90, 99)):
+        """
+        求分位数, 默认p50/p90/p99
+        :param data_list: 输入的data list, 多次试验的结果集合
+        """
+        return perf_stats.percentile(data_list, q=q)
+
+    def mad_filter(self, data_list, k=3.0):
+        """
+        基于MAD剔除离群点
+        :param data_list: 输入的data list, 多次试验的结果集合
+        """
+        return perf_stats.mad_filter(data_list, k=k)
+
+    def bootstrap_ci(self, data_list, method="trimmean", ratio=0.2, n_boot=1000, alpha=0.05):
+        """
+        bootstrap 置信区间
+        :param data_list: 输入的data list, 多次试验的结果集合
+        """
+        return perf_stats.bootstrap_ci(data_list, method=method, ratio=ratio, n_boot=n_boot, alpha=alpha)
+
+    def sketch(self, data_list, relative_accuracy=0.005):
+        """
+        耗时分布的紧凑sketch(对数分桶), 可json化, 用于基线与待测之间的分布检验
+        :param data_list: 输入的data list, 多次试验的结果集合
+        :param relative_accuracy: 分桶的相对精度
+        """
+        res = perf_stats.StreamingStatistics(relative_accuracy=relative_accuracy)
+        res.extend(data_list)
+        return res.to_dict()
 
     # def probability_plot(self, data_list):
     #     """
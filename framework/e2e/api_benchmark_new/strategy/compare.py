@@ -6,8 +6,16 @@
 compare
 """
 
+import os
+import sys
 import json
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from utils import perf_stats
+
+# 分布检验所使用的指标, 对应 result 中的 "<metric>_sketch"
+STAT_METRIC = "forward"
+
 
 def base_compare(baseline, latest):
     """
@@ -29,30 +37,79 @@ def base_compare(baseline, latest):
     return res
 
 
-def data_compare(baseline_case, latest_case, case_name):
+def sketch_compare(baseline_sketch, latest_sketch, threshold=1.15, alpha=0.01, ratio=0.2, final=False):
+    """
+    基于完整耗时分布(sketch)的性能对比
+    regression: Mann-Whitney 显著变慢, 且截尾均值比值置信区间下界超过 threshold
+    no_regression: 不显著, 或比值置信区间上界低于 threshold
+    inconclusive: 其余情况, 需要重新测量; final=True 时按比值点估计判定
+    :param baseline_sketch: 基线耗时分布, StreamingStatistics.to_dict() 结果
+    :param latest_sketch: 待测耗时分布, StreamingStatistics.to_dict() 结果
+    :param threshold: 判定为性能下降的最小比值(effect size), 与 performance_grade 的 doubt 下界一致
+    :param alpha: 显著性水平
+    :param ratio: 截尾均值比例
+    :param final: 是否为最后一次对比(不再重测)
+    :return: dict
+    """
+    baseline = perf_stats.StreamingStatistics.from_dict(baseline_sketch)
+    latest = perf_stats.StreamingStatistics.from_dict(latest_sketch)
+    baseline_value = baseline.trimmean(ratio=ratio)
+    latest_value = latest.trimmean(ratio=ratio)
+    p_value, effect = perf_stats.mann_whitney_sketch(baseline, latest)
+    low, high = perf_stats.bootstrap_ratio_ci_sketch(baseline, latest, ratio=ratio)
+    latest_ratio = latest_value / baseline_value
+
+    if p_value < alpha and low >= threshold:
+        verdict = "regression"
+    elif p_value >= alpha or high < threshold:
+        verdict = "no_regression"
+    elif final:
+        verdict = "regression" if latest_ratio >= threshold else "no_regression"
+    else:
+        verdict = "inconclusive"
+
+    return {
+        "ratio": latest_ratio,
+        "compare": base_compare(baseline=baseline_value, latest=latest_value),
+        "p_value": p_value,
+        "effect": effect,
+        "ci": [low, high],
+        "verdict": verdict,
+    }
+
+
+def data_compare(baseline_case, latest_case, case_name, final=False):
     """
     用于api benchmark 的 单个case性能数 据对比方法
+    基线与待测均带有 "<metric>_sketch" 耗时分布时, 额外给出分布检验结果 "<metric>_stat"
     :param baseline_data: 基线{}
     :param latest_data: 待测{}
+    :param final: 分布检验是否为最后一次对比(不再重测)
     :return:
     """
     res = {}
     res[case_name] = {}
     baseline_dict = {}
     latest_dict = {}
+    baseline_sketch = {}
+    latest_sketch = {}
     if isinstance(baseline_case.get("result"), str):
         baseline_result = json.loads(baseline_case.get("result"))
         baseline_api = baseline_result.get("api")
         baseline_dict["api"] = baseline_api
         for k, v in baseline_result.items():
-            if k not in ["api", "yaml"]:
+            if k.endswith("_sketch"):
+                baseline_sketch[k[: -len("_sketch")]] = v
+            elif k not in ["api", "yaml"]:
                 baseline_dict[k] = float(baseline_result[k])
     else:
         baseline_result = baseline_case.get("result")
         baseline_api = baseline_result.get("api")
         baseline_dict["api"] = baseline_api
         for k, v in baseline_result.items():
-            if k not in ["api", "yaml"]:
+            if k.endswith("_sketch"):
+                baseline_sketch[k[: -len("_sketch")]] = v
+            elif k not in ["api", "yaml"]:
                 baseline_dict[k] = baseline_result[k]
 
     if isinstance(latest_case.get("result"), str):
@@ -60,21 +117,31 @@ def data_compare(baseline_case, latest_case, case_name):
         latest_api = latest_result.get("api")
         latest_dict["api"] = latest_api
         for k, v in latest_result.items():
-            if k not in ["api", "yaml"]:
+            if k.endswith("_sketch"):
+                latest_sketch[k[: -len("_sketch")]] = v
+            elif k not in ["api", "yaml"]:
                 latest_dict[k] = float(latest_result[k])
     else:
         latest_result = latest_case.get("result")
         latest_api = latest_result.get("api")
         latest_dict["api"] = latest_api
         for k, v in latest_result.items():
-            if k not in ["api", "yaml"]:
+            if k.endswith("_sketch"):
+                latest_sketch[k[: -len("_sketch")]] = v
+            elif k not in ["api", "yaml"]:
                 latest_dict[k] = latest_result[k]
 
     res[case_name]["baseline_api"] = baseline_api
     res[case_name]["latest_api"] = latest_api
     for k, v in latest_dict.items():
-        if k not in ["api", "yaml"]:
+        # 旧基线中没有的指标(如 call_floor / forward_net)不参与对比
+        if k not in ["api", "yaml"] and k in baseline_dict:
             res[case_name][k] = base_compare(baseline=baseline_dict[k], latest=latest_dict[k])
+    for k, v in latest_sketch.items():
+        if k in baseline_sketch:
+            res[case_name][k + "_stat"] = sketch_compare(
+                baseline_sketch=baseline_sketch[k], latest_sketch=v, final=final
+            )
 
     return res
 
@@ -233,12 +300,28 @@ def data_compare(baseline_case, latest_case, case_name):
 #     return case_list
 
 
+def stat_grade(stat):
+    """
+    分布检验结果转换为评分
+    :param stat: sketch_compare函数输出的结果
+    :return:
+    """
+    if stat["verdict"] == "regression":
+        return "worse" if stat["ratio"] >= 1.3 else "doubt"
+    elif stat["verdict"] == "inconclusive":
+        return "doubt"
+    else:
+        return "better" if stat["compare"] > 1.15 else "equal"
+
+
 def double_check(res):
     """
-    获取需要 double check 的 api list
+    获取需要 double check 的 api list, 有分布检验结果时仅在检验不确定时重测
     :param res: data_compare函数输出的结果
     :return:
     """
+    if STAT_METRIC + "_stat" in res:
+        return res[STAT_METRIC + "_stat"]["verdict"] == "inconclusive"
     if performance_grade(res["best_total"]) == "doubt":
         return True
     else:
@@ -251,6 +334,8 @@ def bad_check(res):
     :param res: data_compare函数输出的结果
     :return:
     """
+    if STAT_METRIC + "_stat" in res:
+        return stat_grade(res[STAT_METRIC + "_stat"]) in ["doubt", "worse"]
     if performance_grade(res["best_total"]) == "doubt" or performance_grade(res["best_total"]) == "worse":
         return True
     else:
@@ -310,8 +395,17 @@ def ci_level_reveal(compare_res):
         tmp = {}
         # grade = performance_grade(res=compare_dict["forward"])
         # tmp[compare_dict["latest_api"]] = compare_dict["forward"]
-        grade = performance_grade(res=compare_dict["best_total"])
-        tmp[compare_dict["latest_api"]] = compare_dict["best_total"]
+        if STAT_METRIC + "_stat" in compare_dict:
+            stat = compare_dict[STAT_METRIC + "_stat"]
+            grade = stat_grade(stat)
+            tmp[compare_dict["latest_api"]] = {
+                "compare": stat["compare"],
+                "p_value": stat["p_value"],
+                "verdict": stat["verdict"],
+            }
+        else:
+            grade = performance_grade(res=compare_dict["best_total"])
+            tmp[compare_dict["latest_api"]] = compare_dict["best_total"]
         grade_dict[grade].append(tmp)
 
     return grade_dict
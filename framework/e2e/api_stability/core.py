@@ -14,7 +14,7 @@ import paddle
 from paddle import to_tensor
 from utils.logger import logger
 from copy import deepcopy
-
+from stability import StreamChecker
 
 
 class Core(object):
@@ -41,7 +41,6 @@ class Core(object):
         self.hook()
         paddle.set_default_dtype(dtype)
 
-
     def hook(self):
         """
         hook
@@ -135,4 +134,65 @@ class Core(object):
                 self.grad_res.append(grad)
         else:
             raise AttributeError
-        return self.forward_res, self.grad_res
\ No newline at end of file
+        return self.forward_res, self.grad_res
+
+    def _grad_inputs(self):
+        """
+        需要求梯度的输入tensor
+        """
+        inputs = []
+        for value in self.data.values():
+            for v in value if isinstance(value, list) else [value]:
+                if isinstance(v, paddle.Tensor) and not v.stop_gradient:
+                    inputs.append(v)
+        return inputs
+
+    def stream_run(self, stop_on_diverge=True):
+        """
+        流式稳定性执行: 每次结果只与第一次按位比较, 不保存全部结果, 内存不随 loops 增长
+        :param stop_on_diverge: 出现不一致时提前停止
+        :return: (前向检查结果dict, 反向检查结果dict)
+        """
+        api = eval(self.api) if isinstance(self.api, str) else self.api
+        if self._layertypes(api) == "func":
+            input_param = dict(self.data, **self.param)
+
+            def run():
+                return api(**input_param)
+
+        elif self._layertypes(api) == "class":
+            obj = api(**self.param)
+
+            def run():
+                return obj(*self.data.values())
+
+        else:
+            raise AttributeError
+        grad_inputs = self._grad_inputs() if self.enable_backward else []
+        forward = StreamChecker("forward")
+        backward = StreamChecker("backward")
+        for i in range(self.loops):
+            res = run()
+            forward_ok = forward.update(_to_numpy(res))
+            backward_ok = True
+            if grad_inputs:
+                outputs = list(res) if isinstance(res, (list, tuple)) else [res]
+                grad = paddle.grad(outputs, grad_inputs, retain_graph=False, allow_unused=True)
+                backward_ok = backward.update(_to_numpy(grad))
+            if stop_on_diverge and not (forward_ok and backward_ok):
+                break
+        return forward.report(), backward.report()
+
+
+def _to_numpy(res):
+    """
+    api输出或梯度转换为 np.ndarray list, 未使用的梯度记为空数组
+    """
+    if isinstance(res, (list, tuple)):
+        arrays = []
+        for r in res:
+            arrays.extend(_to_numpy(r))
+        return arrays
+    if res is None:
+        return [np.empty([0])]
+    return [res.numpy()]
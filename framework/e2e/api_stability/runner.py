@@ -2,46 +2,89 @@
 # -*- coding: utf-8 -*-
 # @author DDDivano
 # encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
-import paddle
+"""
+api稳定性测试: 每个case循环执行 loops 次, 前向与反向结果流式地与第一次按位比较
+STABILITY_LOOPS: 循环次数, 默认1000
+STABILITY_WORKERS: 并行进程数, 默认1 串行执行
+STABILITY_YAML: case yaml
+"""
+import os
 import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 sys.path.append("..")
 from utils.yaml_loader import YamlLoader
 from utils.logger import Logger
 from utils.weaktrans import WeakTrans, Framework
 from core import Core
-from stability import check_all_arrays_equal
 
-log = Logger("stability", "channel")
-logger = log.get_log()
 # yaml_file = "../yaml/op_correctness_and_stability_phase_one.yml"
-yaml_file = "../yaml/op_correctness_phase_one.yml"
-yaml_loader = YamlLoader(yaml_file)
-cases_name = yaml_loader.get_all_case_name()
+yaml_file = os.environ.get("STABILITY_YAML", "../yaml/op_correctness_phase_one.yml")
+loops = int(os.environ.get("STABILITY_LOOPS", "1000"))
+workers = int(os.environ.get("STABILITY_WORKERS", "1"))
 
-error_list = []
 
-for case_name in cases_name:
-    wk = WeakTrans(yaml_loader.get_case_info(case_name), logger=log)
+def run_case(case_name):
+    """
+    执行单个case
+    :return: (api名, 前向检查结果, 反向检查结果)
+    """
+    log = Logger("stability", "channel")
+    wk = WeakTrans(YamlLoader(yaml_file).get_case_info(case_name), logger=log)
     api_name = wk.get_func(Framework.PADDLE)
     c = Core(api_name, dtype="float32")
+    c.loops = loops
     c.set_paddle_param(wk.get_inputs(Framework.PADDLE), wk.get_params(Framework.PADDLE))
-    forward, grad = c.paddle_run()
-    if check_all_arrays_equal(forward):
-        logger.info(wk.get_func(Framework.PADDLE) + " 前向值全部相同")
+    forward, grad = c.stream_run()
+    return api_name, forward, grad
+
+
+def fail_message(api_name, stage, res):
+    """
+    不一致时的报错信息, 0.0 与 -0.0 的ULP差为0, 符号位不一致的个数单独列出
+    """
+    msg = "{} {}稳定性测试失败: 第 {} 次出现不一致, 最大ULP差 {}".format(api_name, stage, res["diverged_step"], res["max_ulp"])
+    if res["signed_zero"]:
+        msg += ", 0.0 与 -0.0 符号位不一致 {} 处".format(res["signed_zero"])
+    return msg
+
+
+def main():
+    """
+    执行全部case
+    """
+    log = Logger("stability", "channel")
+    logger = log.get_log()
+    cases_name = YamlLoader(yaml_file).get_all_case_name()
+
+    if workers > 1:
+        # paddle 不支持fork后使用, 子进程用spawn启动
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(run_case, cases_name))
     else:
-        # Todo: 报错api记录
-        error_list.append(api_name + "前向稳定性测试失败")
-    if check_all_arrays_equal(grad):
-        logger.info(wk.get_func(Framework.PADDLE) + " 反向值全部相同")
+        results = [run_case(case_name) for case_name in cases_name]
+
+    error_list = []
+    for api_name, forward, grad in results:
+        if forward["ok"]:
+            logger.info("{} 前向值全部相同, 共 {} 次".format(api_name, forward["steps"]))
+        else:
+            # Todo: 报错api记录
+            error_list.append(fail_message(api_name, "前向", forward))
+        if grad["ok"]:
+            logger.info("{} 反向值全部相同, 共 {} 次".format(api_name, grad["steps"]))
+        else:
+            # Todo: 报错api记录
+            error_list.append(fail_message(api_name, "反向", grad))
+    if len(error_list) == 0:
+        logger.info("测试全部通过")
     else:
-        # Todo: 报错api记录
-        error_list.append(api_name + "反向稳定性测试失败")
-if len(error_list) == 0:
-    logger.info("测试全部通过")
-else:
-    logger.info("============ 测试失败，api如下：=============")
-    for err in error_list:
-        logger.info(err)
+        logger.info("============ 测试失败，api如下：=============")
+        for err in error_list:
+            logger.info(err)
+    return len(error_list)
 
 
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,11 @@
 # @author DDDivano
 # encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
 
+import hashlib
 
 import numpy as np
 
+
 def check_all_arrays_equal(lst):
     first_array = lst[0]
     if isinstance(first_array, (np.generic, np.ndarray)):
@@ -35,4 +37,127 @@ def check_all_arrays_equal(lst):
                 return False
         return True
     else:
-        raise TypeError("返回数据类型不能够进行比较")
\ No newline at end of file
+        raise TypeError("返回数据类型不能够进行比较")
+
+
+def _ordered_int(arr):
+    """
+    浮点数按位转换为有序整数, 相邻浮点数差1, 用于计算ULP差
+    """
+    int_type = {2: np.int16, 4: np.int32, 8: np.int64}[arr.dtype.itemsize]
+    bits = arr.view(int_type).astype(np.int64)
+    mag = bits & np.int64(np.iinfo(int_type).max)
+    return np.where(bits < 0, -mag, mag)
+
+
+def ulp_diff(expect, actual):
+    """
+    两个同形状数组的最大差值, 浮点数为ULP, 整数与bool为数值差
+    """
+    if expect.shape != actual.shape or expect.dtype != actual.dtype:
+        return float("inf")
+    if expect.size == 0:
+        return 0
+    if np.issubdtype(expect.dtype, np.floating):
+        a, b = _ordered_int(expect), _ordered_int(actual)
+        # 同号相减不会溢出int64, 异号时差值为绝对值之和
+        same = (a >= 0) == (b >= 0)
+        diff = np.where(
+            same,
+            np.abs(np.where(same, a - b, 0)).astype(np.float64),
+            np.abs(a).astype(np.float64) + np.abs(b).astype(np.float64),
+        )
+    elif np.issubdtype(expect.dtype, np.complexfloating):
+        return max(ulp_diff(expect.real, actual.real), ulp_diff(expect.imag, actual.imag))
+    else:
+        diff = np.abs(expect.astype(np.float64) - actual.astype(np.float64))
+    return float(diff.max())
+
+
+def _bitwise_equal(expect, actual):
+    """
+    按位比较, NaN 与 -0.0 也要求一致
+    """
+    if expect.shape != actual.shape or expect.dtype != actual.dtype:
+        return False
+    expect = np.ascontiguousarray(expect)
+    actual = np.ascontiguousarray(actual)
+    return np.array_equal(expect.view(np.uint8), actual.view(np.uint8))
+
+
+def signed_zero_diff(expect, actual):
+    """
+    0.0 与 -0.0 符号位不一致的元素个数, ulp_diff 中两者的差为0, 需要单独报告
+    """
+    if expect.shape != actual.shape or expect.dtype != actual.dtype:
+        return 0
+    if np.issubdtype(expect.dtype, np.complexfloating):
+        return signed_zero_diff(expect.real, actual.real) + signed_zero_diff(expect.imag, actual.imag)
+    if not np.issubdtype(expect.dtype, np.floating):
+        return 0
+    zero = (expect == 0) & (actual == 0)
+    return int(np.count_nonzero(zero & (np.signbit(expect) != np.signbit(actual))))
+
+
+class StreamChecker(object):
+    """
+    流式一致性检查: 只保留第一次的结果及其摘要, 之后每次结果与之按位比较, 内存不随循环次数增长
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.first = None
+        self.digest = None
+        self.steps = 0
+        self.diverged_step = None
+        self.max_ulp = 0
+        self.signed_zero = 0
+
+    @property
+    def ok(self):
+        """
+        是否全部一致
+        """
+        return self.diverged_step is None
+
+    def update(self, arrays):
+        """
+        检查一次结果
+        :param arrays: np.ndarray list
+        :return: 本次是否与第一次一致
+        """
+        arrays = [np.asarray(a) for a in arrays]
+        step = self.steps
+        self.steps += 1
+        if self.first is None:
+            self.first = [a.copy() for a in arrays]
+            h = hashlib.blake2b(digest_size=16)
+            for a in self.first:
+                h.update(str((a.dtype.str, a.shape)).encode())
+                h.update(np.ascontiguousarray(a).view(np.uint8).tobytes())
+            self.digest = h.hexdigest()
+            return True
+        if len(arrays) == len(self.first) and all(_bitwise_equal(e, a) for e, a in zip(self.first, arrays)):
+            return True
+        if self.diverged_step is None:
+            self.diverged_step = step
+        if len(arrays) != len(self.first):
+            self.max_ulp = float("inf")
+        else:
+            self.max_ulp = max([self.max_ulp] + [ulp_diff(e, a) for e, a in zip(self.first, arrays)])
+            self.signed_zero += sum(signed_zero_diff(e, a) for e, a in zip(self.first, arrays))
+        return False
+
+    def report(self):
+        """
+        检查结果
+        """
+        return {
+            "name": self.name,
+            "ok": self.ok,
+            "steps": self.steps,
+            "diverged_step": self.diverged_step,
+            "max_ulp": self.max_ulp,
+            "signed_zero": self.signed_zero,
+            "digest": self.digest,
+        }
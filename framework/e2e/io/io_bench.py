@@ -0,0 +1,341 @@
+"""
+io_bench
+DataLoader 性能测试: 复用 dataloader.yml 中的case生成dataset, 扫描
+num_workers / use_shared_memory / batch_size / sampler / 样本读取耗时(CPU型、IO型),
+统计 samples/s、首个batch耗时、worker启动耗时、峰值内存(PSS), 并与基线对比
+python io_bench.py --yaml dataloader.yml --output io_bench.json --baseline io_bench_base.json
+"""
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import itertools
+import threading
+
+curPath = os.path.abspath(os.path.dirname("utils"))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+sys.path.append(os.path.join(rootPath, "api_benchmark_new"))
+
+from paddle.io import Dataset
+from utils import perf_stats
+from utils.logger import Logger
+from strategy.compare import base_compare, sketch_compare, stat_grade
+from io_trans import DataLoaderTrans
+from io_reader import GenDataset
+from io_exec import GTCase
+
+logger = Logger("io_bench")
+
+# 默认扫描配置, case中的 benchmark 字段与命令行参数可覆盖
+BENCH_SWEEP = {
+    "num_workers": [0, 2, 4],
+    "use_shared_memory": [True, False],
+    "batch_size": [16, 64],
+    "sampler": ["SequenceSampler", "RandomSampler"],
+    # type: none / cpu(计算型, 占用GIL) / io(等待型, 释放GIL), us: 单个样本耗时(微秒)
+    "item_cost": [{"type": "none"}, {"type": "cpu", "us": 200}, {"type": "io", "us": 500}],
+    "num_samples": 1024,
+    "epochs": 3,
+}
+
+
+class CostDataset(Dataset):
+    """
+    为 __getitem__ 附加固定耗时的dataset, 模拟数据增强(CPU型)与读盘(IO型)
+    """
+
+    def __init__(self, dataset, cost_type="none", cost_us=0):
+        """
+        init
+        """
+        self.dataset = dataset
+        self.cost_type = cost_type
+        self.cost = cost_us / 1e6
+
+    def __getitem__(self, idx):
+        """
+        get item
+        """
+        if self.cost_type == "cpu":
+            deadline = time.perf_counter() + self.cost
+            while time.perf_counter() < deadline:
+                pass
+        elif self.cost_type == "io":
+            time.sleep(self.cost)
+        return self.dataset[idx]
+
+    def __len__(self):
+        """
+        len
+        """
+        return len(self.dataset)
+
+
+def _proc_pss(pid):
+    """
+    进程当前PSS(byte): 共享页按共享进程数分摊, 多进程相加不会重复计算fork后写时复制共享的页
+    读取 /proc/<pid>/smaps_rollup, 内核不支持时累加 smaps, 都不可读时退化为 statm 中的RSS
+    """
+    for name in ["smaps_rollup", "smaps"]:
+        try:
+            with open("/proc/{}/{}".format(pid, name), "r") as f:
+                pss = [int(line.split()[1]) for line in f if line.startswith("Pss:")]
+        except (OSError, ValueError, IndexError):
+            continue
+        if pss:
+            return sum(pss) * 1024
+    try:
+        with open("/proc/{}/statm".format(pid), "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _children(pid):
+    """
+    子进程pid list
+    """
+    try:
+        with open("/proc/{pid}/task/{pid}/children".format(pid=pid), "r") as f:
+            return [int(p) for p in f.read().split()]
+    except (OSError, ValueError):
+        return []
+
+
+class MemMonitor(object):
+    """
+    后台线程采样 主进程+worker子进程 的PSS之和, 记录峰值
+    worker由fork创建, 与主进程共享的页在各进程RSS中都会计入, 相加会重复计算, 因此使用PSS
+    无 /proc 的系统退化为主进程 ru_maxrss
+    """
+
+    def __init__(self, interval=0.02):
+        """
+        init
+        """
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        pid = os.getpid()
+        pss = _proc_pss(pid) + sum(_proc_pss(child) for child in _children(pid))
+        self.peak = max(self.peak, pss)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        if os.path.exists("/proc/self/statm"):
+            self._sample()
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._sample()
+        else:
+            # linux 单位KB, mac 单位byte
+            scale = 1 if sys.platform == "darwin" else 1024
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def bench_key(case_name, config):
+    """
+    结果与基线的索引key
+    """
+    cost = config["item_cost"]
+    return "{}|{}|bs{}|w{}|shm{}|{}{}".format(
+        case_name,
+        config["sampler"],
+        config["batch_size"],
+        config["num_workers"],
+        int(config["use_shared_memory"]),
+        cost["type"],
+        cost.get("us", ""),
+    )
+
+
+def sweep_configs(sweep):
+    """
+    展开扫描配置, num_workers=0 时 use_shared_memory 无效, 只保留一组
+    """
+    configs = []
+    seen = set()
+    for workers, shm, bs, sampler, cost in itertools.product(
+        sweep["num_workers"], sweep["use_shared_memory"], sweep["batch_size"], sweep["sampler"], sweep["item_cost"]
+    ):
+        shm = shm if workers > 0 else True
+        config = {"num_workers": workers, "use_shared_memory": shm, "batch_size": bs, "sampler": sampler}
+        config["item_cost"] = cost
+        key = bench_key("", config)
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+    return configs
+
+
+class BenchCase(GTCase):
+    """
+    DataLoader benchmark
+    """
+
+    def __init__(self, yaml, sweep=None):
+        """
+        initialize
+        """
+        super(BenchCase, self).__init__(yaml)
+        self.sweep = dict(BENCH_SWEEP, **(sweep or {}))
+
+    def bench_cases(self, cases=None):
+        """
+        参与测试的case, 默认为带 benchmark 字段的case, 均未设置时测试全部case
+        """
+        names = list(self.obj.get_all_case_name())
+        if cases:
+            return [name for name in names if name in cases]
+        marked = [name for name in names if self.obj.get_case_info(name)["info"].get("benchmark") is not None]
+        return marked or names
+
+    def _generate_dataset(self, dataset_info, num_samples=None):
+        """
+        generate dataset, 数据集单元按 num_samples 生成
+        """
+        if isinstance(dataset_info, str):
+            return GenDataset(dataset_info)
+        return GenDataset(dataset_info, num_samples=num_samples)
+
+    def _measure(self, dataset, config, epochs):
+        """
+        测试单个配置
+        :return: 结果dict
+        """
+        cost = config["item_cost"]
+        cost_dataset = CostDataset(dataset, cost["type"], cost.get("us", 0))
+        batch_sampler_info = {"batch_size": config["batch_size"], "shuffle": False, "drop_last": False}
+        batch_sampler_info["sampler"] = {"type": config["sampler"]}
+        other_params_info = {"num_workers": config["num_workers"], "use_shared_memory": config["use_shared_memory"]}
+
+        batch_latency = perf_stats.StreamingStatistics(relative_accuracy=0.005)
+        samples_per_sec = []
+        first_batch = []
+        startup = []
+        with MemMonitor() as mem:
+            for _ in range(epochs):
+                data_loader = self._generate_dataloader(cost_dataset, batch_sampler_info, other_params_info)
+                start = time.perf_counter()
+                it = iter(data_loader)
+                startup.append(time.perf_counter() - start)
+                first = next(it)
+                last = time.perf_counter()
+                first_batch.append(last - start)
+                n = 0
+                for batch in itertools.chain([first], it):
+                    now = time.perf_counter()
+                    size = len(batch[0])
+                    if n > 0:
+                        # 每个样本的平均耗时, 不含首个batch
+                        batch_latency.add((now - last) / size)
+                    n += size
+                    last = now
+                steady = last - start - first_batch[-1]
+                samples_per_sec.append((n - len(first[0])) / steady if steady > 0 else float("nan"))
+                del it, data_loader
+        return {
+            "config": config,
+            "samples": len(dataset),
+            "samples_per_sec": perf_stats.mean(samples_per_sec),
+            "first_batch": perf_stats.best(first_batch),
+            "startup": perf_stats.best(startup),
+            "peak_pss_mb": mem.peak / 1024 / 1024,
+            "batch_sketch": batch_latency.to_dict(),
+        }
+
+    def run_bench(self, cases=None):
+        """
+        执行benchmark
+        :return: {key: 结果dict}
+        """
+        results = {}
+        for name in self.bench_cases(cases):
+            case = self.obj.get_case_info(name)
+            sweep = dict(self.sweep, **(case["info"].get("benchmark") or {}))
+            # dataset 只解析生成一次, 所有配置共用
+            trans_obj = DataLoaderTrans(case)
+            dataset = self._generate_dataset(trans_obj.get_dataset(), sweep["num_samples"])
+            for config in sweep_configs(sweep):
+                key = bench_key(name, config)
+                try:
+                    res = self._measure(dataset, config, sweep["epochs"])
+                except Exception as e:  # 单个配置失败不影响其他配置
+                    self.logger.get_log().error("{} failed: {}".format(key, e))
+                    continue
+                results[key] = res
+                self.logger.get_log().info(
+                    "{}: {:.1f} samples/s, first batch {:.4f}s, startup {:.4f}s, peak pss {:.1f}MB".format(
+                        key, res["samples_per_sec"], res["first_batch"], res["startup"], res["peak_pss_mb"]
+                    )
+                )
+        return results
+
+
+def compare_bench(baseline, latest, threshold=1.15, alpha=0.01):
+    """
+    与基线对比, 吞吐按 base_compare 计算比值, 单样本耗时分布按 sketch_compare 检验
+    :return: {key: 对比结果}
+    """
+    res = {}
+    for key, latest_res in latest.items():
+        base_res = baseline.get(key)
+        if base_res is None:
+            continue
+        # 吞吐越大越好, 用单样本耗时与 base_compare 的口径保持一致
+        compare = base_compare(1.0 / base_res["samples_per_sec"], 1.0 / latest_res["samples_per_sec"])
+        stat = sketch_compare(base_res["batch_sketch"], latest_res["batch_sketch"], threshold=threshold, alpha=alpha)
+        # 旧基线记录的是RSS之和, 与PSS口径不同, 不做对比
+        pss_diff = latest_res["peak_pss_mb"] - base_res["peak_pss_mb"] if "peak_pss_mb" in base_res else None
+        res[key] = {
+            "samples_per_sec": latest_res["samples_per_sec"],
+            "samples_per_sec_base": base_res["samples_per_sec"],
+            "compare": compare,
+            "first_batch_diff": latest_res["first_batch"] - base_res["first_batch"],
+            "peak_pss_diff_mb": pss_diff,
+            "stat": stat,
+            "grade": stat_grade(stat),
+        }
+    return res
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DataLoader benchmark")
+    parser.add_argument("--yaml", default="dataloader.yml", help="case yaml")
+    parser.add_argument("--cases", nargs="*", default=None, help="case名, 默认带benchmark字段的case")
+    parser.add_argument("--sweep", default=None, help="覆盖默认扫描配置的json")
+    parser.add_argument("--output", default="io_bench.json", help="结果文件")
+    parser.add_argument("--baseline", default=None, help="基线结果文件")
+    args = parser.parse_args()
+
+    obj = BenchCase(args.yaml, sweep=json.loads(args.sweep) if args.sweep else None)
+    bench_res = obj.run_bench(args.cases)
+    with open(args.output, "w") as f:
+        json.dump(bench_res, f)
+
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            compare_res = compare_bench(json.load(f), bench_res)
+        worse = {k: v for k, v in compare_res.items() if v["grade"] in ["doubt", "worse"]}
+        for k, v in compare_res.items():
+            logger.get_log().info("{}: {} compare {:.3f}".format(k, v["grade"], v["compare"]))
+        if worse:
+            logger.get_log().error("============ 性能下降的配置如下: =============")
+            for k, v in worse.items():
+                logger.get_log().error("{}: {}".format(k, v))
+            sys.exit(1)
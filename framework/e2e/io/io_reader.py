@@ -3,7 +3,7 @@ io_reader
 """
 import json
 import gzip
-from collections import Iterator
+from collections.abc import Iterator
 import paddle
 from paddle.io import Dataset
 from utils.logger import Logger
@@ -0,0 +1,247 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+db writer 批量异步写库: 连接池 + executemany 批量插入 + 后台刷写线程 + 本地落盘重放
+api_benchmark_new 与 PaddleLT_new 的 DB 类共用, 任意 DB-API 2.0 连接均可(pymysql / sqlite3)
+"""
+import os
+import json
+import queue
+import threading
+import traceback
+
+
+class ConnectionPool(object):
+    """
+    简单连接池, 连接按需创建, 最多 size 个
+    """
+
+    def __init__(self, connect_func, size=2):
+        """
+        :param connect_func: 无参函数, 返回一个新的 DB-API 连接
+        :param size: 连接池大小
+        """
+        self.connect_func = connect_func
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def get(self, timeout=None):
+        """
+        取出一个连接, 池中无空闲连接且未达上限时新建
+        """
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self.connect_func()
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._idle.get(timeout=timeout)
+
+    def put(self, conn):
+        """
+        归还连接
+        """
+        self._idle.put(conn)
+
+    def discard(self, conn):
+        """
+        丢弃损坏的连接, 释放名额
+        """
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def close(self):
+        """
+        关闭所有空闲连接
+        """
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(conn)
+
+
+class BatchWriter(object):
+    """
+    批量异步写库:
+    1. write 将行数据放入有界队列(队列满时阻塞, 内存有上限)
+    2. 后台线程按 (表, 列) 分组, 每 batch_size 行执行一次参数化 executemany 并 commit
+    3. 写库失败时将该批数据追加到本地 jsonl 落盘文件, 之后可通过 replay 重放
+    """
+
+    def __init__(
+        self,
+        pool,
+        batch_size=200,
+        max_pending=10000,
+        flush_interval=1.0,
+        spill_file="db_spill.jsonl",
+        placeholder="%s",
+        retry=3,
+    ):
+        """
+        :param pool: ConnectionPool
+        :param batch_size: 单次 executemany 的最大行数
+        :param max_pending: 队列中最多缓存的行数
+        :param flush_interval: 未攒满一批时的最长等待时间(秒)
+        :param spill_file: 写库失败时的本地落盘文件
+        :param placeholder: 参数占位符, pymysql 为 %s, sqlite3 为 ?
+        :param retry: 单批写库失败的重试次数
+        """
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_file = spill_file
+        self.placeholder = placeholder
+        self.retry = retry
+
+        self.written = 0
+        self.spilled = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._spill_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def write(self, table, data):
+        """
+        异步写入一行, 值为None的列不写入
+        :param table: 表名
+        :param data: dict, 列名 -> 值
+        """
+        row = {k: v for k, v in data.items() if v is not None}
+        self._queue.put((table, row))
+
+    def flush(self):
+        """
+        阻塞等待队列中已有的数据全部写库(或落盘)
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        写完剩余数据后停止后台线程
+        """
+        self._queue.put(None)
+        self._thread.join()
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _loop(self):
+        """
+        后台刷写线程
+        """
+        pending = []
+        stop = False
+        while not stop:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = False
+            if item is None:
+                stop = True
+                self._queue.task_done()
+            elif item is not False:
+                pending.append(item)
+            if pending and (stop or item is False or len(pending) >= self.batch_size):
+                self._write_batch(pending)
+                for _ in pending:
+                    self._queue.task_done()
+                pending = []
+
+    def _write_batch(self, rows):
+        """
+        按 (表, 列) 分组后批量写库, 失败时落盘
+        """
+        groups = {}
+        for table, row in rows:
+            keys = tuple(row.keys())
+            groups.setdefault((table, keys), []).append(tuple(row[k] for k in keys))
+
+        for (table, keys), values in groups.items():
+            if self.executemany(table, keys, values):
+                self.written += len(values)
+            else:
+                self._spill(table, keys, values)
+
+    def executemany(self, table, keys, values):
+        """
+        参数化批量插入
+        :return: 是否写库成功
+        """
+        sql = "INSERT INTO `{}`({}) VALUES ({})".format(
+            table, ",".join("`{}`".format(k) for k in keys), ",".join([self.placeholder] * len(keys))
+        )
+        for _ in range(self.retry):
+            try:
+                conn = self.pool.get(timeout=self.flush_interval)
+            except Exception as e:
+                print("db connect failed: {}".format(e))
+                continue
+            try:
+                cursor = conn.cursor()
+                cursor.executemany(sql, values)
+                conn.commit()
+                cursor.close()
+                self.pool.put(conn)
+                return True
+            except Exception:
+                print(traceback.format_exc())
+                self.pool.discard(conn)
+        return False
+
+    def _spill(self, table, keys, values):
+        """
+        写库失败的数据追加到本地 jsonl 文件
+        """
+        with self._spill_lock:
+            with open(self.spill_file, "a") as f:
+                for value in values:
+                    f.write(json.dumps({"table": table, "data": dict(zip(keys, value))}) + "\n")
+        self.spilled += len(values)
+        print("db unreachable, {} rows spilled to {}".format(len(values), self.spill_file))
+
+    def replay(self):
+        """
+        重放本地落盘数据, 成功写库的部分从落盘文件中移除
+        :return: 重放成功的行数
+        """
+        with self._spill_lock:
+            if not os.path.exists(self.spill_file):
+                return 0
+            with open(self.spill_file, "r") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+            os.remove(self.spill_file)
+
+        groups = {}
+        for record in records:
+            keys = tuple(record["data"].keys())
+            groups.setdefault((record["table"], keys), []).append(tuple(record["data"][k] for k in keys))
+
+        replayed = 0
+        for (table, keys), values in groups.items():
+            for start in range(0, len(values), self.batch_size):
+                batch = values[start : start + self.batch_size]
+                if self.executemany(table, keys, batch):
+                    replayed += len(batch)
+                else:
+                    self._spill(table, keys, batch)
+        return replayed
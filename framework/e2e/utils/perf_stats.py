@@ -0,0 +1,402 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+perf stats 性能统计引擎, api_benchmark_new 与 PaddleLT_new 共用
+支持 list / array('d') / ndarray 样本, 以及不保存全部样本的流式统计
+"""
+import math
+
+import numpy as np
+
+
+def as_array(data_list):
+    """
+    将样本转换为float64 ndarray, array('d')与float64 ndarray不产生拷贝
+    :param data_list: list / array('d') / ndarray
+    :return: 一维ndarray
+    """
+    if isinstance(data_list, np.ndarray):
+        return data_list.astype(np.float64, copy=False).ravel()
+    if hasattr(data_list, "typecode") and data_list.typecode == "d":
+        return np.frombuffer(data_list, dtype=np.float64)
+    return np.asarray(data_list, dtype=np.float64).ravel()
+
+
+def trimmean(data_list, ratio=0.2):
+    """
+    掐头去尾求平均, 截取规则与原sorted实现一致, 使用partition代替全排序
+    :param data_list: 输入的data list, 多次试验的结果集合
+    :param ratio: 头尾各去掉的比例
+    """
+    data = as_array(data_list)
+    n = len(data)
+    head = int(n * ratio)
+    tail = int(n - n * ratio)
+    if head == 0 and tail == n:
+        return float(data.mean())
+    part = np.partition(data, (head, tail - 1))
+    return float(part[head:tail].mean())
+
+
+def mean(data_list):
+    """
+    求平均值
+    :param data_list: 输入的data list, 多次试验的结果集合
+    """
+    return float(as_array(data_list).mean())
+
+
+def best(data_list):
+    """
+    找出耗时最少的一次试验结果
+    :param data_list: 输入的data list, 多次试验的结果集合
+    """
+    return float(as_array(data_list).min())
+
+
+def best_top_k(data_list, ratio=0.2):
+    """
+    求最优top k的平均值，默认ratio=0.2
+    :param data_list: 输入的data list, 多次试验的结果集合
+    """
+    data = as_array(data_list)
+    head = int(len(data) * ratio)
+    part = np.partition(data, head - 1)
+    return float(part[:head].mean())
+
+
+def percentile(data_list, q=(50, 90, 99)):
+    """
+    求分位数
+    :param data_list: 输入的data list, 多次试验的结果集合
+    :param q: 分位数, 单个数值或序列
+    :return: q为序列时返回 {"p50": ..., "p90": ...}, 否则返回float
+    """
+    data = as_array(data_list)
+    if np.ndim(q) == 0:
+        return float(np.percentile(data, q))
+    res = np.percentile(data, q)
+    return {"p{:g}".format(k): float(v) for k, v in zip(q, res)}
+
+
+def mad_filter(data_list, k=3.0):
+    """
+    基于MAD(中位数绝对偏差)剔除离群点
+    :param data_list: 输入的data list, 多次试验的结果集合
+    :param k: 阈值倍数, 保留 |x - median| <= k * 1.4826 * MAD 的样本
+    :return: 剔除离群点后的ndarray
+    """
+    data = as_array(data_list)
+    median = np.median(data)
+    mad = np.median(np.abs(data - median)) * 1.4826
+    if mad == 0:
+        return data[data == median]
+    return data[np.abs(data - median) <= k * mad]
+
+
+def bootstrap_ci(data_list, method="trimmean", ratio=0.2, n_boot=1000, alpha=0.05, seed=33, max_elements=2**22):
+    """
+    bootstrap 置信区间, 分块向量化重采样以限制内存
+    :param data_list: 输入的data list, 多次试验的结果集合
+    :param method: 统计量, trimmean / mean / best_top_k / p50 等分位数
+    :param ratio: trimmean / best_top_k 的比例
+    :param n_boot: 重采样次数
+    :param alpha: 置信区间为 [alpha/2, 1-alpha/2]
+    :param seed: 随机种子
+    :param max_elements: 单次重采样矩阵的最大元素数
+    :return: (low, high)
+    """
+    data = as_array(data_list)
+    n = len(data)
+    rng = np.random.default_rng(seed)
+    chunk = max(1, max_elements // n)
+    stats = np.empty(n_boot, dtype=np.float64)
+    done = 0
+    while done < n_boot:
+        size = min(chunk, n_boot - done)
+        samples = data[rng.integers(0, n, size=(size, n))]
+        stats[done : done + size] = _batch_statistic(samples, method, ratio)
+        done += size
+    low, high = np.percentile(stats, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+    return float(low), float(high)
+
+
+def _batch_statistic(samples, method, ratio):
+    """
+    对二维样本矩阵逐行计算统计量
+    """
+    n = samples.shape[1]
+    if method == "mean":
+        return samples.mean(axis=1)
+    if method == "trimmean":
+        head = int(n * ratio)
+        tail = int(n - n * ratio)
+        return np.sort(samples, axis=1)[:, head:tail].mean(axis=1)
+    if method == "best_top_k":
+        head = int(n * ratio)
+        return np.sort(samples, axis=1)[:, :head].mean(axis=1)
+    if method.startswith("p"):
+        return np.percentile(samples, float(method[1:]), axis=1)
+    raise ValueError("unsupported bootstrap method: {}".format(method))
+
+
+class StreamingStatistics(object):
+    """
+    流式统计: 按对数分桶累计样本, 不保存原始样本
+    min/max/mean为精确值, trimmean/best_top_k/分位数的相对误差不超过 relative_accuracy
+    """
+
+    def __init__(self, relative_accuracy=0.001):
+        """
+        :param relative_accuracy: 分桶的相对精度
+        """
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # 正数与负数(按绝对值)分别分桶, key为桶序号, value为计数
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def _key(self, value):
+        """
+        桶序号
+        """
+        return int(math.ceil(math.log(value) / self.log_gamma))
+
+    def add(self, value):
+        """
+        加入单个样本
+        """
+        value = float(value)
+        if value > 0:
+            key = self._key(value)
+            self.positive[key] = self.positive.get(key, 0) + 1
+        elif value < 0:
+            key = self._key(-value)
+            self.negative[key] = self.negative.get(key, 0) + 1
+        else:
+            self.zero += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def extend(self, data_list):
+        """
+        批量加入样本(向量化)
+        """
+        data = as_array(data_list)
+        if len(data) == 0:
+            return
+        for store, values in ((self.positive, data[data > 0]), (self.negative, -data[data < 0])):
+            if len(values) == 0:
+                continue
+            keys, counts = np.unique(np.ceil(np.log(values) / self.log_gamma).astype(np.int64), return_counts=True)
+            for key, cnt in zip(keys.tolist(), counts.tolist()):
+                store[key] = store.get(key, 0) + cnt
+        self.zero += int((data == 0).sum())
+        self.count += len(data)
+        self.total += float(data.sum())
+        self.min = min(self.min, float(data.min()))
+        self.max = max(self.max, float(data.max()))
+
+    def merge(self, other):
+        """
+        合并另一个相同精度的StreamingStatistics
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("can not merge StreamingStatistics with different relative_accuracy")
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, cnt in other_store.items():
+                store[key] = store.get(key, 0) + cnt
+        self.zero += other.zero
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def _buckets(self):
+        """
+        按数值升序返回 (代表值ndarray, 计数ndarray)
+        """
+        values = []
+        counts = []
+        for key in sorted(self.negative.keys(), reverse=True):
+            values.append(-2 * self.gamma**key / (self.gamma + 1))
+            counts.append(self.negative[key])
+        if self.zero:
+            values.append(0.0)
+            counts.append(self.zero)
+        for key in sorted(self.positive.keys()):
+            values.append(2 * self.gamma**key / (self.gamma + 1))
+            counts.append(self.positive[key])
+        values = np.clip(np.array(values, dtype=np.float64), self.min, self.max)
+        return values, np.array(counts, dtype=np.int64)
+
+    def _rank_mean(self, head, tail):
+        """
+        升序排名 [head, tail) 区间内样本的近似均值
+        """
+        values, counts = self._buckets()
+        ends = np.cumsum(counts)
+        starts = ends - counts
+        taken = np.clip(np.minimum(ends, tail) - np.maximum(starts, head), 0, None)
+        return float((values * taken).sum() / (tail - head))
+
+    def mean(self):
+        """
+        平均值(精确)
+        """
+        return self.total / self.count
+
+    def best(self):
+        """
+        最小值(精确)
+        """
+        return self.min
+
+    def trimmean(self, ratio=0.2):
+        """
+        掐头去尾求平均(近似)
+        """
+        head = int(self.count * ratio)
+        tail = int(self.count - self.count * ratio)
+        return self._rank_mean(head, tail)
+
+    def best_top_k(self, ratio=0.2):
+        """
+        最优top k的平均值(近似)
+        """
+        return self._rank_mean(0, int(self.count * ratio))
+
+    def percentile(self, q=(50, 90, 99)):
+        """
+        分位数(近似, 取最近排名)
+        """
+        values, counts = self._buckets()
+        ends = np.cumsum(counts)
+        qs = [q] if np.ndim(q) == 0 else list(q)
+        res = {}
+        for k in qs:
+            rank = min(self.count - 1, int(math.ceil(k / 100.0 * self.count)) - 1)
+            res["p{:g}".format(k)] = float(values[np.searchsorted(ends, max(rank, 0), side="right")])
+        if np.ndim(q) == 0:
+            return res["p{:g}".format(q)]
+        return res
+
+    def to_dict(self):
+        """
+        序列化为可json化的dict
+        """
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "positive": {str(k): v for k, v in self.positive.items()},
+            "negative": {str(k): v for k, v in self.negative.items()},
+            "zero": self.zero,
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        由to_dict的结果恢复
+        """
+        obj = cls(relative_accuracy=state["relative_accuracy"])
+        obj.positive = {int(k): v for k, v in state["positive"].items()}
+        obj.negative = {int(k): v for k, v in state["negative"].items()}
+        obj.zero = state["zero"]
+        obj.count = state["count"]
+        obj.total = state["total"]
+        obj.min = state["min"]
+        obj.max = state["max"]
+        return obj
+
+
+def _as_sketch(sketch):
+    """
+    dict(to_dict结果) 或 StreamingStatistics 统一转换为 StreamingStatistics
+    """
+    if isinstance(sketch, StreamingStatistics):
+        return sketch
+    return StreamingStatistics.from_dict(sketch)
+
+
+def _aligned_buckets(baseline, latest):
+    """
+    将两个sketch的分桶对齐到同一组升序代表值上
+    :return: (代表值, baseline计数, latest计数)
+    """
+    base_values, base_counts = baseline._buckets()
+    latest_values, latest_counts = latest._buckets()
+    values = np.union1d(base_values, latest_values)
+    base_aligned = np.zeros(len(values), dtype=np.int64)
+    latest_aligned = np.zeros(len(values), dtype=np.int64)
+    np.add.at(base_aligned, np.searchsorted(values, base_values), base_counts)
+    np.add.at(latest_aligned, np.searchsorted(values, latest_values), latest_counts)
+    return values, base_aligned, latest_aligned
+
+
+def mann_whitney_sketch(baseline, latest):
+    """
+    基于sketch分桶的单侧 Mann-Whitney U 检验, H1: latest 整体大于 baseline(变慢)
+    同一分桶内的样本视为相等(ties), 使用带ties修正的正态近似
+    :param baseline: 基线sketch, dict 或 StreamingStatistics
+    :param latest: 待测sketch, dict 或 StreamingStatistics
+    :return: (p_value, effect), effect = P(latest > baseline) + 0.5 * P(latest == baseline)
+    """
+    baseline = _as_sketch(baseline)
+    latest = _as_sketch(latest)
+    _, base_counts, latest_counts = _aligned_buckets(baseline, latest)
+    n1 = float(latest_counts.sum())
+    n2 = float(base_counts.sum())
+    below = np.cumsum(base_counts) - base_counts
+    u = float((latest_counts * (below + 0.5 * base_counts)).sum())
+    effect = u / (n1 * n2)
+
+    n = n1 + n2
+    ties = (base_counts + latest_counts).astype(np.float64)
+    tie_term = float((ties**3 - ties).sum()) / (n * (n - 1))
+    sigma = math.sqrt(n1 * n2 / 12.0 * ((n + 1) - tie_term))
+    if sigma == 0:
+        return 1.0, effect
+    z = (u - n1 * n2 / 2.0) / sigma
+    p_value = 0.5 * math.erfc(z / math.sqrt(2))
+    return p_value, effect
+
+
+def bootstrap_ratio_ci_sketch(baseline, latest, ratio=0.2, n_boot=500, alpha=0.05, seed=33):
+    """
+    基于sketch分桶的多项分布bootstrap, 求 latest/baseline 截尾均值比值的置信区间
+    :param baseline: 基线sketch, dict 或 StreamingStatistics
+    :param latest: 待测sketch, dict 或 StreamingStatistics
+    :param ratio: 截尾均值比例
+    :param n_boot: 重采样次数
+    :param alpha: 置信区间为 [alpha/2, 1-alpha/2]
+    :param seed: 随机种子
+    :return: (low, high)
+    """
+    rng = np.random.default_rng(seed)
+
+    def boot_trimmean(sketch):
+        values, counts = sketch._buckets()
+        n = int(counts.sum())
+        head = int(n * ratio)
+        tail = int(n - n * ratio)
+        boot_counts = rng.multinomial(n, counts / counts.sum(), size=n_boot)
+        ends = np.cumsum(boot_counts, axis=1)
+        starts = ends - boot_counts
+        taken = np.clip(np.minimum(ends, tail) - np.maximum(starts, head), 0, None)
+        return (taken * values).sum(axis=1) / (tail - head)
+
+    boot_ratio = boot_trimmean(_as_sketch(latest)) / boot_trimmean(_as_sketch(baseline))
+    low, high = np.percentile(boot_ratio, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+    return float(low), float(high)
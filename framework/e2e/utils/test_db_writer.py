@@ -0,0 +1,111 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+test db_writer, 使用sqlite3代替mysql
+"""
+import os
+import sqlite3
+
+from utils.db_writer import ConnectionPool, BatchWriter
+
+
+def _sqlite_pool(db_file, reachable):
+    """
+    sqlite连接池, reachable[0] 为False时模拟数据库不可达
+    """
+
+    def connect():
+        if not reachable[0]:
+            raise sqlite3.OperationalError("db unreachable")
+        return sqlite3.connect(db_file, check_same_thread=False)
+
+    return ConnectionPool(connect, size=2)
+
+
+def _rows(db_file):
+    """
+    读取case表全部数据
+    """
+    conn = sqlite3.connect(db_file)
+    rows = conn.execute("SELECT name, value FROM `case` ORDER BY name").fetchall()
+    conn.close()
+    return rows
+
+
+def _create_table(db_file):
+    """
+    建表
+    """
+    conn = sqlite3.connect(db_file)
+    conn.execute("CREATE TABLE `case` (name TEXT, value REAL)")
+    conn.commit()
+    conn.close()
+
+
+def test_batch_write(tmp_path):
+    """
+    批量写库, 值为None的列不写入
+    """
+    db_file = str(tmp_path / "bench.db")
+    _create_table(db_file)
+    pool = _sqlite_pool(db_file, [True])
+    with BatchWriter(pool, batch_size=3, flush_interval=0.05, placeholder="?") as writer:
+        for i in range(7):
+            writer.write("case", {"name": "case_{}".format(i), "value": float(i)})
+        writer.write("case", {"name": "case_none", "value": None})
+        writer.flush()
+        assert writer.written == 8
+        assert writer.spilled == 0
+    rows = _rows(db_file)
+    assert len(rows) == 8
+    assert ("case_none", None) in rows
+
+
+def test_spill_and_replay(tmp_path):
+    """
+    数据库不可达时落盘, 恢复后重放写库并清理落盘文件
+    """
+    db_file = str(tmp_path / "bench.db")
+    spill_file = str(tmp_path / "spill.jsonl")
+    _create_table(db_file)
+    reachable = [False]
+    pool = _sqlite_pool(db_file, reachable)
+    writer = BatchWriter(pool, batch_size=4, flush_interval=0.05, spill_file=spill_file, placeholder="?", retry=2)
+    for i in range(5):
+        writer.write("case", {"name": "case_{}".format(i), "value": i * 0.5})
+    writer.flush()
+    assert writer.written == 0
+    assert writer.spilled == 5
+    assert os.path.exists(spill_file)
+    assert _rows(db_file) == []
+
+    reachable[0] = True
+    assert writer.replay() == 5
+    assert not os.path.exists(spill_file)
+    assert _rows(db_file) == [("case_{}".format(i), i * 0.5) for i in range(5)]
+    assert writer.replay() == 0
+    writer.close()
+
+
+def test_replay_failed_keeps_spill(tmp_path):
+    """
+    重放时数据库仍不可达, 数据重新落盘不丢失
+    """
+    db_file = str(tmp_path / "bench.db")
+    spill_file = str(tmp_path / "spill.jsonl")
+    _create_table(db_file)
+    reachable = [False]
+    writer = BatchWriter(
+        _sqlite_pool(db_file, reachable), flush_interval=0.05, spill_file=spill_file, placeholder="?", retry=1
+    )
+    writer.write("case", {"name": "case_0", "value": 1.0})
+    writer.flush()
+    assert writer.replay() == 0
+    with open(spill_file, "r") as f:
+        assert len(f.readlines()) == 1
+
+    reachable[0] = True
+    assert writer.replay() == 1
+    assert _rows(db_file) == [("case_0", 1.0)]
+    writer.close()
@@ -3,30 +3,206 @@
 # @author DDDivano
 # encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
 """
-多线程执行器
+多进程执行器
 """
 import sys
 import os
-import queue
+import json
+import glob
+import random
 import time
+import uuid
 import platform
-import threading
 import argparse
+import traceback
+import importlib.util
+import multiprocessing
+from multiprocessing.connection import wait
+import xml.etree.ElementTree as ET
+import numpy as np
 import wget
 
+FRAMEWORK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _purge_local_modules(base_modules):
+    """
+    清理上一个case导入的本地模块(apibase/test_xxx等), 各目录下存在同名模块
+    """
+    for name, module in list(sys.modules.items()):
+        if name in base_modules:
+            continue
+        module_file = getattr(module, "__file__", None) or ""
+        if os.path.abspath(module_file).startswith(FRAMEWORK_DIR + os.sep):
+            del sys.modules[name]
+
+
+def _case_file(report_dir, task, sub_dir, suffix):
+    """
+    case对应的日志/junit文件路径
+    """
+    name = task["key"][: -len(".py")].replace(os.sep, ".")
+    return os.path.join(report_dir, sub_dir, name + suffix)
+
+
+def _run_module(task, report_dir, base_path, base_modules):
+    """
+    worker内执行单个case文件, 输出重定向至日志文件
+    """
+    import pytest
+
+    _purge_local_modules(base_modules)
+    os.chdir(task["path"])
+    sys.path[:] = [task["path"]] + base_path
+
+    log_file = _case_file(report_dir, task, "log", ".log")
+    junit_file = _case_file(report_dir, task, "junit", ".xml")
+    sys.stdout.flush()
+    sys.stderr.flush()
+    stdout_fd, stderr_fd = os.dup(1), os.dup(2)
+    start = time.time()
+    with open(log_file, "w") as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            pytest_args = [task["case"], "--junitxml={}".format(junit_file), "-p", "no:cacheprovider"]
+            if importlib.util.find_spec("allure_pytest") is not None:
+                pytest_args.append("--alluredir={}".format(os.path.join(report_dir, task["dirname"])))
+            code = pytest.main(pytest_args)
+        except BaseException:
+            traceback.print_exc()
+            code = -2
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(stdout_fd, 1)
+            os.dup2(stderr_fd, 2)
+            os.close(stdout_fd)
+            os.close(stderr_fd)
+    return {"key": task["key"], "code": int(code), "cost": time.time() - start}
+
+
+class _PaddleState(object):
+    """
+    worker导入paddle后的全局状态快照, 每个case文件执行前恢复, 避免上一个case的
+    set_default_dtype / enable_static / seed / set_device / set_flags 影响后续case
+    """
+
+    def __init__(self):
+        self.environ = dict(os.environ)
+        self.np_state = np.random.get_state()
+        self.py_state = random.getstate()
+        self.paddle = None
+        self.error = None
+        try:
+            import paddle
+        except ImportError:
+            return
+        try:
+            self.dtype = paddle.get_default_dtype()
+            self.dynamic = paddle.in_dynamic_mode()
+            self.device = paddle.get_device()
+            self.rng_state = paddle.get_rng_state()
+            self.flags = self._flags(paddle)
+            # 静态图program/scope切换接口所在模块, 2.6起由fluid改名为base
+            self.base = getattr(paddle, "base", None) or paddle.fluid
+        except Exception as e:
+            self.error = e
+        self.paddle = paddle
+
+    @staticmethod
+    def _flags(paddle):
+        """
+        环境变量中paddle可识别的FLAGS_, 其他库的同名前缀变量或当前版本不存在的flag跳过
+        """
+        flags = {}
+        for key in os.environ:
+            if not key.startswith("FLAGS_"):
+                continue
+            try:
+                flags.update(paddle.get_flags([key]))
+            except Exception:
+                continue
+        return flags
+
+    def restore(self):
+        """
+        恢复快照, 失败时抛出异常, 由调用方回收worker
+        """
+        os.environ.clear()
+        os.environ.update(self.environ)
+        np.random.set_state(self.np_state)
+        random.setstate(self.py_state)
+        paddle = self.paddle
+        if paddle is None:
+            return
+        if self.error is not None:
+            raise self.error
+        # 丢弃静态图case残留的program与scope
+        paddle.enable_static()
+        self.base.framework.switch_main_program(paddle.static.Program())
+        self.base.framework.switch_startup_program(paddle.static.Program())
+        self.base.executor._switch_scope(self.base.core.Scope())
+        paddle.utils.unique_name.switch()
+        if self.dynamic:
+            paddle.disable_static()
+        paddle.set_device(self.device)
+        paddle.set_default_dtype(self.dtype)
+        paddle.set_rng_state(self.rng_state)
+        paddle.set_flags(self.flags)
+
+
+def _worker(conn, report_dir):
+    """
+    worker进程: 只导入一次paddle, 循环接收case并在进程内通过pytest.main执行,
+    每个case前恢复paddle全局状态, 无法恢复时执行完当前case后退出, 由父进程重新创建
+    """
+    state = _PaddleState()
+    base_path = list(sys.path)
+    base_modules = set(sys.modules)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        try:
+            state.restore()
+            recycle = False
+        except Exception:
+            traceback.print_exc()
+            recycle = True
+        res = _run_module(task, report_dir, base_path, base_modules)
+        res["recycle"] = recycle
+        conn.send(res)
+        if recycle:
+            break
+
 
 class Erwin(object):
     """
-    多线程执行器
+    多进程执行器
     """
 
-    def __init__(self, case_dict, thread_num=2):
-        self.case_queue = queue.Queue()
-        self.thread_pool = self.create_pool(thread_num)
+    def __init__(self, case_dict, worker_num=2, timeout=None, history_file=None):
+        """
+        :param case_dict: {case目录: [模块目录]}
+        :param worker_num: worker进程数
+        :param timeout: 单个case文件超时时间(秒), None为不限制
+        :param history_file: case耗时记录文件, 按历史耗时降序执行
+        """
+        self.worker_num = worker_num
+        self.timeout = timeout
         self.report_dir = os.sep.join([self.get_cur_dir(), "report"])
+        self.history_file = history_file or os.sep.join([self.get_cur_dir(), "pts_history.json"])
+        self.history = self.load_history()
         self.case_dict = case_dict
         self.ignore_list = self.get_ignore_list()
+        self.cases = []
         self.case_list()
+        # 父进程不导入paddle, worker各自导入, 避免fork已初始化CUDA的进程
+        self.ctx = multiprocessing.get_context("spawn" if platform.system() == "Windows" else "fork")
 
     def get_ignore_list(self):
         """
@@ -41,68 +217,199 @@ class Erwin(object):
         dirname, filename = os.path.split(os.path.abspath(sys.argv[0]))
         return dirname
 
+    def load_history(self):
+        """
+        读取case历史耗时
+        """
+        if not os.path.exists(self.history_file):
+            return {}
+        try:
+            with open(self.history_file, "r") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
     def case_list(self):
         """
-        获取case执行列表
+        获取case执行列表, 按历史耗时降序, 无记录的case优先执行
         """
         for case_dir, modules_list in self.case_dict.items():
             for module in modules_list:
-                path = os.sep.join([case_dir, module])
-                for case in os.listdir(path):
+                path = os.path.abspath(os.sep.join([case_dir, module]))
+                for case in sorted(os.listdir(path)):
                     if case.startswith("test") and case.endswith("py") and case not in self.ignore_list:
-                        case_info = dict({"path": path, "case": case, "case_dir": case_dir})
-                        self.case_queue.put(case_info)
+                        dirname = "api" if case_dir == "api" else path.split(os.sep)[-1]
+                        key = os.sep.join([case_dir, module, case])
+                        case_info = dict({"path": path, "case": case, "case_dir": case_dir, "dirname": dirname})
+                        case_info["key"] = key
+                        self.cases.append(case_info)
+        self.cases.sort(key=lambda c: self.history.get(c["key"], float("inf")), reverse=True)
+
+    def create_worker(self):
+        """
+        创建worker进程
+        """
+        parent_conn, child_conn = self.ctx.Pipe()
+        p = self.ctx.Process(target=_worker, args=(child_conn, self.report_dir))
+        p.daemon = True
+        p.start()
+        child_conn.close()
+        return {"process": p, "conn": parent_conn, "task": None, "deadline": None}
+
+    def stop_worker(self, worker, kill=False):
+        """
+        结束worker进程
+        """
+        if kill:
+            worker["process"].kill()
+        else:
+            try:
+                worker["conn"].send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        worker["process"].join()
+        worker["conn"].close()
 
     def run(self):
         """
         执行函数
+        :return: 失败case {key: 退出码}, -1为超时, 其他负数为crash信号
         """
-        for p in self.thread_pool:
-            p.start()
-        self.case_queue.join()
+        os.makedirs(os.path.join(self.report_dir, "junit"), exist_ok=True)
+        os.makedirs(os.path.join(self.report_dir, "log"), exist_ok=True)
+        pending = list(self.cases)
+        pending.reverse()
+        workers = [self.create_worker() for _ in range(min(self.worker_num, len(pending)))]
+        failed = {}
+
+        def assign(worker):
+            """分配下一个case"""
+            if not pending:
+                return False
+            worker["task"] = pending.pop()
+            worker["deadline"] = time.time() + self.timeout if self.timeout else None
+            worker["start"] = time.time()
+            worker["conn"].send(worker["task"])
+            return True
+
+        for w in workers:
+            assign(w)
+        while any(w["task"] is not None for w in workers):
+            busy = [w for w in workers if w["task"] is not None]
+            deadlines = [w["deadline"] for w in busy if w["deadline"] is not None]
+            wait_time = max(0, min(deadlines) - time.time()) if deadlines else None
+            ready = wait([w["conn"] for w in busy] + [w["process"].sentinel for w in busy], timeout=wait_time)
+
+            for i, w in enumerate(workers):
+                if w["task"] is None:
+                    continue
+                task = w["task"]
+                if w["conn"] in ready:
+                    try:
+                        res = w["conn"].recv()
+                    except EOFError:
+                        res = None
+                    if res is not None:
+                        self.report(task, res["code"], res["cost"], failed)
+                        w["task"] = None
+                        if res["recycle"]:
+                            # worker状态无法恢复, 已自行退出
+                            self.stop_worker(w)
+                            workers[i] = self.create_worker()
+                        assign(workers[i])
+                        continue
+                if w["process"].sentinel in ready or w["conn"] in ready:
+                    # worker crash
+                    w["process"].join()
+                    code = w["process"].exitcode if w["process"].exitcode else -9
+                elif w["deadline"] is not None and time.time() >= w["deadline"]:
+                    self.stop_worker(w, kill=True)
+                    code = -1
+                else:
+                    continue
+                self.report(task, code, time.time() - w["start"], failed, crashed=True)
+                workers[i] = self.create_worker()
+                assign(workers[i])
 
-    def runner(self):
+        for w in workers:
+            self.stop_worker(w)
+        self.save_history()
+        self.merge_junit()
+        return failed
+
+    def report(self, task, code, cost, failed, crashed=False):
         """
-        线程执行器
+        记录单个case结果
         """
-        while True:
-            case_info = self.case_queue.get()
-            self.run_test(case_info)
-            self.case_queue.task_done()
+        if code != -1:
+            self.history[task["key"]] = cost
+        else:
+            self.history[task["key"]] = max(cost, self.history.get(task["key"], 0))
+        status = "ok" if code == 0 else ("timeout" if code == -1 else ("crash" if crashed else "failed"))
+        print("case: {} {} ({:.2f}s)".format(task["key"], status, cost))
+        if code == 0:
+            return
+        failed[task["key"]] = code
+        log_file = _case_file(self.report_dir, task, "log", ".log")
+        if os.path.exists(log_file):
+            with open(log_file, "r", errors="ignore") as f:
+                print(f.read())
+        if crashed:
+            self.save_crash(task, status, code, cost)
 
-    def run_test(self, case_info):
+    def save_crash(self, task, status, code, cost):
         """
-        单个case执行
+        超时/crash的case无pytest报告, 补充allure与junit结果
         """
-        path = case_info["path"]
-        case = case_info["case"]
-        print("case: {}".format(case))
-        # TODO 执行case
-        if case_info["case_dir"] == "api":
-            dirname = "api"
-        else:
-            dirname = path.split(os.sep)[-1]
-        if platform.system() == "Windows":
-            os.system(
-                "cd {} && python.exe -m pytest {} --alluredir={}".format(path, case, self.report_dir + os.sep + dirname)
-            )
-        else:
-            os.system(
-                "cd {} && {} -m pytest {} --alluredir={}".format(
-                    path, args.interpreter, case, self.report_dir + os.sep + dirname
-                )
-            )
+        message = "{} {}, exit code: {}".format(task["key"], status, code)
+        stop = int(time.time() * 1000)
+        allure_res = {
+            "uuid": str(uuid.uuid4()),
+            "name": task["case"][:-3],
+            "fullName": task["key"],
+            "status": "broken",
+            "statusDetails": {"message": message},
+            "start": stop - int(cost * 1000),
+            "stop": stop,
+            "labels": [{"name": "suite", "value": task["dirname"]}],
+        }
+        allure_dir = os.path.join(self.report_dir, task["dirname"])
+        os.makedirs(allure_dir, exist_ok=True)
+        with open(os.path.join(allure_dir, "{}-result.json".format(allure_res["uuid"])), "w") as f:
+            json.dump(allure_res, f)
 
-    def create_pool(self, thread_num):
+        suite = ET.Element("testsuite", name=task["key"], tests="1", errors="1", failures="0", time=str(cost))
+        testcase = ET.SubElement(suite, "testcase", classname=task["key"], name=task["case"][:-3], time=str(cost))
+        ET.SubElement(testcase, "error", message=message)
+        ET.ElementTree(suite).write(
+            _case_file(self.report_dir, task, "junit", ".xml"), encoding="utf-8", xml_declaration=True
+        )
+
+    def save_history(self):
         """
-        池子
+        保存case耗时记录
         """
-        thread_pool = []
-        for i in range(thread_num):
-            thread = threading.Thread(target=self.runner)
-            thread.daemon = True
-            thread_pool.append(thread)
-        return thread_pool
+        try:
+            with open(self.history_file, "w") as f:
+                json.dump(self.history, f, indent=1)
+        except Exception as e:
+            print(e)
+
+    def merge_junit(self):
+        """
+        合并各case的junit结果为 report/junit.xml
+        """
+        merged = ET.Element("testsuites")
+        for junit_file in sorted(glob.glob(os.path.join(self.report_dir, "junit", "*.xml"))):
+            try:
+                root = ET.parse(junit_file).getroot()
+            except ET.ParseError:
+                continue
+            suites = [root] if root.tag == "testsuite" else list(root)
+            merged.extend(suites)
+        for attr in ["tests", "errors", "failures", "skipped"]:
+            merged.set(attr, str(sum(int(s.get(attr, 0)) for s in merged)))
+        ET.ElementTree(merged).write(os.path.join(self.report_dir, "junit.xml"), encoding="utf-8", xml_declaration=True)
 
 
 if __name__ == "__main__":
@@ -111,8 +418,14 @@ if __name__ == "__main__":
         "--module", type=str, required=True, help="choose module -> op_function | jit | external_api_function"
     )
     parser.add_argument("--interpreter", type=str, help="python interpreter", required=True)
+    parser.add_argument("--worker_num", type=int, default=0, help="worker process num, 0 for module default")
+    parser.add_argument("--timeout", type=int, default=900, help="timeout(s) of single case file, 0 for no limit")
     args = parser.parse_args()
 
+    # worker在当前解释器中执行case, 指定其他解释器时切换后重新执行
+    if os.path.realpath(args.interpreter) != os.path.realpath(sys.executable):
+        os.execvp(args.interpreter, [args.interpreter] + sys.argv)
+
     # prepare env
     os.environ["FLAGS_call_stack_level"] = "2"
     os.environ["NVIDIA_TF32_OVERRIDE"] = "0"
@@ -123,6 +436,8 @@ if __name__ == "__main__":
     # os.system("mkdir allure && tar -xf allure-2.17.3.tgz -C allure --strip-components 1")
 
     start = time.time()
+    timeout = args.timeout if args.timeout > 0 else None
+    failed = {}
     if args.module == "op_function":
         case_dict = {
             "api": [
@@ -138,15 +453,20 @@ if __name__ == "__main__":
                 "utils",
             ]
         }
-        worker = Erwin(case_dict, thread_num=6)
-        worker.run()
+        worker = Erwin(case_dict, worker_num=args.worker_num or 6, timeout=timeout)
+        failed = worker.run()
     elif args.module == "jit":
         case_dict = {"e2e": ["jit"]}
-        worker = Erwin(case_dict, thread_num=4)
-        worker.run()
+        worker = Erwin(case_dict, worker_num=args.worker_num or 4, timeout=timeout)
+        failed = worker.run()
     elif args.module == "external_api_function":
         case_dict = {"e2e": ["custom_op"]}
-        worker = Erwin(case_dict, thread_num=1)
-        worker.run()
+        worker = Erwin(case_dict, worker_num=args.worker_num or 1, timeout=timeout)
+        failed = worker.run()
     end = time.time()
     print("running time: {} s".format(end - start))
+    if failed:
+        print("failed cases: ")
+        for key, code in failed.items():
+            print("{}: {}".format(key, code))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,263 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+数值梯度引擎, 供各目录下 apibase.py 中的 APIBase.compute_grad 共用
+各 apibase 将本目录(framework/utils)加入 sys.path 后以 from numeric_grad import NumericGradMixin 导入
+"""
+
+from inspect import isfunction
+import logging
+import numpy as np
+import paddle
+from paddle import to_tensor
+
+
+def _batch_ok(single, batch, base_loss, gap):
+    """
+    批量计算结果校验: 单样本与批量计算得到的差分梯度误差需小于 1e-4(绝对/相对)
+    """
+    g_single = (single - base_loss) / gap
+    g_batch = (batch - base_loss) / gap
+    return abs(g_single - g_batch) <= 1e-4 + 1e-4 * abs(g_single)
+
+
+def numeric_grad(
+    loss_func, x, gap=0.001, method="forward", base_loss=None, batch_loss_func=None, chunk=1 << 22, probe=16
+):
+    """
+    数值梯度
+    Args:
+        loss_func (func): 输入与x同shape的ndarray, 返回标量loss
+        x (ndarray): 求导输入, 在x自身的dtype下扰动
+        gap (float): 扰动步长
+        method (str): forward 前向差分 / central 中心差分
+        base_loss (float): 未扰动时的loss, 前向差分使用, 为None时自动计算
+        batch_loss_func (func): 可选, 输入 [m, *x.shape] 的ndarray, 返回 m 个loss;
+            API支持在最前面增加batch维时, 所有扰动输入堆叠为一个batch计算, 否则(报错或校验不通过)逐元素计算
+        chunk (int): 单个batch的最大元素数
+        probe (int): 首个batch的样本数, 其中每个样本都与逐元素计算结果校验
+    Returns:
+        grad (ndarray): 与x同shape的float64数值梯度
+    """
+    x = np.asarray(x)
+    n = x.size
+    if base_loss is None or method == "central":
+        base_loss = float(loss_func(x)) if method == "forward" else 0.0
+    base_loss = float(base_loss)
+    grad = np.zeros(n, dtype=np.float64)
+
+    m = max(1, chunk // max(n, 1))
+    if method == "central":
+        m = max(1, m // 2)
+    if batch_loss_func is not None and m > 1 and n > 1:
+        try:
+            if _numeric_grad_batch(loss_func, batch_loss_func, x, gap, method, base_loss, m, probe, grad):
+                return grad.reshape(x.shape)
+        except Exception as e:
+            logging.info("[grad] batch numeric grad not supported, fallback: {}".format(e))
+
+    # 逐元素计算, 复用同一块预分配buffer原地扰动
+    # C连续, 保证reshape(-1)为buf的视图, 非连续输入(如transpose)的原地扰动才能生效
+    buf = np.array(x, copy=True, order="C")
+    flat = buf.reshape(-1)
+    for i in range(n):
+        orig = flat[i]
+        flat[i] = orig + gap
+        loss_pos = float(loss_func(buf))
+        if method == "central":
+            flat[i] = orig - gap
+            loss_neg = float(loss_func(buf))
+            grad[i] = (loss_pos - loss_neg) / gap / 2
+        else:
+            grad[i] = (loss_pos - base_loss) / gap
+        flat[i] = orig
+    return grad.reshape(x.shape)
+
+
+def _numeric_grad_batch(loss_func, batch_loss_func, x, gap, method, base_loss, m, probe, grad):
+    """
+    批量计算数值梯度, 首个batch(probe个样本)的每个样本都与逐元素计算结果校验, 校验不通过时返回False
+    """
+    n = x.size
+    flat_x = np.ascontiguousarray(x).reshape(-1)
+    starts = [0] + list(range(min(probe, m, n), n, m))
+    for start, stop in zip(starts, starts[1:] + [n]):
+        idx = np.arange(start, stop)
+        stack = np.repeat(flat_x[None, :], len(idx), axis=0)
+        stack[np.arange(len(idx)), idx] += np.asarray(gap, dtype=x.dtype)
+        if method == "central":
+            neg = np.repeat(flat_x[None, :], len(idx), axis=0)
+            neg[np.arange(len(idx)), idx] -= np.asarray(gap, dtype=x.dtype)
+            stack = np.concatenate([stack, neg], axis=0)
+        loss = np.asarray(batch_loss_func(stack.reshape((-1,) + x.shape)), dtype=np.float64).reshape(-1)
+        if loss.size != stack.shape[0]:
+            return False
+
+        if start == 0:
+            for j in range(stack.shape[0]):
+                single = float(loss_func(stack[j].reshape(x.shape)))
+                if not _batch_ok(single, loss[j], base_loss, gap):
+                    return False
+
+        if method == "central":
+            grad[idx] = (loss[: len(idx)] - loss[len(idx) :]) / gap / 2
+        else:
+            grad[idx] = (loss - base_loss) / gap
+    return True
+
+
+def spsa_check(loss_func, x, reference, gap=0.001, directions=32, seed=33):
+    """
+    随机方向(SPSA)梯度校验, 用于超大tensor: 沿 directions 个 Rademacher 随机方向做中心差分,
+    与解析梯度在相同方向上的投影比较
+    Args:
+        loss_func (func): 输入与x同shape的ndarray, 返回标量loss
+        x (ndarray): 求导输入
+        reference (ndarray): 解析梯度
+    Returns:
+        (numeric, analytic): 各方向上的数值/解析方向导数
+    """
+    x = np.asarray(x)
+    reference = np.asarray(reference, dtype=np.float64).reshape(-1)
+    rng = np.random.RandomState(seed)
+    numeric = np.zeros(directions, dtype=np.float64)
+    analytic = np.zeros(directions, dtype=np.float64)
+    for j in range(directions):
+        direction = rng.choice([-1.0, 1.0], size=x.shape)
+        x_pos = (x + gap * direction).astype(x.dtype)
+        x_neg = (x - gap * direction).astype(x.dtype)
+        # 使用实际扰动量, 消除低精度dtype的舍入误差
+        step = (x_pos.astype(np.float64) - x_neg.astype(np.float64)).reshape(-1)
+        numeric[j] = float(loss_func(x_pos)) - float(loss_func(x_neg))
+        analytic[j] = np.dot(reference, step)
+    return numeric, analytic
+
+
+class NumericGradMixin(object):
+    """
+    APIBase 数值梯度扩展, 以下属性可在 hook 中重写:
+    grad_method: forward / central
+    grad_batch: 是否尝试将所有扰动输入堆叠为一个batch计算
+    grad_probe: 批量计算前逐个校验的样本数
+    spsa_threshold: 元素数超过该值时使用随机方向校验, None表示不使用
+    spsa_directions: 随机方向数
+    """
+
+    grad_method = "forward"
+    grad_batch = True
+    grad_probe = 16
+    spsa_threshold = None
+    spsa_directions = 32
+
+    def _grad_target(self, key, index=None):
+        """
+        读取求导输入: key为None时为self.data, 否则为self.kwargs[key](或其中第index个)
+        """
+        if key is None:
+            return self.data
+        if index is None:
+            return self.kwargs[key]
+        return self.kwargs[key][index]
+
+    def _grad_assign(self, key, value, index=None):
+        """
+        写入求导输入
+        """
+        if key is None:
+            self.data = value
+        elif index is None:
+            self.kwargs[key] = value
+        else:
+            self.kwargs[key][index] = value
+
+    def _grad_tensor(self, arr):
+        """
+        ndarray转为求导用tensor
+        """
+        t = to_tensor(arr.astype(self.dtype))
+        # enable compute gradient
+        if self.enable_backward is True:
+            t.stop_gradient = False
+        return t
+
+    def _grad_forward(self):
+        """
+        前向计算, 返回参与求loss的输出tensor
+        """
+        if isfunction(self.func):
+            res = self.func(**self.kwargs)
+        else:
+            obj = self.func(**self.kwargs)
+            res = obj(self.data)
+        if isinstance(res, (list, tuple)):
+            res = res[0]
+        return res
+
+    def _grad_batch_loss(self, m):
+        """
+        批量前向, 输出最前面一维需为batch维, 返回每个样本的loss
+        """
+        res = self._grad_forward()
+        if len(res.shape) == 0 or res.shape[0] != m:
+            raise ValueError("output shape {} has no batch dim {}".format(res.shape, m))
+        return paddle.mean(paddle.reshape(res, [m, -1]), axis=1).numpy()
+
+    def _spsa_grad(self, key, value, loss_func, index=None):
+        """
+        随机方向校验通过后返回解析梯度
+        """
+        t = self._grad_tensor(value)
+        t.stop_gradient = False
+        self._grad_assign(key, t, index)
+        reference = paddle.grad(paddle.mean(self._grad_forward()), t)[0].numpy()
+        numeric, analytic = spsa_check(loss_func, value, reference, gap=self.gap, directions=self.spsa_directions)
+        # 与 compare_grad 一致的误差下限
+        delta = self.delta if self.delta >= 1e-4 else 1e-3 * 5
+        rtol = self.rtol if self.rtol >= 1e-4 else 1e-3
+        logging.info("[grad] spsa numeric: {}, analytic: {}".format(numeric, analytic))
+        np.testing.assert_allclose(numeric, analytic, atol=delta * 2 * self.gap * np.sqrt(value.size), rtol=rtol)
+        return reference
+
+    def _engine_grad(self, key, value, loss, index=None, method=None):
+        """
+        计算单个输入的数值梯度
+        Args:
+            key (str|None): kwargs中的key, None表示self.data
+            value (ndarray): 输入值, 在其自身dtype下扰动, 转为tensor时再转换为self.dtype
+            loss (float): 未扰动时的loss
+            index (int|None): 输入为list时的下标
+            method (str|None): 差分方式, None时使用 grad_method
+        Returns:
+            grad (ndarray)
+        """
+        origin = self._grad_target(key, index)
+
+        def loss_func(arr):
+            self._grad_assign(key, self._grad_tensor(arr), index)
+            return self._numeric_grad()
+
+        def batch_loss_func(arr):
+            self._grad_assign(key, self._grad_tensor(arr), index)
+            return self._grad_batch_loss(arr.shape[0])
+
+        value = np.asarray(value)
+        try:
+            if self.spsa_threshold is not None and value.size > self.spsa_threshold:
+                try:
+                    return self._spsa_grad(key, value, loss_func, index)
+                except AssertionError:
+                    raise
+                except Exception as e:
+                    logging.info("[grad] spsa check not supported, fallback: {}".format(e))
+            return numeric_grad(
+                loss_func,
+                value,
+                gap=self.gap,
+                method=method or self.grad_method,
+                base_loss=loss,
+                batch_loss_func=batch_loss_func if self.grad_batch else None,
+                probe=self.grad_probe,
+            )
+        finally:
+            self._grad_assign(key, origin, index)
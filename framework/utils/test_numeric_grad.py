@@ -0,0 +1,42 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+"""
+test numeric_grad
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from numeric_grad import numeric_grad
+
+
+def _loss(a):
+    """
+    sum(a * a), 梯度为 2a
+    """
+    return float((a * a).sum())
+
+
+def _batch_loss(a):
+    """
+    批量 sum(a * a)
+    """
+    return (a * a).reshape(a.shape[0], -1).sum(axis=1)
+
+
+@pytest.mark.parametrize("method", ["forward", "central"])
+@pytest.mark.parametrize("batch", [False, True])
+def test_transposed_input(method, batch):
+    """
+    非连续输入(transpose, 如NHWC用例)逐元素与批量计算的梯度正确
+    """
+    np.random.seed(33)
+    x = np.random.rand(2, 3, 4).transpose(0, 2, 1)
+    assert not x.flags["C_CONTIGUOUS"]
+    grad = numeric_grad(_loss, x, gap=1e-6, method=method, batch_loss_func=_batch_loss if batch else None)
+    assert grad.shape == x.shape
+    np.testing.assert_allclose(grad, 2 * x, atol=1e-4)
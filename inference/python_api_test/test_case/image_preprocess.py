@@ -6,33 +6,133 @@ image preprocess
 import os
 import sys
 import time
+import uuid
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2
 import numpy as np
 
+# 预处理结果缓存目录, 默认为图片目录同级的 preprocess_cache, 设置为 off 时关闭缓存
+PREPROCESS_CACHE = os.environ.get("INFER_PREPROCESS_CACHE", "")
+# 解码与预处理的线程数, cv2 解码/resize 时释放GIL
+PREPROCESS_WORKERS = int(os.environ.get("INFER_PREPROCESS_WORKERS", min(8, os.cpu_count() or 1)))
+PREPROCESS_CACHE_VERSION = 1
+
+
+def _decode_preprocess(image_path, images_size, center, model_type):
+    """
+    decode and preprocess one image
+    Args:
+        image_path(str): image path
+    Returns:
+        (img, im)(tuple): preprocessed image and origin image
+    """
+    im = cv2.imread(image_path)
+    return preprocess(im, images_size, center, model_type), im
+
+
+def _cache_dir(images_path, image_names, images_size, center, model_type):
+    """
+    cache dir keyed by image dir content(name, size, mtime), images_size, center and model_type
+    Args:
+        images_path(str): images input path
+    Returns:
+        cache_dir(str): None if cache disabled
+    """
+    if PREPROCESS_CACHE.lower() in ("off", "0", "false"):
+        return None
+    # class 模型非 center 时为随机裁剪, 不缓存
+    if not center and model_type == "class":
+        return None
+    sha = hashlib.sha1()
+    for name in image_names:
+        stat = os.stat(os.path.join(images_path, name))
+        sha.update("{}:{}:{};".format(name, stat.st_size, stat.st_mtime_ns).encode())
+    key = "{}_{}_{}_{}_v{}".format(sha.hexdigest()[:16], images_size, int(center), model_type, PREPROCESS_CACHE_VERSION)
+    cache_root = PREPROCESS_CACHE or os.path.join(os.path.dirname(os.path.abspath(images_path)), "preprocess_cache")
+    return os.path.join(cache_root, key)
+
+
+def _save_npy(path, array):
+    """
+    save npy atomically, avoid reading half written file from concurrent test process
+    """
+    tmp_path = "{}.{}.tmp.npy".format(path, uuid.uuid4().hex)
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def _load_cache(cache_dir, model_type, num):
+    """
+    load preprocessed images from memory-mapped cache
+    Returns:
+        (images_list, images_origin_list)(tuple): None if cache missing
+    """
+    try:
+        images = np.load(os.path.join(cache_dir, "images.npy"), mmap_mode="r")
+        images_origin_list = None
+        if model_type == "det":
+            images_origin_list = [
+                np.load(os.path.join(cache_dir, "origin_{}.npy".format(i)), mmap_mode="r") for i in range(num)
+            ]
+    except (OSError, ValueError):
+        return None
+    if images.shape[0] != num:
+        return None
+    return list(images), images_origin_list
+
 
 def read_images_path(images_path, images_size, center=True, model_type="class"):
     """
-    read images
+    read images, decode and preprocess in thread pool, result cached as memory-mapped npy
     Args:
         images_path(str): images input path
     Returns:
         img_array(numpy): numpy array
     """
     image_names = sorted(os.listdir(images_path))
-    images_list = []
-    images_origin_list = []
-    for name in image_names:
-        image_path = os.path.join(images_path, name)
-        im = cv2.imread(image_path)
-        images_origin_list.append(im)
-        images_list.append(preprocess(im, images_size, center, model_type))
+    cache_dir = _cache_dir(images_path, image_names, images_size, center, model_type)
+    cached = _load_cache(cache_dir, model_type, len(image_names)) if cache_dir else None
+    if cached is not None:
+        images_list, images_origin_list = cached
+    else:
+        image_paths = [os.path.join(images_path, name) for name in image_names]
+        with ThreadPoolExecutor(max_workers=max(1, PREPROCESS_WORKERS)) as executor:
+            results = list(
+                executor.map(
+                    lambda path: _decode_preprocess(path, images_size, center, model_type),
+                    image_paths,
+                )
+            )
+        images_list = [img for img, _ in results]
+        images_origin_list = [im for _, im in results]
+        if cache_dir and images_list:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                if model_type == "det":
+                    for i, im in enumerate(images_origin_list):
+                        _save_npy(os.path.join(cache_dir, "origin_{}.npy".format(i)), im)
+                # images.npy 最后写入, 作为缓存完整的标志
+                _save_npy(os.path.join(cache_dir, "images.npy"), np.stack(images_list))
+            except (OSError, ValueError) as e:
+                print(f"preprocess cache {cache_dir} save failed: {e}")
     if model_type == "class":
         return images_list
     elif model_type == "det":
         return images_list, images_origin_list
 
 
+def _load_npy(npy_path):
+    """
+    load npy with mmap, object array can not be memory-mapped and falls back to normal load
+    """
+    try:
+        return np.load(npy_path, mmap_mode="r")
+    except ValueError:
+        return np.load(npy_path)
+
+
 def get_images_npy(npys_path):
     """
     read numpy result
@@ -41,28 +141,19 @@ def get_images_npy(npys_path):
     Returns:
         result_array(numpy): numpy array
     """
-    npy_names = sorted(os.listdir(npys_path))
-    npy_list = []
-    for name in npy_names:
-        npy_path = os.path.join(npys_path, name)
-        npy_list.append(np.load(npy_path))
-    return npy_list
+    return read_npy_path(npys_path)
 
 
 def read_npy_path(npys_path):
     """
-    read numpy result
+    read numpy result, arrays are memory-mapped read only
     Args:
         npys_path(str): numpy result path
     Returns:
         result_array(numpy): numpy array
     """
     npy_names = sorted(os.listdir(npys_path))
-    npy_list = []
-    for name in npy_names:
-        npy_path = os.path.join(npys_path, name)
-        npy_list.append(np.load(npy_path))
-    return npy_list
+    return [_load_npy(os.path.join(npys_path, name)) for name in npy_names]
 
 
 def resize_short(img, target_size, model_type="class"):
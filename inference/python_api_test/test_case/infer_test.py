@@ -750,6 +750,7 @@ class InferenceTest(object):
         dynamic=False,
         tuned=False,
         shape_range_file="shape_range.pbtxt",
+        duration=None,
     ):
         """
         test enable_tensorrt_engine()
@@ -764,6 +765,7 @@ class InferenceTest(object):
             precision(str): trt precision mode,[fp32,fp16,int8]
             use_static(bool): use static
             use_calib_mode(bool): use calib mode
+            duration(float): run each predictor for duration seconds instead of repeat times
         Returns:
             None
         """
@@ -801,13 +803,9 @@ class InferenceTest(object):
                 self.pd_config.delete_pass(ir_pass)
 
         predictors = paddle_infer.PredictorPool(self.pd_config, thread_num)
-        for i in range(thread_num):
-            record_thread = threading.Thread(
-                target=self.run_multi_thread_test_predictor,
-                args=(predictors.retrieve(i), input_data_dict, output_data_dict, repeat, delta),
-            )
-            record_thread.start()
-            record_thread.join()
+        self.run_concurrent_predictors(
+            predictors, thread_num, input_data_dict, output_data_dict, repeat=repeat, delta=delta, duration=duration
+        )
 
         while not self.errors.empty():
             print("errors queue not empty!!!")
@@ -830,6 +828,7 @@ class InferenceTest(object):
         precision="trt_fp32",
         use_static=False,
         use_calib_mode=False,
+        duration=None,
     ):
         """
         test enable_tensorrt_engine()
@@ -847,6 +846,7 @@ class InferenceTest(object):
             precision(str): trt precision mode,[fp32,fp16,int8]
             use_static(bool): use static
             use_calib_mode(bool): use calib mode
+            duration(float): run each predictor for duration seconds instead of repeat times
         Returns:
             None
         """
@@ -870,17 +870,182 @@ class InferenceTest(object):
             {names[i]: opt_input_shape[i] for i in range(len(names))},
         )
         predictors = paddle_infer.PredictorPool(self.pd_config, thread_num)
-        for i in range(thread_num):
-            record_thread = threading.Thread(
-                target=self.run_multi_thread_test_predictor,
-                args=(predictors.retrieve(i), input_data_dict, output_data_dict, repeat, delta),
+        self.run_concurrent_predictors(
+            predictors, thread_num, input_data_dict, output_data_dict, repeat=repeat, delta=delta, duration=duration
+        )
+
+        while not self.errors.empty():
+            print("errors queue not empty!!!")
+            raise self.errors.get()
+
+    def cpu_multi_thread_test(
+        self,
+        input_data_dict: dict,
+        output_data_dict: dict,
+        repeat=1,
+        delta=1e-5,
+        thread_num=2,
+        thread_num_list=None,
+        duration=None,
+        use_mkldnn=True,
+        cpu_num_threads=1,
+        mkldnn_cache_capacity=1,
+        precision="fp32",
+    ):
+        """
+        test PredictorPool on cpu
+        Multithreading CPU/MKLDNN predictor, no gpu needed
+        Args:
+            input_data_dict(dict): input data constructed as dictionary
+            output_data_dict(dict): output data constructed as dictionary
+            repeat(int): inference repeat time of each predictor
+            delta(float): difference threshold between inference outputs and thruth value
+            thread_num(int): number of threads
+            thread_num_list(list): sweep thread numbers, use the first n predictors of one pool for each n
+            duration(float): run each predictor for duration seconds instead of repeat times
+            use_mkldnn(bool): enable mkldnn
+            cpu_num_threads(int): math library threads of each predictor
+            mkldnn_cache_capacity(int): MKLDNN cache capacity
+            precision(str): mkldnn precision mode, [fp32, int8]
+        Returns:
+            stats_list(list): throughput and latency of each thread number
+        """
+        thread_num_list = thread_num_list or [thread_num]
+        self.pd_config.disable_gpu()
+        self.pd_config.set_cpu_math_library_num_threads(cpu_num_threads)
+        if use_mkldnn:
+            self.pd_config.enable_mkldnn()
+            if precision == "int8":
+                self.pd_config.enable_mkldnn_int8()
+            self.pd_config.set_mkldnn_cache_capacity(mkldnn_cache_capacity)
+        else:
+            self.pd_config.disable_mkldnn()
+
+        predictors = paddle_infer.PredictorPool(self.pd_config, max(thread_num_list))
+        stats_list = []
+        for num in thread_num_list:
+            stats_list.append(
+                self.run_concurrent_predictors(
+                    predictors, num, input_data_dict, output_data_dict, repeat=repeat, delta=delta, duration=duration
+                )
             )
-            record_thread.start()
-            record_thread.join()
 
         while not self.errors.empty():
             print("errors queue not empty!!!")
             raise self.errors.get()
+        return stats_list
+
+    def run_concurrent_predictors(
+        self, predictors, thread_num, input_data_dict: dict, output_data_dict: dict, repeat=1, delta=1e-5, duration=None
+    ):
+        """
+        run predictors of PredictorPool concurrently
+        all threads start behind a barrier after one warm up run, errors are put into self.errors
+        Args:
+            predictors: paddle inference PredictorPool
+            thread_num(int): number of threads, use the first thread_num predictors
+            input_data_dict(dict): input data constructed as dictionary
+            output_data_dict(dict): output data constructed as dictionary
+            repeat(int): inference repeat time of each predictor
+            delta(float): difference threshold between inference outputs and thruth value
+            duration(float): run each predictor for duration seconds instead of repeat times
+        Returns:
+            stats(dict): thread_num, iterations, qps, p50/p99 latency(ms)
+        """
+        barrier = threading.Barrier(thread_num + 1)
+        latency_lists = [[] for _ in range(thread_num)]
+        threads = []
+        for i in range(thread_num):
+            thread = threading.Thread(
+                target=self._concurrent_predictor_worker,
+                args=(
+                    predictors.retrieve(i),
+                    barrier,
+                    input_data_dict,
+                    output_data_dict,
+                    repeat,
+                    delta,
+                    duration,
+                    latency_lists[i],
+                ),
+            )
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        wall_time = time.perf_counter() - start
+
+        latency = np.array([t for latency_list in latency_lists for t in latency_list]) * 1000
+        stats = {
+            "thread_num": thread_num,
+            "iterations": int(latency.size),
+            "qps": latency.size / wall_time if wall_time > 0 else 0.0,
+            "p50_ms": float(np.percentile(latency, 50)) if latency.size else np.nan,
+            "p99_ms": float(np.percentile(latency, 99)) if latency.size else np.nan,
+        }
+        print(
+            "[Benchmark] thread_num={}, iterations={}, qps={}, latency(ms): p50={}, p99={}".format(
+                stats["thread_num"],
+                stats["iterations"],
+                round(stats["qps"], 2),
+                round(stats["p50_ms"], 2),
+                round(stats["p99_ms"], 2),
+            )
+        )
+        return stats
+
+    def _concurrent_predictor_worker(
+        self, predictor, barrier, input_data_dict, output_data_dict, repeat, delta, duration, latency_list
+    ):
+        """
+        worker of run_concurrent_predictors
+        Args:
+            predictor: paddle inference predictor
+            barrier(threading.Barrier): start barrier
+            latency_list(list): latency(s) of each run
+        Returns:
+            None
+        """
+        try:
+            input_names = predictor.get_input_names()
+            for _, input_data_name in enumerate(input_names):
+                input_handle = predictor.get_input_handle(input_data_name)
+                input_handle.copy_from_cpu(input_data_dict[input_data_name])
+            # warm up
+            predictor.run()
+        except Exception as e:
+            self.errors.put(e)
+            barrier.abort()
+            return
+
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            return
+
+        try:
+            deadline = time.perf_counter() + duration if duration else None
+            i = 0
+            while (deadline is None and i < repeat) or (deadline is not None and time.perf_counter() < deadline):
+                start = time.perf_counter()
+                predictor.run()
+                latency_list.append(time.perf_counter() - start)
+                i += 1
+
+            output_names = predictor.get_output_names()
+            for _, output_data_name in enumerate(output_names):
+                output_handle = predictor.get_output_handle(output_data_name)
+                output_data = output_handle.copy_to_cpu()
+                sig_fig_compare(output_data, output_data_dict[output_data_name], delta)
+        except Exception as e:
+            self.errors.put(e)
 
     def run_multi_thread_test_predictor(
         self, predictor, input_data_dict: dict, output_data_dict: dict, repeat=1, delta=1e-5
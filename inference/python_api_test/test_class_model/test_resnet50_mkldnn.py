@@ -78,3 +78,36 @@ def test_mkldnn():
     test_suite2.mkldnn_test(input_data_dict, output_data_dict)
 
     del test_suite2  # destroy class to save memory
+
+
+@pytest.mark.server
+@pytest.mark.mkldnn_multi_thread
+def test_mkldnn_multi_thread():
+    """
+    compared mkldnn batch_size=1 resnet50 concurrent multi_thread outputs with true val
+    """
+    check_model_exist()
+
+    file_path = "./resnet50"
+    images_size = 224
+    batch_size = 1
+    test_suite = InferenceTest()
+    test_suite.load_config(
+        model_file="./resnet50/inference.pdmodel",
+        params_file="./resnet50/inference.pdiparams",
+    )
+    images_list, npy_list = test_suite.get_images_npy(file_path, images_size)
+    fake_input = np.array(images_list[0:batch_size]).astype("float32")
+    input_data_dict = {"x": fake_input}
+    output_data_dict = test_suite.get_truth_val(input_data_dict, device="cpu")
+
+    del test_suite  # destroy class to save memory
+
+    test_suite2 = InferenceTest()
+    test_suite2.load_config(
+        model_file="./resnet50/inference.pdmodel",
+        params_file="./resnet50/inference.pdiparams",
+    )
+    test_suite2.cpu_multi_thread_test(input_data_dict, output_data_dict, repeat=10, thread_num_list=[1, 2, 4])
+
+    del test_suite2  # destroy class to save memory
@@ -1,11 +1,11 @@
 # Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
-# 
+#
 # Licensed under the Apache License, Version 2.0 (the "License");
 # you may not use this file except in compliance with the License.
 # You may obtain a copy of the License at
-# 
+#
 #     http://www.apache.org/licenses/LICENSE-2.0
-# 
+#
 # Unless required by applicable law or agreed to in writing, software
 # distributed under the License is distributed on an "AS IS" BASIS,
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
@@ -13,6 +13,8 @@
 # limitations under the License.
 
 from inspect import isfunction
+import os
+import sys
 import copy
 import logging
 import pytest
@@ -20,8 +22,11 @@ import numpy as np
 import paddle
 from paddle import to_tensor
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../../../framework/utils"))
+from numeric_grad import NumericGradMixin
 
-class APIBase(object):
+
+class APIBase(NumericGradMixin):
     """
     API test base object
     """
@@ -68,21 +73,16 @@ class APIBase(object):
         if len(self.types) == 0:
             raise TypeError("You must define types in hook function.")
         # 设置执行device
-        if len(self.places) == 0 and paddle.device.is_compiled_with_cuda(
-        ) is True:
+        if len(self.places) == 0 and paddle.device.is_compiled_with_cuda() is True:
             self.places = [paddle.CPUPlace(), paddle.CUDAPlace(0)]
         else:
             # default
             self.places = [paddle.CPUPlace()]
         # 日志等级
         if self.debug:
-            logging.basicConfig(
-                level=logging.DEBUG,
-                format="%(asctime)s - %(levelname)s - %(message)s")
+            logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
         else:
-            logging.basicConfig(
-                level=logging.ERROR,
-                format="%(asctime)s - %(levelname)s - %(message)s")
+            logging.basicConfig(level=logging.ERROR, format="%(asctime)s - %(levelname)s - %(message)s")
 
     def hook(self):
         """
@@ -141,9 +141,7 @@ class APIBase(object):
         if self.debug:
             for place in self.places:
                 self.place = place
-                logging.info(
-                    "[Place] is ===============================>>>>>>>>" + str(
-                        self.place))
+                logging.info("[Place] is ===============================>>>>>>>>" + str(self.place))
                 # start run paddle dygraph
                 if self.dygraph:
                     paddle.disable_static(self.place)
@@ -151,40 +149,33 @@ class APIBase(object):
                         paddle.set_device("cpu")
                     else:
                         paddle.set_device("gpu:0")
-                    logging.info("[start] run " + self.__class__.__name__ +
-                                 " dygraph")
+                    logging.info("[start] run " + self.__class__.__name__ + " dygraph")
                     paddle.seed(self.seed)
                     self._check_params(res, data, **kwargs)
                     dygraph_forward_res = self._dygraph_forward()
                     logging.info("dygraph forward result is :")
                     if isinstance(dygraph_forward_res, (list, tuple)):
-                        compare(dygraph_forward_res, res, self.delta,
-                                self.rtol)
+                        compare(dygraph_forward_res, res, self.delta, self.rtol)
                         logging.info(dygraph_forward_res)
                     else:
-                        compare(dygraph_forward_res.numpy(), res, self.delta,
-                                self.rtol)
+                        compare(dygraph_forward_res.numpy(), res, self.delta, self.rtol)
                         logging.info(dygraph_forward_res.numpy())
                     if self.enable_backward:
-                        dygraph_backward_res = self._dygraph_backward(
-                            dygraph_forward_res)
+                        dygraph_backward_res = self._dygraph_backward(dygraph_forward_res)
                         logging.info("[dygraph grad]")
                         logging.info(dygraph_backward_res)
                     paddle.enable_static()
                 if self.static:
                     # start run paddle static
-                    logging.info("[start] run " + self.__class__.__name__ +
-                                 " static")
+                    logging.info("[start] run " + self.__class__.__name__ + " static")
                     if self.enable_backward:
-                        static_forward_res, static_backward_res = self._static_forward(
-                            res, data, **kwargs)
+                        static_forward_res, static_backward_res = self._static_forward(res, data, **kwargs)
                         logging.info("static forward result is :")
                         logging.info(static_forward_res)
                         logging.info("[static grad]")
                         logging.info(static_backward_res)
                     else:
-                        static_forward_res = self._static_forward(res, data,
-                                                                  **kwargs)
+                        static_forward_res = self._static_forward(res, data, **kwargs)
                         logging.info("static forward result is :")
                         logging.info(static_forward_res)
                     compare(static_forward_res, res, self.delta, self.rtol)
@@ -195,10 +186,8 @@ class APIBase(object):
                     logging.info(grad)
                     if self.static and self.dygraph:
                         compare_grad(
-                            static_backward_res,
-                            dygraph_backward_res,
-                            mode="both",
-                            no_grad_var=self.no_grad_var)
+                            static_backward_res, dygraph_backward_res, mode="both", no_grad_var=self.no_grad_var
+                        )
                     if self.dygraph:
                         compare_grad(
                             dygraph_backward_res,
@@ -206,7 +195,8 @@ class APIBase(object):
                             mode="dygraph",
                             delta=self.delta,
                             rtol=self.rtol,
-                            no_grad_var=self.no_grad_var, )
+                            no_grad_var=self.no_grad_var,
+                        )
                     if self.static:
                         compare_grad(
                             static_backward_res,
@@ -214,13 +204,12 @@ class APIBase(object):
                             mode="static",
                             delta=self.delta,
                             rtol=self.rtol,
-                            no_grad_var=self.no_grad_var, )
+                            no_grad_var=self.no_grad_var,
+                        )
         else:
             for place in self.places:
                 self.place = place
-                logging.info(
-                    "[Place] is ===============================>>>>>>>>" + str(
-                        self.place))
+                logging.info("[Place] is ===============================>>>>>>>>" + str(self.place))
 
                 # (1) start run paddle dygraph
                 if self.dygraph:
@@ -229,8 +218,7 @@ class APIBase(object):
                         paddle.set_device("cpu")
                     else:
                         paddle.set_device("gpu:0")
-                    logging.info("[start] run " + self.__class__.__name__ +
-                                 " dygraph")
+                    logging.info("[start] run " + self.__class__.__name__ + " dygraph")
                     # paddle.disable_static(self.place)
                     paddle.seed(self.seed)
                     self._check_params(res, data, **kwargs)
@@ -239,28 +227,22 @@ class APIBase(object):
                     dygraph_forward_res = self._dygraph_forward()
                     # ② compare forward result
                     if isinstance(dygraph_forward_res, (list, tuple)):
-                        compare(dygraph_forward_res, res, self.delta,
-                                self.rtol)
+                        compare(dygraph_forward_res, res, self.delta, self.rtol)
                     else:
-                        compare(dygraph_forward_res.numpy(), res, self.delta,
-                                self.rtol)
+                        compare(dygraph_forward_res.numpy(), res, self.delta, self.rtol)
                     # ③ calculate backward result
                     if self.enable_backward:
-                        dygraph_backward_res = self._dygraph_backward(
-                            dygraph_forward_res)
+                        dygraph_backward_res = self._dygraph_backward(dygraph_forward_res)
 
                 # (2) start run paddle static
                 if self.static:
                     paddle.enable_static()
-                    logging.info("[start] run " + self.__class__.__name__ +
-                                 " static")
+                    logging.info("[start] run " + self.__class__.__name__ + " static")
                     # ① calculate forward and backward result
                     if self.enable_backward:
-                        static_forward_res, static_backward_res = self._static_forward(
-                            res, data, **kwargs)
+                        static_forward_res, static_backward_res = self._static_forward(res, data, **kwargs)
                     else:
-                        static_forward_res = self._static_forward(res, data,
-                                                                  **kwargs)
+                        static_forward_res = self._static_forward(res, data, **kwargs)
                     # ② compare forward result
                     compare(static_forward_res, res, self.delta, self.rtol)
 
@@ -271,10 +253,8 @@ class APIBase(object):
                     # ② compare  gradient
                     if self.static and self.dygraph:
                         compare_grad(
-                            static_backward_res,
-                            dygraph_backward_res,
-                            mode="both",
-                            no_grad_var=self.no_grad_var)
+                            static_backward_res, dygraph_backward_res, mode="both", no_grad_var=self.no_grad_var
+                        )
                     if self.dygraph:
                         compare_grad(
                             dygraph_backward_res,
@@ -282,7 +262,8 @@ class APIBase(object):
                             mode="dygraph",
                             delta=self.delta,
                             rtol=self.rtol,
-                            no_grad_var=self.no_grad_var, )
+                            no_grad_var=self.no_grad_var,
+                        )
                     if self.static:
                         compare_grad(
                             static_backward_res,
@@ -290,7 +271,8 @@ class APIBase(object):
                             mode="static",
                             delta=self.delta,
                             rtol=self.rtol,
-                            no_grad_var=self.no_grad_var, )
+                            no_grad_var=self.no_grad_var,
+                        )
 
     def _baserun(self, res, data=None, **kwargs):
         """
@@ -311,8 +293,7 @@ class APIBase(object):
                 else:
                     paddle.set_device("gpu:0")
                 paddle.seed(self.seed)
-                logging.info("[start] run " + self.__class__.__name__ +
-                             " dygraph")
+                logging.info("[start] run " + self.__class__.__name__ + " dygraph")
                 self._check_params(res, data, **kwargs)
                 dygraph_forward_res = self._dygraph_forward()
                 logging.info("dygraph forward result is :")
@@ -320,29 +301,24 @@ class APIBase(object):
                     compare(dygraph_forward_res, res, self.delta, self.rtol)
                     logging.info(dygraph_forward_res)
                 else:
-                    compare(dygraph_forward_res.numpy(), res, self.delta,
-                            self.rtol)
+                    compare(dygraph_forward_res.numpy(), res, self.delta, self.rtol)
                     logging.info(dygraph_forward_res.numpy())
                 if self.enable_backward:
-                    dygraph_backward_res = self._dygraph_backward(
-                        dygraph_forward_res)
+                    dygraph_backward_res = self._dygraph_backward(dygraph_forward_res)
                     logging.info("[dygraph grad]")
                     logging.info(dygraph_backward_res)
                 paddle.enable_static()
             if self.static:
                 # start run paddle static
-                logging.info("[start] run " + self.__class__.__name__ +
-                             " static")
+                logging.info("[start] run " + self.__class__.__name__ + " static")
                 if self.enable_backward:
-                    static_forward_res, static_backward_res = self._static_forward(
-                        res, data, **kwargs)
+                    static_forward_res, static_backward_res = self._static_forward(res, data, **kwargs)
                     logging.info("static forward result is :")
                     logging.info(static_forward_res)
                     logging.info("[static grad]")
                     logging.info(static_backward_res)
                 else:
-                    static_forward_res = self._static_forward(res, data,
-                                                              **kwargs)
+                    static_forward_res = self._static_forward(res, data, **kwargs)
                     logging.info("static forward result is :")
                     logging.info(static_forward_res)
                 compare(static_forward_res, res, self.delta, self.rtol)
@@ -352,11 +328,7 @@ class APIBase(object):
                 logging.info("[numeric grad]")
                 logging.info(grad)
                 if self.static and self.dygraph:
-                    compare_grad(
-                        static_backward_res,
-                        dygraph_backward_res,
-                        mode="both",
-                        no_grad_var=self.no_grad_var)
+                    compare_grad(static_backward_res, dygraph_backward_res, mode="both", no_grad_var=self.no_grad_var)
                 if self.dygraph:
                     compare_grad(
                         dygraph_backward_res,
@@ -364,7 +336,8 @@ class APIBase(object):
                         mode="dygraph",
                         delta=self.delta,
                         rtol=self.rtol,
-                        no_grad_var=self.no_grad_var, )
+                        no_grad_var=self.no_grad_var,
+                    )
                 if self.static:
                     compare_grad(
                         static_backward_res,
@@ -372,7 +345,8 @@ class APIBase(object):
                         mode="static",
                         delta=self.delta,
                         rtol=self.rtol,
-                        no_grad_var=self.no_grad_var, )
+                        no_grad_var=self.no_grad_var,
+                    )
         else:
             # (1) start run paddle dygraph
             if self.dygraph:
@@ -382,8 +356,7 @@ class APIBase(object):
                 else:
                     paddle.set_device("gpu:0")
                 paddle.seed(self.seed)
-                logging.info("[start] run " + self.__class__.__name__ +
-                             " dygraph")
+                logging.info("[start] run " + self.__class__.__name__ + " dygraph")
                 self._check_params(res, data, **kwargs)
 
                 # ① calculate forward result
@@ -392,25 +365,20 @@ class APIBase(object):
                 if isinstance(dygraph_forward_res, (list, tuple)):
                     compare(dygraph_forward_res, res, self.delta, self.rtol)
                 else:
-                    compare(dygraph_forward_res.numpy(), res, self.delta,
-                            self.rtol)
+                    compare(dygraph_forward_res.numpy(), res, self.delta, self.rtol)
                 # ③ calculate backward result
                 if self.enable_backward:
-                    dygraph_backward_res = self._dygraph_backward(
-                        dygraph_forward_res)
+                    dygraph_backward_res = self._dygraph_backward(dygraph_forward_res)
 
             # (2) start run paddle static
             if self.static:
                 paddle.enable_static()
-                logging.info("[start] run " + self.__class__.__name__ +
-                             " static")
+                logging.info("[start] run " + self.__class__.__name__ + " static")
                 # ① calculate forward and backward result
                 if self.enable_backward:
-                    static_forward_res, static_backward_res = self._static_forward(
-                        res, data, **kwargs)
+                    static_forward_res, static_backward_res = self._static_forward(res, data, **kwargs)
                 else:
-                    static_forward_res = self._static_forward(res, data,
-                                                              **kwargs)
+                    static_forward_res = self._static_forward(res, data, **kwargs)
                 # ② compare forward result
                 compare(static_forward_res, res, self.delta, self.rtol)
 
@@ -420,11 +388,7 @@ class APIBase(object):
                 grad = self.compute_grad(res, data, **kwargs)
                 # ② compare gradient
                 if self.dygraph and self.static:
-                    compare_grad(
-                        static_backward_res,
-                        dygraph_backward_res,
-                        mode="both",
-                        no_grad_var=self.no_grad_var)
+                    compare_grad(static_backward_res, dygraph_backward_res, mode="both", no_grad_var=self.no_grad_var)
                 if self.dygraph:
                     compare_grad(
                         dygraph_backward_res,
@@ -432,7 +396,8 @@ class APIBase(object):
                         mode="dygraph",
                         delta=self.delta,
                         rtol=self.rtol,
-                        no_grad_var=self.no_grad_var, )
+                        no_grad_var=self.no_grad_var,
+                    )
                 if self.static:
                     compare_grad(
                         static_backward_res,
@@ -440,7 +405,8 @@ class APIBase(object):
                         mode="static",
                         delta=self.delta,
                         rtol=self.rtol,
-                        no_grad_var=self.no_grad_var, )
+                        no_grad_var=self.no_grad_var,
+                    )
 
     def _check_dtype(self, res, data, **kwargs):
         """
@@ -457,8 +423,7 @@ class APIBase(object):
         backward_tag = self.enable_backward
         for place in self.places:
             self.place = place
-            logging.info("[Place] is ===============================>>>>>>>>" +
-                         str(self.place))
+            logging.info("[Place] is ===============================>>>>>>>>" + str(self.place))
             tag = True
             for dtype in self.types:
                 # 判断是否应该做反向计算，只有float类型的需要反向，同时如果api明确没有反向，需要根据配置进行反向截断。
@@ -466,18 +431,15 @@ class APIBase(object):
                     self.enable_backward = True
                 else:
                     self.enable_backward = False
-                logging.info("[test dtype] " + self.__class__.__name__ + str(
-                    dtype))
+                logging.info("[test dtype] " + self.__class__.__name__ + str(dtype))
                 try:
                     self.dtype = dtype
                     self._baserun(res, data, **kwargs)
                 except Exception as e:
-                    logging.error("[test dtype] " + self.__class__.__name__ +
-                                  str(dtype) + " failed!!!")
+                    logging.error("[test dtype] " + self.__class__.__name__ + str(dtype) + " failed!!!")
                     tag = False
                     # assume(tag, "[Place {}] type check Error {}".format(str(self.place), str(dtype)))
-                    assert tag, "[Place {}] type check Error {}".format(
-                        str(self.place), str(dtype))
+                    assert tag, "[Place {}] type check Error {}".format(str(self.place), str(dtype))
                     if self.debug:
                         logging.error(e)
         self.dtype = None
@@ -539,43 +501,11 @@ class APIBase(object):
         if data is None:
             for k, v in self.kwargs.items():
                 if isinstance(v, paddle.Tensor):
-                    grad = []
-                    shape = v.numpy().shape
-                    for i in range(len(v.numpy().flatten())):
-                        tmp = v.numpy().flatten()
-                        tmp[i] = tmp[i] + self.gap
-                        tmp = tmp.reshape(shape)
-                        # print(tmp)
-                        self.kwargs[k] = to_tensor(tmp.astype(self.dtype))
-                        # enable compute gradient
-                        if self.enable_backward is True:
-                            self.kwargs[k].stop_gradient = False
-                        loss_delta = self._numeric_grad()
-                        g = (loss_delta - loss) / self.gap
-                        # print("-----> {}".format(g))
-                        grad.append(g[0])
-                        # recover v to self.kwargs
-                        self.kwargs[k] = v
-                    numeric_grad[k] = np.array(grad).reshape(shape)
+                    numeric_grad[k] = self._engine_grad(k, v.numpy(), loss)
         else:
             # change data to correct dtype
             data = data.astype(self.dtype)
-            grad = []
-            shape = data.shape
-            for i in range(len(data.flatten())):
-                tmp = copy.deepcopy(data.flatten())
-                tmp[i] = tmp[i] + self.gap
-                tmp = tmp.reshape(shape)
-                self.data = to_tensor(tmp.astype(self.dtype))
-                # enable compute gradient
-                if self.enable_backward is True:
-                    self.data.stop_gradient = False
-                loss_delta = self._numeric_grad()
-                g = (loss_delta - loss) / self.gap
-                grad.append(g[0])
-                # recover v to self.kwargs
-                self.data = data
-            numeric_grad["data"] = np.array(grad).reshape(shape)
+            numeric_grad["data"] = self._engine_grad(None, data, loss)
         paddle.enable_static()
         return numeric_grad
 
@@ -637,9 +567,7 @@ class APIBase(object):
             startup_program = paddle.static.Program()
             params = copy.deepcopy(kwargs)
             with paddle.utils.unique_name.guard():
-                with paddle.static.program_guard(
-                        main_program=main_program,
-                        startup_program=startup_program):
+                with paddle.static.program_guard(main_program=main_program, startup_program=startup_program):
                     # PS:没有单列出一个函数做值传递，因为self.kwargs只有一个，就没单列出来
                     xyz = []
                     for k, v in kwargs.items():
@@ -653,11 +581,9 @@ class APIBase(object):
                         if isinstance(v, (np.generic, np.ndarray)):
                             # no_grad_Var不需要转换类型
                             if self.no_grad_var is not None and k in self.no_grad_var:
-                                params[k] = paddle.static.data(
-                                    name=k, shape=v.shape, dtype=v.dtype)
+                                params[k] = paddle.static.data(name=k, shape=v.shape, dtype=v.dtype)
                             else:
-                                params[k] = paddle.static.data(
-                                    name=k, shape=v.shape, dtype=self.dtype)
+                                params[k] = paddle.static.data(name=k, shape=v.shape, dtype=self.dtype)
                             xyz.append(k)
                             # enable compute gradient
                             if self.enable_backward is True:
@@ -667,17 +593,14 @@ class APIBase(object):
                         loss = paddle.mean(output)
                         grad_var = {}
                         for k in xyz:
-                            grad_var[k] = paddle.static.gradients(loss,
-                                                                  params[k])
+                            grad_var[k] = paddle.static.gradients(loss, params[k])
                         exe = paddle.static.Executor(self.place)
                         exe.run(startup_program)
                         # print(list(grad_var.values()))
                         # print([output] + list(grad_var.values()))
                         res = exe.run(
-                            main_program,
-                            feed=kwargs,
-                            fetch_list=[output] + list(grad_var.values()),
-                            return_numpy=True)
+                            main_program, feed=kwargs, fetch_list=[output] + list(grad_var.values()), return_numpy=True
+                        )
                         # combine grad
                         grad = dict(zip(xyz, res[1:]))
                         return res[0], grad
@@ -686,10 +609,7 @@ class APIBase(object):
                         exe.run(startup_program)
                         # print(list(grad_var.values()))
                         # print([output] + list(grad_var.values()))
-                        res = exe.run(main_program,
-                                      feed=kwargs,
-                                      fetch_list=[output],
-                                      return_numpy=True)
+                        res = exe.run(main_program, feed=kwargs, fetch_list=[output], return_numpy=True)
                         return res[0]
         elif self.__layertype == "class":
             main_program = paddle.static.Program()
@@ -698,9 +618,7 @@ class APIBase(object):
             startup_program.random_seed = self.seed
             params = copy.deepcopy(kwargs)
             with paddle.utils.unique_name.guard():
-                with paddle.static.program_guard(
-                        main_program=main_program,
-                        startup_program=startup_program):
+                with paddle.static.program_guard(main_program=main_program, startup_program=startup_program):
                     # PS:没有单列出一个函数做值传递，因为self.kwargs只有一个，就没单列出来
                     for k, v in kwargs.items():
                         if isinstance(v, (np.generic, np.ndarray)):
@@ -713,18 +631,15 @@ class APIBase(object):
                         if isinstance(v, (np.generic, np.ndarray)):
                             # no_grad_Var不需要转换类型
                             if self.no_grad_var is not None and k in self.no_grad_var:
-                                params[k] = paddle.static.data(
-                                    name=k, shape=v.shape, dtype=v.dtype)
+                                params[k] = paddle.static.data(name=k, shape=v.shape, dtype=v.dtype)
                             else:
-                                params[k] = paddle.static.data(
-                                    name=k, shape=v.shape, dtype=self.dtype)
+                                params[k] = paddle.static.data(name=k, shape=v.shape, dtype=self.dtype)
                             # enable compute gradient
                             if self.enable_backward is True:
                                 params[k].stop_gradient = False
                     if data is not None:
                         data = data.astype(self.dtype)
-                        self.data = paddle.static.data(
-                            name="data", shape=data.shape, dtype=self.dtype)
+                        self.data = paddle.static.data(name="data", shape=data.shape, dtype=self.dtype)
                         if self.enable_backward is True:
                             self.data.stop_gradient = False
                     data = dict({"data": data}, **kwargs)
@@ -735,28 +650,17 @@ class APIBase(object):
                         g = paddle.static.gradients(loss, self.data)
                         exe = paddle.static.Executor(self.place)
                         exe.run(startup_program)
-                        res = exe.run(main_program,
-                                      feed=data,
-                                      fetch_list=[output, g],
-                                      return_numpy=True)
+                        res = exe.run(main_program, feed=data, fetch_list=[output, g], return_numpy=True)
                         grad = {"data": res[1]}
                         return res[0], grad
                     else:
                         exe = paddle.static.Executor(self.place)
                         exe.run(startup_program)
-                        res = exe.run(main_program,
-                                      feed=data,
-                                      fetch_list=[output],
-                                      return_numpy=True)
+                        res = exe.run(main_program, feed=data, fetch_list=[output], return_numpy=True)
                         return res[0]
 
 
-def compare_grad(result,
-                 expect,
-                 delta=1e-6,
-                 rtol=0.001,
-                 mode=None,
-                 no_grad_var=None):
+def compare_grad(result, expect, delta=1e-6, rtol=0.001, mode=None, no_grad_var=None):
     """compare grad
 
     Args:
@@ -795,8 +699,7 @@ def compare(result, expect, delta=1e-6, rtol=1e-5):
     """
     if isinstance(result, np.ndarray):
         expect = np.array(expect)
-        res = np.allclose(
-            result, expect, atol=delta, rtol=rtol, equal_nan=True)
+        res = np.allclose(result, expect, atol=delta, rtol=rtol, equal_nan=True)
         # 出错打印错误数据
         if res is False:
             logging.error("the result is {}".format(result))
@@ -0,0 +1,489 @@
+# encoding: utf-8
+"""
+数据集与预训练模型的跨case共享缓存:
+1. 按 url+校验值 缓存, 下载与解压在文件锁内完成, 多个runner并发安全
+2. tar包解压到只读的共享目录, case内通过软链使用; 会被case改写的目录(如export覆盖的_infer)复制一份可写副本
+   root用户不受只读权限限制, 每次使用前按填充时记录的清单校验, 被改写的条目丢弃后重新下载
+3. 按最近使用时间(LRU)淘汰, 总大小不超过预算
+4. 记录每条流水线用到的url, 新机器或被淘汰后首个case并行预取全部
+用法: python tools/artifact_cache.py --urls url1 url2 [--file url_list.txt] [--history pipeline_name]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import tarfile
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # windows 无 fcntl, 不使用缓存
+    fcntl = None
+
+logger = logging.getLogger("ce")
+
+# 关闭缓存: export ARTIFACT_CACHE=off
+ARTIFACT_CACHE = os.environ.get("ARTIFACT_CACHE", "on")
+ARTIFACT_CACHE_DIR = os.environ.get(
+    "ARTIFACT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "models_restruct_artifacts")
+)
+# 缓存大小预算(GB)
+ARTIFACT_CACHE_SIZE_GB = float(os.environ.get("ARTIFACT_CACHE_SIZE_GB", "200"))
+# 最近使用过的条目不淘汰, 避免删除正在运行的case软链的数据
+ARTIFACT_CACHE_KEEP_HOURS = float(os.environ.get("ARTIFACT_CACHE_KEEP_HOURS", "12"))
+ARTIFACT_CACHE_WORKERS = int(os.environ.get("ARTIFACT_CACHE_WORKERS", "4"))
+# 使用前校验方式: stat 按清单比较大小与修改时间, checksum 额外重新计算内容sha1
+ARTIFACT_CACHE_VERIFY = os.environ.get("ARTIFACT_CACHE_VERIFY", "stat")
+# 可写副本目录内的标记文件, end 阶段据此回收
+COPY_MARKER = ".artifact_copy"
+
+TAR_SUFFIX = (".tar", ".tar.gz", ".tgz")
+
+
+def cache_enabled():
+    """
+    是否使用缓存
+    """
+    return ARTIFACT_CACHE != "off" and fcntl is not None
+
+
+def clean_url(url):
+    """
+    start 中的url为多行拼接, 去除空格
+    """
+    return url.replace(" ", "")
+
+
+def _checksum(path, checksum):
+    """
+    校验文件, checksum 格式为 md5:xxx / sha256:xxx, 无前缀时按md5
+    """
+    algo, _, expect = checksum.rpartition(":")
+    h = hashlib.new(algo or "md5")
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    if h.hexdigest() != expect.lower():
+        raise ValueError("checksum mismatch {}: {} != {}".format(path, h.hexdigest(), expect))
+
+
+def _sha1(path):
+    """
+    文件内容sha1
+    """
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _within(root, path):
+    """
+    path 是否在 root 目录内
+    """
+    return os.path.commonpath([root, path]) == root
+
+
+def safe_extract(tar_path, dest):
+    """
+    解压tar包, 不允许成员写到 dest 之外(绝对路径、..、指向外部的链接)及设备文件
+    """
+    with tarfile.open(tar_path) as tf:
+        if hasattr(tarfile, "data_filter"):
+            tf.extractall(dest, filter="data")
+            return
+        root = os.path.realpath(dest)
+        for member in tf.getmembers():
+            target = os.path.realpath(os.path.join(root, member.name))
+            if not _within(root, target):
+                raise ValueError("unsafe tar member {} in {}".format(member.name, tar_path))
+            if member.issym() or member.islnk():
+                base = os.path.dirname(target) if member.issym() else root
+                if os.path.isabs(member.linkname) or not _within(
+                    root, os.path.realpath(os.path.join(base, member.linkname))
+                ):
+                    raise ValueError("unsafe tar link {} -> {} in {}".format(member.name, member.linkname, tar_path))
+            elif not (member.isfile() or member.isdir()):
+                raise ValueError("unsupported tar member {} in {}".format(member.name, tar_path))
+        tf.extractall(dest)
+
+
+def _manifest(path, checksum=True):
+    """
+    数据清单 {相对路径: [大小, 修改时间ns, sha1]}, 目录与链接的sha1为None
+    checksum: 是否计算文件内容sha1
+    """
+    res = {}
+    for root, dirs, files in os.walk(path) if os.path.isdir(path) else [(path, [], [])]:
+        for name in [""] + files:
+            p = os.path.join(root, name) if name else root
+            st = os.lstat(p)
+            digest = _sha1(p) if checksum and os.path.isfile(p) and not os.path.islink(p) else None
+            res[os.path.relpath(p, path)] = [st.st_size if not os.path.isdir(p) else 0, st.st_mtime_ns, digest]
+    return res
+
+
+def _verify(path, manifest, checksum=False):
+    """
+    按清单校验数据未被改写, 文件增删、大小或修改时间变化均视为改写
+    checksum: 额外校验文件内容
+    """
+    if manifest is None or not os.path.lexists(path):
+        return False
+    current = _manifest(path, checksum=checksum)
+    if current.keys() != manifest.keys():
+        return False
+    for name, (size, mtime_ns, digest) in manifest.items():
+        now = current[name]
+        if now[0] != size or now[1] != mtime_ns or (checksum and now[2] != digest):
+            return False
+    return True
+
+
+def _set_writable(path, writable):
+    """
+    递归设置目录读写权限
+    """
+    flag = 0o200 if writable else ~0o222
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            p = os.path.join(root, name)
+            if not os.path.islink(p):
+                mode = os.stat(p).st_mode
+                os.chmod(p, mode | flag if writable else mode & flag)
+    mode = os.stat(path).st_mode
+    os.chmod(path, mode | flag if writable else mode & flag)
+
+
+def _rmtree(path):
+    """
+    删除只读目录
+    """
+    if os.path.isdir(path) and not os.path.islink(path):
+        _set_writable(path, True)
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def _tree_size(path):
+    """
+    目录或文件大小
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            p = os.path.join(root, name)
+            if not os.path.islink(p):
+                size += os.path.getsize(p)
+    return size
+
+
+class _FileLock(object):
+    """
+    fcntl 文件锁, 跨进程互斥
+    """
+
+    def __init__(self, path, blocking=True):
+        self.path = path
+        self.blocking = blocking
+        self.fd = None
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(self.fd)
+            self.fd = None
+        return self.fd is not None
+
+    def __exit__(self, *args):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+class ArtifactCache(object):
+    """
+    共享缓存, 目录结构:
+    {root}/entries/{key}/meta.json   url、校验值、大小
+    {root}/entries/{key}/{文件名}    非tar文件
+    {root}/entries/{key}/data/       tar包解压内容(只读)
+    {root}/entries/{key}/.used       最近使用时间
+    {root}/history/{流水线}.txt      流水线用到的url
+    """
+
+    def __init__(self, root=None, budget_gb=None, history=None):
+        """
+        root: 缓存目录, 默认 ARTIFACT_CACHE_DIR
+        budget_gb: 大小预算, 默认 ARTIFACT_CACHE_SIZE_GB
+        history: 记录url的流水线名, 默认 AGILE_PIPELINE_NAME
+        """
+        self.root = root or ARTIFACT_CACHE_DIR
+        self.budget = (budget_gb if budget_gb is not None else ARTIFACT_CACHE_SIZE_GB) * (1 << 30)
+        self.history = history or os.environ.get("AGILE_PIPELINE_NAME")
+        for sub in ("entries", "locks", "tmp", "history"):
+            os.makedirs(os.path.join(self.root, sub), exist_ok=True)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url, checksum=None):
+        """
+        缓存key
+        """
+        return hashlib.sha1("{}|{}".format(clean_url(url), checksum or "").encode()).hexdigest()[:20]
+
+    def _entry(self, key):
+        return os.path.join(self.root, "entries", key)
+
+    def _target(self, entry, url):
+        """
+        条目内的数据路径
+        """
+        name = url.split("/")[-1]
+        if name.endswith(TAR_SUFFIX):
+            return os.path.join(entry, "data")
+        return os.path.join(entry, name)
+
+    def _touch(self, entry):
+        with open(os.path.join(entry, ".used"), "a"):
+            pass
+        os.utime(os.path.join(entry, ".used"))
+
+    def cached(self, url, checksum=None):
+        """
+        是否已缓存
+        """
+        return os.path.isdir(self._entry(self.key(url, checksum)))
+
+    def _record(self, url, checksum):
+        """
+        记录流水线用到的url
+        """
+        if not self.history:
+            return
+        line = "{} {}".format(url, checksum).strip() if checksum else url
+        line += "\n"
+        path = os.path.join(self.root, "history", self.history + ".txt")
+        with self._lock:
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    if line in f.readlines():
+                        return
+            with open(path, "a") as f:
+                f.write(line)
+
+    def _fill(self, url, checksum, entry):
+        """
+        下载并解压到临时目录, 完成后改名为条目目录
+        """
+        import wget
+
+        name = url.split("/")[-1]
+        staging = os.path.join(self.root, "tmp", "{}.{}.{}".format(os.path.basename(entry), os.getpid(), time.time()))
+        os.makedirs(staging)
+        try:
+            logger.info("#### artifact cache start download {}".format(url))
+            file_path = os.path.join(staging, name)
+            wget.download(url, out=file_path, bar=None)
+            logger.info("#### artifact cache end download {}".format(url))
+            if checksum:
+                _checksum(file_path, checksum)
+            if name.endswith(TAR_SUFFIX):
+                safe_extract(file_path, os.path.join(staging, "data"))
+                os.remove(file_path)
+                _set_writable(os.path.join(staging, "data"), False)
+            else:
+                os.chmod(file_path, os.stat(file_path).st_mode & ~0o222)
+            meta = {
+                "url": url,
+                "checksum": checksum,
+                "size": _tree_size(staging),
+                "manifest": _manifest(self._target(staging, url)),
+            }
+            with open(os.path.join(staging, "meta.json"), "w") as f:
+                json.dump(meta, f)
+            self._touch(staging)
+            os.rename(staging, entry)
+        except BaseException:
+            _rmtree(staging)
+            raise
+
+    def _intact(self, entry, url):
+        """
+        条目数据与填充时的清单一致
+        """
+        try:
+            with open(os.path.join(entry, "meta.json"), "r") as f:
+                manifest = json.load(f).get("manifest")
+        except (OSError, ValueError):
+            return False
+        return _verify(self._target(entry, url), manifest, checksum=ARTIFACT_CACHE_VERIFY == "checksum")
+
+    def _discard(self, key):
+        """
+        移除条目, 调用方需持有条目锁
+        """
+        trash = os.path.join(self.root, "tmp", "{}.discard.{}.{}".format(key, os.getpid(), time.time()))
+        os.rename(self._entry(key), trash)
+        _rmtree(trash)
+
+    def fetch(self, url, checksum=None):
+        """
+        获取缓存数据, 未缓存或已被改写时下载
+        return: 文件路径, tar包返回解压目录
+        """
+        url = clean_url(url)
+        key = self.key(url, checksum)
+        entry = self._entry(key)
+        if not os.path.isdir(entry) or not self._intact(entry, url):
+            with _FileLock(os.path.join(self.root, "locks", key + ".lock")):
+                if os.path.isdir(entry) and not self._intact(entry, url):
+                    logger.info("#### artifact cache {} modified, download again".format(url))
+                    self._discard(key)
+                if not os.path.isdir(entry):
+                    self._fill(url, checksum, entry)
+            self.evict(keep=(key,))
+        self._touch(entry)
+        self._record(url, checksum)
+        return self._target(entry, url)
+
+    def link(self, url, dest_dir=".", checksum=None, copy=False, name=None):
+        """
+        将缓存数据软链到 dest_dir, tar包按解压后的顶层目录/文件逐个链接
+        copy: 复制为可写副本, 用于case会改写的目录
+        name: 非tar文件的目标文件名, 默认url文件名
+        return: 链接/复制的路径list
+        """
+        src = self.fetch(url, checksum)
+        if clean_url(url).endswith(TAR_SUFFIX):
+            pairs = [(os.path.join(src, n), os.path.join(dest_dir, n)) for n in sorted(os.listdir(src))]
+        else:
+            pairs = [(src, os.path.join(dest_dir, name or os.path.basename(src)))]
+        done = []
+        for s, d in pairs:
+            if os.path.islink(d) and (copy or os.readlink(d) != s):
+                os.remove(d)  # 失效或指向其他版本的软链
+            if os.path.lexists(d):
+                logger.info("#### artifact cache keep existing {}".format(d))
+                continue
+            if not copy:
+                os.symlink(s, d)
+            elif os.path.isdir(s):
+                shutil.copytree(s, d, symlinks=True, copy_function=shutil.copyfile)
+                _set_writable(d, True)
+                with open(os.path.join(d, COPY_MARKER), "w") as f:
+                    f.write(url)
+            else:
+                shutil.copyfile(s, d)
+            done.append(d)
+        return done
+
+    def prefetch(self, items, workers=None):
+        """
+        并行预取, items 为 url 或 (url, checksum) list
+        return: 失败的url list
+        """
+        items = [(item, None) if isinstance(item, str) else tuple(item) for item in items]
+        items = [(clean_url(u), c) for u, c in items if not self.cached(u, c)]
+        failed = []
+
+        def _one(item):
+            try:
+                self.fetch(*item)
+            except Exception as e:  # 单个失败不影响其他预取
+                logger.info("#### artifact cache prefetch {} failed: {}".format(item[0], e))
+                failed.append(item[0])
+
+        if items:
+            with ThreadPoolExecutor(max_workers=workers or ARTIFACT_CACHE_WORKERS) as pool:
+                list(pool.map(_one, items))
+        return failed
+
+    def history_items(self, history=None):
+        """
+        流水线历史用到的 (url, checksum) list
+        """
+        path = os.path.join(self.root, "history", (history or self.history or "") + ".txt")
+        if not os.path.exists(path):
+            return []
+        with open(path, "r") as f:
+            return [(line.split()[0], line.split()[1] if len(line.split()) > 1 else None) for line in f if line.strip()]
+
+    def evict(self, keep=()):
+        """
+        超出预算时按最近使用时间淘汰, 保留 ARTIFACT_CACHE_KEEP_HOURS 内使用过的条目
+        keep: 不淘汰的key, 如刚下载的条目
+        """
+        with _FileLock(os.path.join(self.root, "locks", ".evict.lock"), blocking=False) as locked:
+            if not locked:  # 其他进程正在淘汰
+                return []
+            entries = []
+            total = 0
+            for key in os.listdir(os.path.join(self.root, "entries")):
+                entry = self._entry(key)
+                try:
+                    with open(os.path.join(entry, "meta.json"), "r") as f:
+                        size = json.load(f)["size"]
+                    used = os.path.getmtime(os.path.join(entry, ".used"))
+                except (OSError, ValueError, KeyError):
+                    continue
+                total += size
+                entries.append((used, size, key))
+            removed = []
+            deadline = time.time() - ARTIFACT_CACHE_KEEP_HOURS * 3600
+            for used, size, key in sorted(entries):
+                if total <= self.budget or used > deadline:
+                    break
+                if key in keep:
+                    continue
+                with _FileLock(os.path.join(self.root, "locks", key + ".lock"), blocking=False) as locked_entry:
+                    if not locked_entry:
+                        continue
+                    self._discard(key)
+                total -= size
+                removed.append(key)
+                logger.info("#### artifact cache evict {}".format(key))
+            return removed
+
+
+def remove_copies(path="."):
+    """
+    回收 path 下的可写副本, 共享缓存的软链保留
+    """
+    removed = []
+    for name in os.listdir(path):
+        p = os.path.join(path, name)
+        if not os.path.islink(p) and os.path.isfile(os.path.join(p, COPY_MARKER)):
+            shutil.rmtree(p)
+            removed.append(p)
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="models_restruct artifact cache prefetch")
+    parser.add_argument("--urls", nargs="*", default=[], help="url list")
+    parser.add_argument("--file", default=None, help="url文件, 每行 url [checksum]")
+    parser.add_argument("--history", default=None, help="预取流水线历史用到的url")
+    parser.add_argument("--workers", type=int, default=ARTIFACT_CACHE_WORKERS, help="并发数")
+    args = parser.parse_args()
+    cache = ArtifactCache()
+    todo = list(args.urls)
+    if args.file:
+        with open(args.file, "r") as f:
+            todo.extend(tuple(line.split()[:2]) for line in f if line.strip())
+    if args.history:
+        todo.extend(cache.history_items(args.history))
+    failed_urls = cache.prefetch(todo, workers=args.workers)
+    print("prefetch: {}, failed: {}".format(len(todo), failed_urls))
+    sys.exit(1 if failed_urls else 0)
@@ -16,6 +16,9 @@ import numpy as np
 # from picture.analysis import analysis, draw
 from picture.analysis import plt_dy2st
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from artifact_cache import remove_copies
+
 logger = logging.getLogger("ce")
 
 
@@ -72,6 +75,8 @@ class PaddleClas_End(object):
         os.chdir(self.reponame)
 
         for file_name in list_dir:
+            if os.path.islink(file_name):  # 共享缓存的软链, 数据由缓存按LRU回收
+                continue
             if ".tar" in file_name:
                 os.remove(file_name)
                 if os.path.exists(file_name.replace(".tar", "")):
@@ -117,6 +122,9 @@ class PaddleClas_End(object):
                     shutil.rmtree(os.path.join("dataset", "face"))
                     logger.info("#### clean data face: {}".format("dataset"))
 
+        # 共享缓存复制出的可写副本属于本case
+        for copy_dir in remove_copies("."):
+            logger.info("#### clean data artifact copy: {}".format(copy_dir))
         os.chdir(path_now)
 
         # kill遗留程序
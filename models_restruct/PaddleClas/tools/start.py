@@ -9,12 +9,14 @@ import copy
 import platform
 import shutil
 import logging
-import tarfile
 import argparse
 import yaml
 import wget
 import numpy as np
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from artifact_cache import ArtifactCache, cache_enabled, safe_extract
+
 logger = logging.getLogger("ce")
 
 
@@ -38,6 +40,13 @@ class PaddleClas_Start(object):
         self.REPO_PATH = os.path.join(os.getcwd(), self.reponame)  # 所有和yaml相关的变量与此拼接
 
         self.env_dict = {}
+        # 数据与预训练模型共享缓存, ARTIFACT_CACHE=off 时直接下载到repo内
+        self.artifact_cache = None
+        if cache_enabled():
+            try:
+                self.artifact_cache = ArtifactCache()
+            except OSError as e:
+                logger.info("#### artifact cache init failed: {}".format(e))
         self.base_yaml_dict = {
             "ImageNet": "ppcls^configs^ImageNet^ResNet^ResNet50.yaml",
             "slim": "ppcls^configs^slim^PPLCNet_x1_0_quantization.yaml",
@@ -58,13 +67,21 @@ class PaddleClas_Start(object):
             self.model_type_PULC = self.qa_yaml_name.split("^")[3]  # 固定格式为 ppcls^config^model_type^PULC_type
             self.env_dict["model_type_PULC"] = self.model_type_PULC
 
-    def download_data(self, value=None):
+    def download_data(self, value=None, writable=False):
         """
         下载推理所需要的数据
+        writable: case会改写解压目录(如export输出到_infer)时为True, 使用缓存的可写副本
         """
         # 调用函数路径已切换至PaddleClas
 
         tar_name = value.split("/")[-1]
+        if self.artifact_cache is not None:
+            try:
+                self.artifact_cache.link(value, os.getcwd(), copy=writable)
+                logger.info("#### link {} from artifact cache".format(tar_name))
+                return 0
+            except Exception as e:
+                logger.info("#### artifact cache {} failed, download directly: {}".format(tar_name, e))
         # if os.path.exists(tar_name) and os.path.exists(tar_name.replace(".tar", "")):
         # 有end回收数据, 只判断文件夹
         if os.path.exists(tar_name.replace(".tar", "")):
@@ -75,8 +92,7 @@ class PaddleClas_Start(object):
                 logger.info("#### start download {}".format(tar_name))
                 wget.download(value.replace(" ", ""))
                 logger.info("#### end download {}".format(tar_name))
-                tf = tarfile.open(tar_name)
-                tf.extractall(os.getcwd())
+                safe_extract(tar_name, os.getcwd())
             except:
                 logger.info("#### start download failed {} failed".format(value.replace(" ", "")))
         return 0
@@ -112,6 +128,25 @@ class PaddleClas_Start(object):
         os.chdir(path_now)
         return 0
 
+    def download_pretrained(self, value=None):
+        """
+        下载预训练模型参数
+        """
+        if self.artifact_cache is not None:
+            try:
+                self.artifact_cache.link(value, os.getcwd())
+                logger.info("#### link {} from artifact cache".format(self.eval_pretrained_params))
+                return 0
+            except Exception as e:
+                logger.info("#### artifact cache {} failed, download directly: {}".format(value.replace(" ", ""), e))
+        try:
+            logger.info("#### start download {}".format(self.eval_pretrained_params))
+            wget.download(value.replace(" ", ""))
+            logger.info("#### end download {}".format(self.eval_pretrained_params))
+        except:
+            logger.info("#### start download failed {} failed".format(value.replace(" ", "")))
+        return 0
+
     def get_params(self):
         """
         获取模型输出路径
@@ -197,6 +232,12 @@ class PaddleClas_Start(object):
         path_now = os.getcwd()  # 切入路径
         os.chdir(self.reponame)
 
+        if self.artifact_cache is not None:
+            # 并行预取本流水线历史用到且未缓存的数据, 后续case直接命中
+            failed = self.artifact_cache.prefetch(self.artifact_cache.history_items())
+            if failed:
+                logger.info("#### artifact cache prefetch failed: {}".format(failed))
+
         # 准备评估内容 这里使用多卡的结果产出的模型
         self.env_dict["kpi_value_eval"] = self.kpi_value_eval
         # windows mac 使用function得到的结果
@@ -293,23 +334,13 @@ class PaddleClas_Start(object):
                             dygraph/legendary_models/{}_pretrained.pdparams".format(
                             self.eval_pretrained_params
                         )
-                        try:
-                            logger.info("#### start download {}".format(self.eval_pretrained_params))
-                            wget.download(value.replace(" ", ""))
-                            logger.info("#### end download {}".format(self.eval_pretrained_params))
-                        except:
-                            logger.info("#### start download failed {} failed".format(value.replace(" ", "")))
+                        self.download_pretrained(value)
                     else:
                         value = "https://paddle-imagenet-models-name.bj.bcebos.com/\
                             dygraph/{}_pretrained.pdparams".format(
                             self.eval_pretrained_params
                         )
-                        try:
-                            logger.info("#### start download {}".format(self.eval_pretrained_params))
-                            wget.download(value.replace(" ", ""))
-                            logger.info("#### end download {}".format(self.eval_pretrained_params))
-                        except:
-                            logger.info("#### start download failed {} failed".format(value.replace(" ", "")))
+                        self.download_pretrained(value)
 
             # language_classification、textline_orientation这两个模型直接用预训练模型 eval predict阶段
             elif "predict" in step_single and (
@@ -350,14 +381,16 @@ class PaddleClas_Start(object):
                             "https://paddleclas.bj.bcebos.com/models\
                             /PULC/{}_infer.tar".format(
                                 self.predict_pretrain_params
-                            )
+                            ),
+                            writable=True,
                         )
                     else:
                         self.download_data(
                             "https://paddle-imagenet-models-name.bj.bcebos.com/\
                             dygraph/inference/{}_infer.tar".format(
                                 self.predict_pretrain_params
-                            )
+                            ),
+                            writable=True,
                         )
                 # 暂时用训好的模型 220815
                 elif self.model_type == "GeneralRecognition" or self.model_type == "GeneralRecognitionV2":
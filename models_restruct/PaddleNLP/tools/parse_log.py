@@ -8,53 +8,63 @@ import json
 import logging
 import numpy as np
 
+from .log_engine import KpiRule, LogParser, number_rule
+
 logger = logging.getLogger("ce")
 
 
+def _class_ids(line):
+    """
+    解析预测输出的 class_ids/bbox 等结构化结果
+    """
+    if "class_ids" in line and ": [" in line:
+        # 增加对nan的处理
+        line = line.replace("nan", "'nan'")
+        value = ast.literal_eval(line.replace("[{", "{").replace("}]", "}").strip())
+        if line.count("class_ids") > 1:  # 存在多个标签时
+            return value[0]["class_ids"]
+        return value["class_ids"]
+    elif "bbox" in line and ": [" in line:
+        value = ast.literal_eval(line.replace("[{", "{").replace("}]", "}").strip())
+        if line.count("bbox") > 1:
+            return value[0]["bbox"]
+        return value["bbox"]
+    elif "class id(s)" in line and ": [" in line:
+        line = line[line.rfind("class id(s): ") : line.rfind(", score(s):")]
+        return line[line.rfind("[") :]
+    elif "attributes" in line and ": [" in line:
+        line = line[line.rfind("'output': ") : line.rfind("}")]
+        return line[line.rfind("[") :]
+    return None
+
+
+def _rules(kpi_name):
+    """
+    kpi解析规则, 数值kpi只要有值就行，部分模型可能因为学习率的问题导致后几轮的loss为nan, 不在保存-1
+    """
+    if kpi_name == "class_ids":
+        return [KpiRule(kpi_name, _class_ids, keyword=": [")]
+    return [number_rule(kpi_name)]
+
+
+LOG_PARSER = LogParser("PaddleNLP", _rules, kpi_names=["loss"])
+
+
+def parse_kpis(log_content, kpi_names):
+    """
+    单遍解析多个kpi
+    return: {kpi_name: {"last", "avg", "values"}}
+    """
+    return LOG_PARSER.parse(log_content, kpi_names)
+
+
 def paddlelas_imagenet_parse(log_content, kpi_name):
     """
     从log中解析出想要的kpi
     """
     # logger.info("###log_content: {}".format(log_content))
     # logger.info("###kpi_name: {}".format(kpi_name))
-    kpi_value_all = []
-    f = open(log_content, encoding="utf-8", errors="ignore")
-    for line in f.readlines():
-        if kpi_name == "class_ids":
-            if "class_ids" in line and ": [" in line:
-                # 增加对nan的处理
-                line = line.replace("nan", "'nan'")
-                if line.count("class_ids") > 1:  # 存在多个标签时
-                    kpi_value_all.append(
-                        ast.literal_eval(line.replace("[{", "{").replace("}]", "}").strip())[0]["class_ids"]
-                    )
-                else:
-                    kpi_value_all.append(
-                        ast.literal_eval(line.replace("[{", "{").replace("}]", "}").strip())["class_ids"]
-                    )
-            elif "bbox" in line and ": [" in line:
-                if line.count("bbox") > 1:
-                    kpi_value_all.append(
-                        ast.literal_eval(line.replace("[{", "{").replace("}]", "}").strip())[0]["bbox"]
-                    )
-                else:
-                    kpi_value_all.append(ast.literal_eval(line.replace("[{", "{").replace("}]", "}").strip())["bbox"])
-            elif "class id(s)" in line and ": [" in line:
-                line = line[line.rfind("class id(s): ") : line.rfind(", score(s):")]
-                kpi_value_all.append(line[line.rfind("[") :])
-            elif "attributes" in line and ": [" in line:
-                line = line[line.rfind("'output': ") : line.rfind("}")]
-                kpi_value_all.append(line[line.rfind("[") :])
-        else:
-            if kpi_name + ":" in line:
-                regexp = r"%s:(\s*\d+(?:\.\d+)?)" % kpi_name
-                # 如果解析不到符合格式到指标，默认值设置为-1
-                r = re.findall(regexp, line)
-                # kpi_value = float(r[0].strip()) if len(r) > 0 else -1
-                # kpi_value_all.append(kpi_value)
-                if len(re.findall(regexp, line)) > 0:  # 只要有值就行，部分模型可能因为学习率的问题导致后几轮的loss为nan, 不在保存-1
-                    kpi_value_all.append(float(r[0].strip()))
-    f.close()
+    kpi_value_all = parse_kpis(log_content, [kpi_name])[kpi_name]["values"]
 
     # logger.info("###kpi_value_all: {}".format(kpi_value_all))
     # if "-1" in kpi_value_all or kpi_value_all == []: #前几轮是正常后面loss出nan的情况暂时不考虑，后续变化能直接感知
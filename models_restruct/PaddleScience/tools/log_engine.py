@@ -0,0 +1,194 @@
+"""
+日志kpi解析引擎: 一次逐行扫描解析所有已知kpi, 结果按log的mtime与规则集hash缓存在log同级
+各repo的 tools/log_engine.py 为同一文件的副本, 修改时需同步, 由 tools/codestyle/check_log_engine.py 检查
+"""
+# encoding: utf-8
+import os
+import re
+import sys
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger("ce")
+
+CACHE_VERSION = 1
+# 关闭磁盘缓存: export KPI_LOG_CACHE=off
+KPI_LOG_CACHE = os.environ.get("KPI_LOG_CACHE", "on")
+
+
+class KpiRule(object):
+    """
+    单个kpi的逐行解析规则
+    """
+
+    def __init__(self, name, extract, keyword=None):
+        """
+        name: 结果中的kpi名
+        extract: extract(line) 返回解析值, 未解析到返回None
+        keyword: 行内必须包含的子串, 用于快速过滤, None时每行都调用extract
+        """
+        self.name = name
+        self.extract = extract
+        self.keyword = keyword
+
+
+def number_rule(kpi_name, name=None, regexp=r"%s:(\s*\d+(?:\.\d+)?)", section=None):
+    """
+    "kpi_name: 数值" 格式的规则, 取行内第一个匹配值
+    section: 行内还需包含的子串, 如 [Train]
+    """
+    pattern = re.compile(regexp % re.escape(kpi_name))
+    keyword = kpi_name + ":"
+
+    def extract(line):
+        if section is not None and section not in line:
+            return None
+        r = pattern.search(line)
+        return float(r.group(1).strip()) if r else None
+
+    return KpiRule(name or kpi_name, extract, keyword)
+
+
+def summary(values):
+    """
+    kpi序列统计: 最后值、平均值(仅数值序列)与全序列
+    """
+    avg = None
+    if values and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        avg = float(sum(values)) / len(values)
+    return {"last": values[-1] if values else None, "avg": avg, "values": values}
+
+
+class LogParser(object):
+    """
+    多kpi单遍日志解析器, 各repo的 parse_log 注册自己的规则
+    """
+
+    def __init__(self, name, rule_factory, kpi_names=()):
+        """
+        name: 解析器名, 用于区分缓存
+        rule_factory: rule_factory(kpi_name) 返回该kpi的 KpiRule list
+        kpi_names: 默认一并解析的kpi
+        """
+        self.name = name
+        self.rule_factory = rule_factory
+        self.kpi_names = set(kpi_names)
+        self._memory = {}
+        self._rules_md5 = None
+
+    def _rules_digest(self):
+        """
+        规则集hash: 定义规则的模块(parse_log)与本文件的源码, 规则修改后缓存失效
+        """
+        if self._rules_md5 is None:
+            md5 = hashlib.md5(self.name.encode("utf-8"))
+            module = sys.modules.get(getattr(self.rule_factory, "__module__", None))
+            for path in [getattr(module, "__file__", None), __file__]:
+                if path and os.path.exists(path):
+                    with open(path, "rb") as f:
+                        md5.update(f.read())
+            self._rules_md5 = md5.hexdigest()
+        return self._rules_md5
+
+    def _stamp(self, log_file):
+        """
+        log文件版本
+        """
+        stat = os.stat(log_file)
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def _cache_file(self, log_file):
+        """
+        磁盘缓存路径
+        """
+        return "{}.{}.kpi.json".format(log_file, self.name)
+
+    def _load(self, log_file, stamp):
+        """
+        读取与log版本及规则集一致的缓存
+        return: {"version", "stamp", "rules", "kpi_names": 已解析的kpi, "kpis": {rule名: 统计}}
+        """
+        cache = self._memory.get(os.path.abspath(log_file))
+        if cache is None and KPI_LOG_CACHE != "off":
+            try:
+                with open(self._cache_file(log_file), "r") as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                cache = None
+        rules = self._rules_digest()
+        if (
+            cache is None
+            or cache.get("version") != CACHE_VERSION
+            or cache.get("stamp") != stamp
+            or cache.get("rules") != rules
+        ):
+            return {"version": CACHE_VERSION, "stamp": stamp, "rules": rules, "kpi_names": [], "kpis": {}}
+        return cache
+
+    def _save(self, log_file, cache):
+        """
+        写入缓存, 失败不影响解析
+        """
+        self._memory[os.path.abspath(log_file)] = cache
+        if KPI_LOG_CACHE == "off":
+            return
+        cache_file = self._cache_file(log_file)
+        tmp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+        try:
+            with open(tmp_file, "w") as f:
+                json.dump(cache, f)
+            os.replace(tmp_file, cache_file)
+        except (OSError, TypeError, ValueError) as e:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            logger.info("### kpi cache {} save failed: {}".format(cache_file, e))
+
+    def _scan(self, log_file, kpi_names):
+        """
+        逐行扫描一次, 同时解析所有kpi的规则
+        return: ({rule名: 值序列}, {kpi名: 解析异常})
+        """
+        rules = {}
+        owner = {}
+        for kpi_name in kpi_names:
+            for rule in self.rule_factory(kpi_name):
+                rules[rule.name] = rule
+                owner[rule.name] = kpi_name
+        series = {name: [] for name in rules}
+        errors = {}
+        with open(log_file, encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                for name, rule in rules.items():
+                    if owner[name] in errors or (rule.keyword is not None and rule.keyword not in line):
+                        continue
+                    try:
+                        value = rule.extract(line)
+                    except Exception as e:  # 规则异常只影响所属kpi
+                        errors[owner[name]] = e
+                        continue
+                    if value is not None:
+                        series[name].append(value)
+        return series, errors
+
+    def parse(self, log_file, kpi_names):
+        """
+        解析kpi, 未缓存的kpi与其他已知kpi一起单遍扫描
+        return: {rule名: {"last", "avg", "values"}}
+        """
+        kpi_names = set(kpi_names)
+        self.kpi_names |= kpi_names
+        cache = self._load(log_file, self._stamp(log_file))
+        missing = self.kpi_names - set(cache["kpi_names"])
+        if missing:
+            series, errors = self._scan(log_file, missing)
+            # 解析异常的非请求kpi不再随其他kpi重复扫描
+            self.kpi_names -= set(errors) - kpi_names
+            for kpi_name in kpi_names & set(errors):
+                raise errors[kpi_name]
+            for kpi_name in missing - set(errors):
+                for rule in self.rule_factory(kpi_name):
+                    cache["kpis"][rule.name] = summary(series[rule.name])
+            cache["kpi_names"] = sorted(set(cache["kpi_names"]) | (missing - set(errors)))
+            self._save(log_file, cache)
+        return {rule.name: cache["kpis"][rule.name] for kpi_name in kpi_names for rule in self.rule_factory(kpi_name)}
@@ -8,39 +8,48 @@ import json
 import logging
 import numpy as np
 import sys
+
+from .log_engine import LogParser, number_rule
+
 logger = logging.getLogger("ce")
 
 
+def _rules(kpi_name):
+    """
+    train与eval阶段的指标分别解析, 修改正则表达式以支持带有"."的KPI名称
+    """
+    regexp = r"%s:\s*([0-9.]+)"
+    return [
+        number_rule(kpi_name, name=kpi_name + "@Train", regexp=regexp, section="[Train]"),
+        number_rule(kpi_name, name=kpi_name + "@Eval", regexp=regexp, section="[Eval]"),
+    ]
+
+
+LOG_PARSER = LogParser("PaddleScience", _rules, kpi_names=["loss"])
+
+
+def parse_kpis(log_content, kpi_names):
+    """
+    单遍解析多个kpi
+    return: {kpi_name@Train/kpi_name@Eval: {"last", "avg", "values"}}
+    """
+    return LOG_PARSER.parse(log_content, kpi_names)
+
+
 def paddlelas_imagenet_parse(log_content, kpi_name):
-    # 定义一个空列表来存储提取到的KPI值
-    kpi_value_all = []
-
-    # 打开日志文件
-    with open(log_content, 'r') as f:
-        # 逐行读取日志内容
-        for line in f.readlines():
-            # 使用正则表达式匹配KPI名称和对应的数值，将提取到的数值添加到kpi_value_all中
-            if kpi_name + ":" in line and "[Train]" in line:
-                regexp = r"%s:\s*([0-9.]+)" % re.escape(kpi_name)  # 修改正则表达式以支持带有"."的KPI名称
-                r = re.findall(regexp, line)
-                if len(r) > 0:
-                    kpi_value_all.append(float(r[0].strip()))
-    
+    """
+    从log中解析出想要的kpi
+    """
+    # 提取train阶段的KPI值
+    kpis = parse_kpis(log_content, [kpi_name])
+    kpi_value_all = kpis[kpi_name + "@Train"]["values"]
+
     # 如果没有提取到任何KPI值，则提取eval阶段的指标
     if len(kpi_value_all) == 0:
-        # 打开日志文件
-        with open(log_content, 'r') as f:
-            # 逐行读取日志内容
-            for line in f.readlines():
-                # 使用正则表达式匹配KPI名称和对应的数值，将提取到的数值添加到kpi_value_all中
-                if kpi_name + ":" in line and "[Eval]" in line:
-                    regexp = r"%s:\s*([0-9.]+)" % re.escape(kpi_name)  # 修改正则表达式以支持带有"."的KPI名称
-                    r = re.findall(regexp, line)
-                    if len(r) > 0:
-                        kpi_value_all.append(float(r[0].strip()))
+        kpi_value_all = kpis[kpi_name + "@Eval"]["values"]
     if len(kpi_value_all) == 0:
         kpi_value = sys.maxsize
-    else:    
+    else:
         kpi_value = kpi_value_all[-1]
 
     # 返回最终的KPI值
@@ -8,29 +8,51 @@ import json
 import logging
 import numpy as np
 
+from .log_engine import KpiRule, LogParser
+
 logger = logging.getLogger("ce")
 
 
+def _rules(kpi_name):
+    """
+    PTQ精度行 "PTQ with mse/mse_channel_wise: ... top1/top5 = 70.1%/89.5%" 的解析规则, 解析异常记为-1
+    """
+
+    def extract(line):
+        try:
+            values = line.split("=")[-1]
+            values = values.strip()
+            values = values.split("/")
+            if kpi_name + "/" in line:
+                return values[0].strip("%")
+            elif "/" + kpi_name + " =" in line:
+                return values[1].strip("%")
+        except:
+            return -1
+        return None
+
+    return [KpiRule(kpi_name, extract, keyword="PTQ with mse/mse_channel_wise:")]
+
+
+LOG_PARSER = LogParser("PaddleSlim", _rules, kpi_names=["top1", "top5"])
+
+
+def parse_kpis(log_content, kpi_names):
+    """
+    单遍解析多个kpi
+    return: {kpi_name: {"last", "avg", "values"}}
+    """
+    return LOG_PARSER.parse(log_content, kpi_names)
+
+
 def paddleslim_quat_ptq_parse(log_content, kpi_name):
     """
     从log中解析出想要的kpi
     """
-    f = open(log_content, encoding="utf-8", errors="ignore")
-    for line in f.readlines():
-        if "PTQ with mse/mse_channel_wise:" in line:
-            try:
-                values = line.split("=")[-1]
-                values = values.strip()
-                values = values.split("/")
-                if kpi_name + "/" in line:
-                    kpi_value = values[0].strip("%")
-                elif "/" + kpi_name + " =" in line:
-                    kpi_value = values[1].strip("%")
-            except:
-                return -1
-    f.close()
-
-    return kpi_value
+    kpi_value_all = parse_kpis(log_content, [kpi_name])[kpi_name]["values"]
+    if kpi_value_all == [] or -1 in kpi_value_all:
+        return -1
+    return kpi_value_all[-1]
 
 
 if __name__ == "__main__":
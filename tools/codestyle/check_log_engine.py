@@ -0,0 +1,28 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+# encoding=utf-8 vi:ts=4:sw=4:expandtab:ft=python
+""" models_restruct 各repo的 tools/log_engine.py 副本必须一致 """
+import os
+import sys
+import glob
+import hashlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def check(root=ROOT):
+    """check"""
+    copies = {}
+    for path in sorted(glob.glob(os.path.join(root, "models_restruct", "*", "tools", "log_engine.py"))):
+        with open(path, "rb") as f:
+            copies.setdefault(hashlib.md5(f.read()).hexdigest(), []).append(os.path.relpath(path, root))
+    if len(copies) > 1:
+        print("log_engine.py copies differ, keep them identical:")
+        for md5, paths in copies.items():
+            print("  {}: {}".format(md5, ", ".join(paths)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(check())